@@ -15,20 +15,47 @@
 	svg.call(zoom.transform, initialTransform);
 
 	let currentGraphKey = null;
-	let allGraphData = null;
+	// graph id -> {title, file} from the export manifest, and graphs fetched so far
+	const graphIndex = new Map();
+	const loadedGraphs = new Map();
+
+	// Per-graph files written by tools/export_docs.py; falls back to the single graphs.json
+	function loadIndex() {
+		return fetch('data/manifest.json').then(r => {
+			if (!r.ok) throw new Error(`HTTP ${r.status}`);
+			return r.json();
+		}).then(manifest => {
+			manifest.graphs.forEach(entry => graphIndex.set(entry.id, entry));
+		}).catch(() => fetch('graphs.json').then(r => r.json()).then(data => {
+			const graphs = data.graphs || {
+				'default': data
+			};
+			Object.keys(graphs).forEach(key => {
+				graphIndex.set(key, {
+					id: key,
+					title: data.graphs ? graphs[key].title || key : 'Main Graph'
+				});
+				loadedGraphs.set(key, Promise.resolve(graphs[key]));
+			});
+		}));
+	}
+
+	function loadGraph(graphKey) {
+		if (!loadedGraphs.has(graphKey)) {
+			loadedGraphs.set(graphKey, fetch(graphIndex.get(graphKey).file).then(r => r.json()));
+		}
+		return loadedGraphs.get(graphKey);
+	}
 
-	// Load graph list and populate dropdown (static copy uses local graphs.json)
-	fetch('graphs.json').then(r => r.json()).then(data => {
-		allGraphData = data;
+	// Load graph list and populate dropdown
+	loadIndex().then(() => {
 		const graphSelect = document.getElementById('graphSelect');
-		const keys = Object.keys(data.graphs || {
-			'default': data
-		});
+		const keys = Array.from(graphIndex.keys());
 
 		keys.forEach((key, idx) => {
 			const option = document.createElement('option');
 			option.value = key;
-			option.textContent = data.graphs ? data.graphs[key].title || key : 'Main Graph';
+			option.textContent = graphIndex.get(key).title || key;
 			graphSelect.appendChild(option);
 		});
 
@@ -84,13 +111,13 @@
 			.attr('fill', '#FFA000')
 			.attr('class', 'arrow-head');
 
-		const graph = allGraphData.graphs ? allGraphData.graphs[graphKey] : allGraphData;
-
-
-
-
-
-		render(graph);
+		loadGraph(graphKey).then(graph => {
+			// Ignore a slow response for a graph that is no longer selected
+			if (graphKey !== currentGraphKey) return;
+			render(graph);
+		}).catch(err => {
+			console.error('Failed to load graph', graphKey, err);
+		});
 	}
 
 	function truncate(s, n = 40) {
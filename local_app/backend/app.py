@@ -1,11 +1,43 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 import threading
 import os
-import json
-from crawler import run_crawl, get_status, reset_state
+from crawler import run_crawl, refresh_story, get_status, reset_state, claim_crawl, crawling_root, mark_error
+from graph_store import update_graphs, read_graphs, cached_graphs
+from graph_snapshot import open_snapshot, FORMATS as GRAPH_FORMATS
+from graph_changes import changes_since
+from wire_format import node_detail
+from yt_parser import clean_description, extract_video_id
+import jobs
+import failures
+from titles import get_titles, MAX_IDS as MAX_TITLE_IDS
 
 app = Flask(__name__)
 
+MAX_NODE_IDS = 100
+
+# Parse processes per /ingest job. Every worker of serve.py may run ingest jobs at the same time,
+# so one per core (the CLI default) would oversubscribe the machine
+INGEST_PARSE_WORKERS = 2
+
+GRAPHS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'graphs.json')
+
+
+def refresh_sprites(graph_id, graph=None):
+    """Append thumbnails of newly added nodes to the graph's sprite sheets in the background"""
+    def target():
+        try:
+            from sprites import update_graph_sprites, GRAPHS_PATH
+            g = graph
+            if g is None:
+                g = read_graphs(GRAPHS_PATH).get('graphs', {}).get(graph_id)
+            if g:
+                update_graph_sprites(graph_id, g)
+        except Exception:
+            # Sprites are optional - the viewer falls back to per-node thumbnails
+            pass
+
+    threading.Thread(target=target, daemon=True).start()
+
 
 @app.route('/crawl', methods=['POST'])
 def crawl():
@@ -19,13 +51,6 @@ def crawl():
     if not url:
         return jsonify({'error': 'missing url'}), 400
 
-    def extract_video_id(video_url):
-        if 'v=' in video_url:
-            return video_url.split('v=')[-1].split('&')[0]
-        elif 'youtu.be/' in video_url:
-            return video_url.split('youtu.be/')[-1].split('?')[0]
-        return None
-    
     video_id = extract_video_id(url)
     if not video_id:
         return jsonify({'error': 'unsupported url format'}), 400
@@ -60,8 +85,12 @@ def crawl():
                 if bonus_id:
                     bonus_ids.append(bonus_id)
 
-    state = get_status()
-    if state['state'] == 'running':
+    # An ingest job saving this story would overwrite the crawl's graph, and the other way round
+    if any(video_id in params.get('stories', []) for params in jobs.unfinished('ingest')):
+        return jsonify({'error': 'this story is being ingested'}), 409
+
+    # Atomic across worker processes, so two requests can't both start a crawl
+    if not claim_crawl(video_id):
         return jsonify({'status': 'already running'}), 200
 
     reset_state()
@@ -69,20 +98,102 @@ def crawl():
     def target():
         try:
             run_crawl(video_id, part2_video_id=part2_id, stop_video_ids=stop_ids, trailer_video_id=trailer_id, bonus_video_ids=bonus_ids)
+            refresh_sprites(video_id)
         except Exception:
-            st = get_status()
-            st['state'] = 'error'
+            mark_error()
 
     threading.Thread(target=target, daemon=True).start()
 
     return jsonify({'status': 'started'})
 
 
+@app.route('/ingest', methods=['POST'])
+def ingest_stories():
+    # Bulk form of /crawl: {"stories": [{url, part2_url, stop_urls, trailer_url, bonus_urls}, ...]}
+    data = request.get_json() or {}
+    specs = data.get('stories')
+    if not specs or not isinstance(specs, list):
+        return jsonify({'error': 'missing stories'}), 400
+    
+    from ingest import ingest, parse_story
+    try:
+        stories = [parse_story(spec) for spec in specs]
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # A running /crawl saves its story as it goes; ingesting the same root would race it
+    roots = [s['root_id'] for s in stories]
+    crawling = crawling_root()
+    if crawling in roots:
+        return jsonify({'error': f'a crawl of {crawling} is running'}), 409
+
+    def on_story(root_id, count, error):
+        if not error:
+            refresh_sprites(root_id)
+
+    def job():
+        # Checked again: the job may have waited in the queue while a crawl started
+        crawling = crawling_root()
+        if crawling in roots:
+            raise RuntimeError(f'a crawl of {crawling} is running')
+        parse_workers = min(INGEST_PARSE_WORKERS, os.cpu_count() or 1)
+        return ingest(stories, on_story=on_story, parse_workers=parse_workers)
+
+    job_id = jobs.submit('ingest', {'stories': roots}, job)
+    return jsonify({'status': 'queued', 'job_id': job_id}), 202
+
+
+@app.route('/refresh', methods=['POST'])
+def refresh():
+    # Recrawl a saved story, reprocessing only videos whose title or description changed
+    data = request.get_json() or {}
+    graph_id = data.get('graph_id')
+    if not graph_id:
+        return jsonify({'error': 'missing graph_id'}), 400
+    graphs_file = GRAPHS_FILE
+    if graph_id not in read_graphs(graphs_file).get('graphs', {}):
+        return jsonify({'error': 'graph not found'}), 404
+    
+    def job():
+        summary = refresh_story(graph_id, graphs_file)
+        if summary['changed'] or summary['added']:
+            refresh_sprites(graph_id)
+        return summary
+    
+    job_id = jobs.submit('refresh', {'graph_id': graph_id}, job)
+    return jsonify({'status': 'queued', 'job_id': job_id}), 202
+
+
+@app.route('/failures', methods=['GET'])
+def list_failures():
+    # Failure ledger: ?kind=transient|throttled|private|removed, ?due=1 for entries ready to retry
+    kind = request.args.get('kind')
+    if kind and kind not in failures.KINDS:
+        return jsonify({'error': f'kind must be one of {", ".join(failures.KINDS)}'}), 400
+    entries = failures.list_failures(kind, due=request.args.get('due') == '1')
+    return jsonify({'failures': entries, 'count': len(entries)})
+
+
+@app.route('/failures/retry', methods=['POST'])
+def retry_failures():
+    # Fetch the transient/throttled videos whose backoff has expired
+    job_id = jobs.submit('retry_failures', {}, failures.retry_due)
+    return jsonify({'status': 'queued', 'job_id': job_id}), 202
+
+
 @app.route('/status', methods=['GET'])
 def status():
     return jsonify(get_status())
 
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job)
+
+
 @app.route('/video_title', methods=['GET'])
 def video_title():
     video_id = request.args.get('id')
@@ -90,16 +201,45 @@ def video_title():
         return jsonify({'error': 'missing video id'}), 400
     
     try:
-        from youtube_api import get_video
-        video_data = get_video(video_id)
-        if video_data and 'title' in video_data:
-            return jsonify({'title': video_data['title']})
+        title = get_titles([video_id])[video_id]
+        if title:
+            return jsonify({'title': title})
         else:
             return jsonify({'error': 'video not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/video_titles', methods=['GET'])
+def video_titles():
+    # Batch form of /video_title: ?ids=a,b,c -> {"titles": {"a": "...", "b": null, ...}}
+    ids = [i.strip() for i in (request.args.get('ids') or '').split(',') if i.strip()]
+    if not ids:
+        return jsonify({'error': 'missing ids'}), 400
+    if len(ids) > MAX_TITLE_IDS:
+        return jsonify({'error': f'at most {MAX_TITLE_IDS} ids per request'}), 400
+    
+    try:
+        return jsonify({'titles': get_titles(ids)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _extra_node(video_id, video, outgoing):
+    """Node for a trailer or bonus video, which is added by hand rather than crawled"""
+    description = video.get('description', '')
+    return {
+        'title': video.get('title', video_id),
+        'thumbnail': video.get('thumbnail'),
+        'url': video.get('url'),
+        'description': description,
+        # Remove choice links and prompts
+        'clean_description': clean_description(description),
+        'outgoing': outgoing,
+        'incoming_from': []
+    }
+
+
 @app.route('/add_trailer', methods=['POST'])
 def add_trailer():
     data = request.get_json() or {}
@@ -110,90 +250,52 @@ def add_trailer():
         return jsonify({'error': 'missing graph_id or trailer_url'}), 400
     
     # Load graphs file
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
-    graphs_file = os.path.join(data_dir, 'graphs.json')
+    graphs_file = GRAPHS_FILE
     
     if not os.path.exists(graphs_file):
         return jsonify({'error': 'no graphs found'}), 404
     
     try:
-        with open(graphs_file, 'r', encoding='utf-8') as f:
-            graphs = json.load(f)
+        graphs = read_graphs(graphs_file)
         
         if graph_id not in graphs.get('graphs', {}):
             return jsonify({'error': 'graph not found'}), 404
         
-        graph = graphs['graphs'][graph_id]
-        
         # Check if user entered 'none' to explicitly disable trailer
         if trailer_url.lower().strip() == 'none':
-            graph['trailer_video_id'] = 'none'
+            def apply(graphs):
+                graphs['graphs'][graph_id]['trailer_video_id'] = 'none'
             # Save updated graphs
-            with open(graphs_file, 'w', encoding='utf-8') as f:
-                json.dump(graphs, f, ensure_ascii=False, indent=2)
+            update_graphs(apply, graphs_file)
             return jsonify({'status': 'success', 'trailer_id': 'none'})
         
         # Otherwise, extract video ID and fetch trailer
-        def extract_video_id(video_url):
-            if 'v=' in video_url:
-                return video_url.split('v=')[-1].split('&')[0]
-            elif 'youtu.be/' in video_url:
-                return video_url.split('youtu.be/')[-1].split('?')[0]
-            return None
-        
         trailer_id = extract_video_id(trailer_url)
         if not trailer_id:
             return jsonify({'error': 'invalid trailer URL'}), 400
         
-        # Fetch trailer video data
-        from youtube_api import get_video
-        trailer_video = get_video(trailer_id)
-        
-        description = trailer_video.get('description', '')
-        
-        # Clean description - remove choice links and prompts
-        clean_desc = ''
-        if description:
-            lines = description.split('\n')
-            cleaned_lines = []
-            
-            for line in lines:
-                line_stripped = line.strip()
-                # Skip lines with choice markers
-                if '►' in line:
-                    continue
-                # Skip empty lines
-                if not line_stripped:
-                    continue
-                # Skip short questions (prompts)
-                if line_stripped.endswith('?') and len(line_stripped) < 20:
-                    continue
-                # Skip URLs
-                if line_stripped.startswith('http://') or line_stripped.startswith('https://'):
-                    continue
-                cleaned_lines.append(line)
-            
-            clean_desc = '\n'.join(cleaned_lines).strip()
-        
-        # Add trailer node to graph
-        graph['nodes'][trailer_id] = {
-            'title': trailer_video.get('title', trailer_id),
-            'thumbnail': trailer_video.get('thumbnail'),
-            'url': trailer_video.get('url'),
-            'description': description,
-            'clean_description': clean_desc,
-            'outgoing': [{'to': graph_id, 'label': ''}],
-            'incoming_from': []
-        }
-        
-        # Set trailer_video_id
-        graph['trailer_video_id'] = trailer_id
-        
-        # Save updated graphs
-        with open(graphs_file, 'w', encoding='utf-8') as f:
-            json.dump(graphs, f, ensure_ascii=False, indent=2)
-        
-        return jsonify({'status': 'success', 'trailer_id': trailer_id})
+        def job():
+            videos = jobs.fetch_videos([trailer_id])
+            if trailer_id not in videos:
+                raise RuntimeError(f'could not fetch trailer {trailer_id}')
+            trailer_node = _extra_node(trailer_id, videos[trailer_id], [{'to': graph_id, 'label': ''}])
+
+            def apply(graphs):
+                # Re-read under the lock: the graph may have changed while the trailer was fetched
+                graph = graphs['graphs'][graph_id]
+                # Add trailer node to graph and set trailer_video_id
+                graph['nodes'][trailer_id] = trailer_node
+                graph['trailer_video_id'] = trailer_id
+                return graph
+
+            # Save updated graphs
+            graph = update_graphs(apply, graphs_file)
+            refresh_sprites(graph_id, graph)
+            return {'trailer_id': trailer_id}
+
+        # Fetching takes seconds; answer now and let the client poll /jobs/<id>
+        job_id = jobs.submit('add_trailer', {'graph_id': graph_id, 'trailer_id': trailer_id}, job)
+        return jsonify({'status': 'queued', 'job_id': job_id, 'trailer_id': trailer_id}), 202
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -209,29 +311,18 @@ def add_bonus():
         return jsonify({'error': 'missing graph_id or bonus_urls'}), 400
     
     # Load graphs file
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
-    graphs_file = os.path.join(data_dir, 'graphs.json')
+    graphs_file = GRAPHS_FILE
     
     if not os.path.exists(graphs_file):
         return jsonify({'error': 'no graphs found'}), 404
     
     try:
-        with open(graphs_file, 'r', encoding='utf-8') as f:
-            graphs = json.load(f)
+        graphs = read_graphs(graphs_file)
         
         if graph_id not in graphs.get('graphs', {}):
             return jsonify({'error': 'graph not found'}), 404
         
-        graph = graphs['graphs'][graph_id]
-        
         # Parse bonus URLs
-        def extract_video_id(video_url):
-            if 'v=' in video_url:
-                return video_url.split('v=')[-1].split('&')[0]
-            elif 'youtu.be/' in video_url:
-                return video_url.split('youtu.be/')[-1].split('?')[0]
-            return None
-        
         bonus_ids = []
         for bonus_url in bonus_urls.split(','):
             bonus_url = bonus_url.strip()
@@ -243,60 +334,27 @@ def add_bonus():
         if not bonus_ids:
             return jsonify({'error': 'no valid bonus URLs'}), 400
         
-        # Fetch and add bonus videos
-        from youtube_api import get_video
-        for bonus_id in bonus_ids:
-            try:
-                bonus_video = get_video(bonus_id)
-                description = bonus_video.get('description', '')
-                
-                # Clean description - remove choice links and prompts
-                clean_desc = ''
-                if description:
-                    lines = description.split('\n')
-                    cleaned_lines = []
-                    
-                    for line in lines:
-                        line_stripped = line.strip()
-                        # Skip lines with choice markers
-                        if '►' in line:
-                            continue
-                        # Skip empty lines
-                        if not line_stripped:
-                            continue
-                        # Skip short questions (prompts)
-                        if line_stripped.endswith('?') and len(line_stripped) < 20:
-                            continue
-                        # Skip URLs
-                        if line_stripped.startswith('http://') or line_stripped.startswith('https://'):
-                            continue
-                        cleaned_lines.append(line)
-                    
-                    clean_desc = '\n'.join(cleaned_lines).strip()
-                
-                graph['nodes'][bonus_id] = {
-                    'title': bonus_video.get('title', bonus_id),
-                    'thumbnail': bonus_video.get('thumbnail'),
-                    'url': bonus_video.get('url'),
-                    'description': description,
-                    'clean_description': clean_desc,
-                    'outgoing': [],
-                    'incoming_from': []
-                }
-            except Exception:
-                # Skip if fetch fails
-                pass
-        
-        # Update bonus_video_ids list
-        if 'bonus_video_ids' not in graph:
-            graph['bonus_video_ids'] = []
-        graph['bonus_video_ids'].extend(bonus_ids)
-        
-        # Save updated graphs
-        with open(graphs_file, 'w', encoding='utf-8') as f:
-            json.dump(graphs, f, ensure_ascii=False, indent=2)
-        
-        return jsonify({'status': 'success', 'bonus_ids': bonus_ids})
+        def job():
+            # Fetch all bonus videos at once; ones that fail are skipped
+            videos = jobs.fetch_videos(bonus_ids)
+            bonus_nodes = {vid: _extra_node(vid, video, []) for vid, video in videos.items()}
+
+            def apply(graphs):
+                graph = graphs['graphs'][graph_id]
+                graph['nodes'].update(bonus_nodes)
+                # Update bonus_video_ids list
+                if 'bonus_video_ids' not in graph:
+                    graph['bonus_video_ids'] = []
+                graph['bonus_video_ids'].extend(bonus_ids)
+                return graph
+
+            # Save updated graphs
+            graph = update_graphs(apply, graphs_file)
+            refresh_sprites(graph_id, graph)
+            return {'bonus_ids': bonus_ids, 'fetched': list(bonus_nodes)}
+
+        job_id = jobs.submit('add_bonus', {'graph_id': graph_id, 'bonus_ids': bonus_ids}, job)
+        return jsonify({'status': 'queued', 'job_id': job_id, 'bonus_ids': bonus_ids}), 202
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -312,25 +370,22 @@ def toggle_bonus_button():
         return jsonify({'error': 'missing graph_id'}), 400
     
     # Load graphs file
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
-    graphs_file = os.path.join(data_dir, 'graphs.json')
+    graphs_file = GRAPHS_FILE
     
     if not os.path.exists(graphs_file):
         return jsonify({'error': 'no graphs found'}), 404
     
     try:
-        with open(graphs_file, 'r', encoding='utf-8') as f:
-            graphs = json.load(f)
+        graphs = read_graphs(graphs_file)
         
         if graph_id not in graphs.get('graphs', {}):
             return jsonify({'error': 'graph not found'}), 404
         
-        graph = graphs['graphs'][graph_id]
-        graph['hide_bonus_button'] = hide
+        def apply(graphs):
+            graphs['graphs'][graph_id]['hide_bonus_button'] = hide
         
         # Save updated graphs
-        with open(graphs_file, 'w', encoding='utf-8') as f:
-            json.dump(graphs, f, ensure_ascii=False, indent=2)
+        update_graphs(apply, graphs_file)
         
         return jsonify({'status': 'success', 'hide_bonus_button': hide})
     
@@ -345,16 +400,166 @@ def toggle_bonus_button():
 
 @app.route('/graph', methods=['GET'])
 def graph():
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
-    graphs_file = os.path.join(data_dir, 'graphs.json')
+    graphs_file = GRAPHS_FILE
     
-    if os.path.exists(graphs_file):
-        return send_from_directory(data_dir, 'graphs.json')
+    # Parsed and serialized once per file version, not per request
+    entry = cached_graphs(graphs_file)
+    if entry is not None:
+        # ?format=compact|skeleton: normalized wire format (see wire_format.py), decoded by the viewer
+        fmt = request.args.get('format')
+        if fmt in ('compact', 'skeleton'):
+            body, etag = entry.wire(fmt)
+            return _cached_json(body, etag, lambda encoding: entry.wire_compressed(fmt, encoding))
+        return _cached_json(entry.body, entry.etag, entry.compressed)
     else:
         # No graphs found - return empty structure
         return jsonify({'graphs': {}})
 
 
+def _snapshot(graphs_file):
+    # Binary snapshot shared by all workers through the page cache; None if there are no graphs
+    try:
+        return open_snapshot(graphs_file)
+    except (OSError, ValueError):
+        return None
+
+
+@app.route('/graph/<graph_id>', methods=['GET'])
+def graph_by_id(graph_id):
+    graphs_file = GRAPHS_FILE
+    fmt = request.args.get('format', 'plain')
+    if fmt not in GRAPH_FORMATS:
+        return jsonify({'error': f'format must be one of {", ".join(GRAPH_FORMATS)}'}), 400
+    snapshot = _snapshot(graphs_file)
+    if snapshot is not None:
+        # Served straight from the mapped file, without parsing graphs.json in this worker
+        found = snapshot.graph(graph_id, fmt)
+        compressed = lambda encoding: snapshot.graph_body(graph_id, fmt, encoding)
+    else:
+        entry = cached_graphs(graphs_file)
+        found = entry.graph(graph_id, fmt) if entry is not None else None
+        compressed = lambda encoding: entry.graph_compressed(graph_id, encoding, fmt)
+    if found is None:
+        return jsonify({'error': 'graph not found'}), 404
+    body, etag = found
+    return _cached_json(body, etag, compressed)
+
+
+@app.route('/graph/<graph_id>/node/<video_id>', methods=['GET'])
+def graph_node(graph_id, video_id):
+    # Full details of one node (descriptions, card data) for viewers that loaded the skeleton
+    graphs_file = GRAPHS_FILE
+    snapshot = _snapshot(graphs_file)
+    if snapshot is None:
+        node = read_graphs(graphs_file).get('graphs', {}).get(graph_id, {}).get('nodes', {}).get(video_id)
+        if node is None:
+            return jsonify({'error': 'node not found'}), 404
+        return jsonify(node_detail(node))
+    detail = snapshot.node_detail(graph_id, video_id)
+    if detail is None:
+        return jsonify({'error': 'node not found'}), 404
+    # WSGI servers only take bytes: this is the one copy out of the mapped snapshot
+    return Response(bytes(detail), mimetype='application/json')
+
+
+@app.route('/graph/<graph_id>/nodes', methods=['GET'])
+def graph_nodes(graph_id):
+    # Batch form: ?ids=a,b,c -> {"nodes": {"a": {...}, ...}}; ids that aren't nodes are left out
+    ids = [i.strip() for i in (request.args.get('ids') or '').split(',') if i.strip()]
+    if not ids:
+        return jsonify({'error': 'missing ids'}), 400
+    if len(ids) > MAX_NODE_IDS:
+        return jsonify({'error': f'at most {MAX_NODE_IDS} ids per request'}), 400
+    graphs_file = GRAPHS_FILE
+    snapshot = _snapshot(graphs_file)
+    if snapshot is not None:
+        if not snapshot.has_graph(graph_id):
+            return jsonify({'error': 'graph not found'}), 404
+        return Response(snapshot.node_details(graph_id, ids), mimetype='application/json')
+    graph = read_graphs(graphs_file).get('graphs', {}).get(graph_id)
+    if graph is None:
+        return jsonify({'error': 'graph not found'}), 404
+    nodes = graph.get('nodes', {})
+    return jsonify({'nodes': {vid: node_detail(nodes[vid]) for vid in ids if vid in nodes}})
+
+
+@app.route('/graph/<graph_id>/changes', methods=['GET'])
+def graph_changes(graph_id):
+    # ?since=<version the client has> -> ops to apply, or the full graph if the log doesn't go back that far
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'error': 'missing since'}), 400
+    graphs_file = GRAPHS_FILE
+    graph = read_graphs(graphs_file).get('graphs', {}).get(graph_id)
+    if graph is None:
+        return jsonify({'error': 'graph not found'}), 404
+    return jsonify(changes_since(graphs_file, graph_id, graph, since))
+
+
+@app.route('/graph/<graph_id>/reachable', methods=['GET'])
+def graph_reachable(graph_id):
+    # ?from=<video id> (default: the story's first video) -> {video id: number of choices away}
+    snapshot = _snapshot(GRAPHS_FILE)
+    if snapshot is None or not snapshot.has_graph(graph_id):
+        return jsonify({'error': 'graph not found'}), 404
+    start = request.args.get('from') or graph_id
+    depths = snapshot.reachable(graph_id, start)
+    if depths is None:
+        return jsonify({'error': 'video not in graph'}), 404
+    return jsonify({'from': start, 'count': len(depths), 'reachable': depths})
+
+
+@app.route('/graph/<graph_id>/stats', methods=['GET'])
+def graph_stats(graph_id):
+    snapshot = _snapshot(GRAPHS_FILE)
+    stats = snapshot.stats(graph_id) if snapshot is not None else None
+    if stats is None:
+        return jsonify({'error': 'graph not found'}), 404
+    return jsonify(stats)
+
+
+# Each content-coding is a different representation, so it gets its own strong ETag
+ENCODING_TAGS = {'br': '-br', 'gzip': '-gz'}
+
+
+def _cached_json(body, etag, compressed):
+    """Serve a JSON body with strong ETags: 304 if the client has it, else the smallest encoding it accepts
+
+    The identity body is tagged `etag` and compressed ones `etag-br` / `etag-gz`; If-None-Match with
+    any of them is a hit, answered with the tag that matched. Bodies may be memoryviews into a
+    snapshot; they are copied to bytes only for the response that is sent.
+    """
+    tags = [etag] + [etag + suffix for suffix in ENCODING_TAGS.values()]
+    matched = next((tag for tag in tags if request.if_none_match.contains(tag)), None)
+    if matched is not None:
+        response = Response(status=304)
+        response.set_etag(matched)
+    else:
+        response = None
+        for encoding in ('br', 'gzip'):
+            if request.accept_encodings.quality(encoding) > 0:
+                variant = compressed(encoding)
+                if variant is not None:
+                    response = Response(bytes(variant), mimetype='application/json')
+                    response.headers['Content-Encoding'] = encoding
+                    response.set_etag(etag + ENCODING_TAGS[encoding])
+                    break
+        if response is None:
+            response = Response(bytes(body), mimetype='application/json')
+            response.set_etag(etag)
+    # Always revalidate: a crawl can change the graph at any moment, and a 304 costs almost nothing
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.route('/sprites/<path:filename>', methods=['GET'])
+def sprite_file(filename):
+    # Sprite sheets and offset maps built by sprites.py
+    sprites_dir = os.path.join(os.path.dirname(__file__), 'data', 'sprites')
+    return send_from_directory(sprites_dir, filename)
+
+
 @app.route('/frontend/<path:filename>', methods=['GET'])
 def frontend_file(filename):
     # serve frontend files placed in the workspace/frontend folder
@@ -1,12 +1,24 @@
+import copy
+import hashlib
 import os
-import json
 import time
-from youtube_api import get_video
-from yt_parser import parse_description
+from video_store import get_video
+import video_store
+import failures
+from yt_parser import parse_description, clean_description
+from migrations import SCHEMA_VERSION
+from graph_store import update_graphs, read_graphs
+import state_store
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 GRAPHS_PATH = os.path.join(DATA_DIR, 'graphs.json')
 
+# Node fields filled in by other writers that a crawl does not produce itself
+MERGED_NODE_FIELDS = ('card_data', 'card_metadata')
+# Seconds between saves of a graph that is still being crawled. Each save diffs, writes,
+# compresses and snapshots the whole file, which costs more than a fetch on a big file
+SAVE_INTERVAL = 2.0
+
 crawl_state = {
     'state': 'idle',
     'nodes': 0,
@@ -30,72 +42,129 @@ def reset_state():
 
 
 def get_status():
-    return crawl_state
+    # Read from the shared store so any worker process can report a crawl another one runs
+    return state_store.get_crawl_status()
 
 
-def _write_graph():
-    if not os.path.isdir(DATA_DIR):
-        os.makedirs(DATA_DIR, exist_ok=True)
-    
-    root_id = crawl_state.get('root_video_id')
-    part2_id = crawl_state.get('part2_video_id')
-    root_title = _nodes.get(root_id, {}).get('title', root_id) if root_id else 'Unknown'
+def crawling_root():
+    """Root video of the crawl running in any process, or None."""
+    return state_store.running_crawl_root()
+
+
+def claim_crawl(video_id):
+    """Reserve the crawler for `video_id`. Returns False if a crawl is already running in any process."""
+    status = dict(state_store.IDLE_STATUS, state='running', root_video_id=video_id)
+    return state_store.claim_crawl(status)
+
+
+def mark_error():
+    crawl_state['state'] = 'error'
+    _publish()
+
+
+def _publish():
+    state_store.save_crawl_status(crawl_state)
+
+
+def graph_record(nodes, root_id, part2_id=None, stop_video_ids=None, trailer_video_id=None,
+                 bonus_video_ids=None, hide_bonus_button=False):
+    """Build the graphs.json entry for a crawled story"""
+    root_title = nodes.get(root_id, {}).get('title', root_id) if root_id else 'Unknown'
     
     # If Part 2 exists, append its title
-    if part2_id and part2_id in _nodes:
-        part2_title = _nodes.get(part2_id, {}).get('title', part2_id)
+    if part2_id and part2_id in nodes:
+        part2_title = nodes.get(part2_id, {}).get('title', part2_id)
         root_title = f"{root_title} + {part2_title}"
-    
-    # Load existing graphs file
-    graphs = {'graphs': {}}
-    if os.path.exists(GRAPHS_PATH):
-        with open(GRAPHS_PATH, 'r', encoding='utf-8') as f:
-            try:
-                graphs = json.load(f)
-                if 'graphs' not in graphs:
-                    graphs = {'graphs': {}}
-            except:
-                graphs = {'graphs': {}}
-    
-    # Add/update this graph
-    if root_id:
-        graphs['graphs'][root_id] = {
-            'title': root_title,
-            'nodes': _nodes,
-            'part2_video_id': part2_id,
-            'stop_video_ids': crawl_state.get('stop_video_ids', []),
-            'trailer_video_id': crawl_state.get('trailer_video_id'),
-            'bonus_video_ids': crawl_state.get('bonus_video_ids', []),
-            'hide_bonus_button': crawl_state.get('hide_bonus_button', False)
-        }
-    
-    # Save multi-graph format
-    with open(GRAPHS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(graphs, f, ensure_ascii=False, indent=2)
 
+    return {
+        'title': root_title,
+        'nodes': nodes,
+        'part2_video_id': part2_id,
+        'stop_video_ids': stop_video_ids or [],
+        'trailer_video_id': trailer_video_id,
+        'bonus_video_ids': bonus_video_ids or [],
+        'hide_bonus_button': hide_bonus_button,
+        # Crawls produce current-schema data, so migrations can skip this graph
+        'schema_version': SCHEMA_VERSION
+    }
 
-def run_crawl(start_video_id, max_nodes=1000, part2_video_id=None, stop_video_ids=None, trailer_video_id=None, bonus_video_ids=None):
-    global crawl_state, _nodes, _edges, _visited
-    crawl_state['state'] = 'running'
-    crawl_state['root_video_id'] = start_video_id
-    crawl_state['part2_video_id'] = part2_video_id
-    crawl_state['stop_video_ids'] = stop_video_ids or []
-    crawl_state['trailer_video_id'] = trailer_video_id
-    crawl_state['bonus_video_ids'] = bonus_video_ids or []
+
+def save_graph(root_id, graph, path=GRAPHS_PATH):
+    """Store a crawled graph under `root_id`, keeping fields other writers added to its nodes"""
+    def apply(graphs):
+        # Keep card data another writer (the card backfill) added to our nodes meanwhile
+        old_nodes = graphs['graphs'].get(root_id, {}).get('nodes', {})
+        for vid, node in graph['nodes'].items():
+            for key in MERGED_NODE_FIELDS:
+                if key not in node and old_nodes.get(vid, {}).get(key) is not None:
+                    node[key] = old_nodes[vid][key]
+        graphs['graphs'][root_id] = graph
+
+    # Re-read and write under the file lock so concurrent writers are merged, not clobbered
+    update_graphs(apply, path)
+
+
+def _write_graph():
+    root_id = crawl_state.get('root_video_id')
+    if not root_id:
+        return
+    graph = graph_record(
+        _nodes, root_id,
+        part2_id=crawl_state.get('part2_video_id'),
+        stop_video_ids=crawl_state.get('stop_video_ids', []),
+        trailer_video_id=crawl_state.get('trailer_video_id'),
+        bonus_video_ids=crawl_state.get('bonus_video_ids', []),
+        hide_bonus_button=crawl_state.get('hide_bonus_button', False)
+    )
+    save_graph(root_id, graph)
+
+
+def content_hash(title, description):
+    """Hash of what a node's structure depends on: its title (used as choice labels) and raw description (its links)"""
+    return hashlib.sha256(f'{title}\n{description}'.encode('utf-8')).hexdigest()[:16]
+
+
+def _node_from_video(vid, video):
+    node = {
+        'title': video.get('title', vid),
+        'thumbnail': video.get('thumbnail'),
+        'url': video.get('url'),
+        'description': video.get('description', '')
+    }
+    node['content_hash'] = content_hash(node['title'], node['description'])
+    # Endscreen cards parsed from the same watch page, no browser needed
+    if video.get('card_data') is not None:
+        node['card_data'] = video['card_data']
+    return node
+
+
+def crawl_story(start_video_id, max_nodes=1000, stop_video_ids=None, trailer_video_id=None, bonus_video_ids=None,
+                fetch=get_video, on_node=None, delay=0.2, nodes=None, edges=None, visited=None, prefetch=None):
+    """Crawl one story from its root video, following the choice links in descriptions.
+
+    Returns the nodes dict with choices, edges and clean descriptions filled in.
+    fetch(video_id) returns a video dict (video_store.get_video by default, which
+    only fetches videos not already stored and fresh). on_node(nodes, edges)
+    is called after each crawled video. nodes/edges/visited may be passed in to
+    continue an earlier crawl. prefetch(video_ids), if given, is told which
+    videos will be fetched next, so a concurrent fetcher can start on them
+    while the crawl works through the ones before.
+    """
+    nodes = {} if nodes is None else nodes
+    edges = [] if edges is None else edges
+    visited = set() if visited is None else visited
+    if prefetch:
+        extras = [trailer_video_id] if trailer_video_id and trailer_video_id != 'none' else []
+        prefetch(extras + list(bonus_video_ids or []) + [start_video_id])
     
     # Fetch trailer video data if provided and not 'none'
     if trailer_video_id and trailer_video_id != 'none':
         try:
-            trailer_video = get_video(trailer_video_id)
-            _nodes[trailer_video_id] = {
-                'title': trailer_video.get('title', trailer_video_id),
-                'thumbnail': trailer_video.get('thumbnail'),
-                'url': trailer_video.get('url'),
-                'description': trailer_video.get('description', '')
-            }
+            trailer_video = fetch(trailer_video_id)
+            nodes[trailer_video_id] = _node_from_video(trailer_video_id, trailer_video)
             # Add edge from trailer to root
-            _edges.append({'from': trailer_video_id, 'to': start_video_id, 'label': ''})
-            _visited.add(trailer_video_id)  # Mark as visited so we don't crawl it
+            edges.append({'from': trailer_video_id, 'to': start_video_id, 'label': ''})
+            visited.add(trailer_video_id)  # Mark as visited so we don't crawl it
         except Exception:
             # If trailer fetch fails, just continue without it
             pass
@@ -104,152 +173,249 @@ def run_crawl(start_video_id, max_nodes=1000, part2_video_id=None, stop_video_id
     if bonus_video_ids:
         for bonus_id in bonus_video_ids:
             try:
-                bonus_video = get_video(bonus_id)
-                _nodes[bonus_id] = {
-                    'title': bonus_video.get('title', bonus_id),
-                    'thumbnail': bonus_video.get('thumbnail'),
-                    'url': bonus_video.get('url'),
-                    'description': bonus_video.get('description', '')
-                }
+                bonus_video = fetch(bonus_id)
+                nodes[bonus_id] = _node_from_video(bonus_id, bonus_video)
                 # Bonus videos have no connections - they're standalone
-                _visited.add(bonus_id)  # Mark as visited so we don't crawl them
+                visited.add(bonus_id)  # Mark as visited so we don't crawl them
             except Exception:
                 # If bonus fetch fails, skip it
                 pass
     
-    stack = [start_video_id]
-    
-    stop_ids_set = set(stop_video_ids or [])
+    _crawl([start_video_id], nodes, edges, visited, set(stop_video_ids or []), fetch, on_node, max_nodes, delay,
+           prefetch)
+    _link_nodes(nodes)
+    return nodes
+
 
+def _crawl(stack, nodes, edges, visited, stop_ids_set, fetch, on_node, max_nodes, delay, prefetch=None):
+    """Depth-first crawl from the ids on `stack`, adding to nodes/edges/visited in place"""
     while stack:
         vid = stack.pop()
-        if vid in _visited:
+        if vid in visited:
             continue
         try:
-            video = get_video(vid)
+            video = fetch(vid)
         except Exception:
             # skip videos that error
-            _visited.add(vid)
+            visited.add(vid)
             continue
 
-        _visited.add(vid)
-        _nodes[vid] = {
-            'title': video.get('title', vid),
-            'thumbnail': video.get('thumbnail'),
-            'url': video.get('url'),
-            'description': video.get('description', '')
-        }
+        visited.add(vid)
+        nodes[vid] = _node_from_video(vid, video)
 
         # Check if this is a stop node
         is_stop_node = vid in stop_ids_set
         
-        choices = parse_description(video.get('description', ''))
+        # The video store parsed the links already when it fetched the video
+        choices = video.get('links')
+        if choices is None:
+            choices = parse_description(video.get('description', ''))
         for c in choices:
             # Temporarily store label from parsed choice (anchor text or empty).
-            _edges.append({'from': vid, 'to': c['video_id'], 'label': c.get('text', '')})
+            edges.append({'from': vid, 'to': c['video_id'], 'label': c.get('text', '')})
             # Only continue crawling if this is not a stop node
-            if c['video_id'] not in _visited and not is_stop_node:
+            if c['video_id'] not in visited and not is_stop_node:
                 stack.append(c['video_id'])
+        if prefetch and not is_stop_node:
+            prefetch([c['video_id'] for c in choices if c['video_id'] not in visited])
 
-        crawl_state['nodes'] = len(_nodes)
-        crawl_state['edges'] = len(_edges)
-        _write_graph()
+        if on_node:
+            on_node(nodes, edges)
 
-        if crawl_state['nodes'] >= max_nodes:
+        if len(nodes) >= max_nodes:
             break
 
-        time.sleep(0.2)
+        if delay:
+            time.sleep(delay)
 
-    crawl_state['state'] = 'done'
-    
-    # Add choice_N fields to nodes based on ALL links found in description (not just crawled edges)
-    for vid, node in _nodes.items():
-        desc = node.get('description', '')
-        # Re-parse description to get all video IDs
-        found_choices = parse_description(desc)
-        
-        # Initialize outgoing and incoming lists
-        node['outgoing'] = []
-        node['incoming_from'] = []
+
+def _link_node(node, nodes):
+    """Set a node's choice_N fields, outgoing edges and clean description from its description"""
+    for key in [k for k in node if k.startswith('choice_')]:
+        del node[key]
+    node['outgoing'] = []
+    choice_labels = []
+    # All links found in the description (not just crawled edges)
+    for i, choice_dict in enumerate(parse_description(node.get('description', '')), 1):
+        choice_id = choice_dict['video_id']
+        node[f'choice_{i}'] = choice_id
+        # Also add choice label (title of target video if we have it)
+        choice_title = nodes.get(choice_id, {}).get('title', '')
+        if not choice_title:
+            # If we don't have the node, just use the video ID
+            choice_title = f'Video {choice_id}'
+        node[f'choice_{i}_label'] = choice_title
+        choice_labels.append(choice_title)
         
-        # Add all found choices
-        for i, choice_dict in enumerate(found_choices, 1):
-            choice_id = choice_dict['video_id']
-            node[f'choice_{i}'] = choice_id
-            # Also add choice label (title of target video if we have it)
-            choice_title = _nodes.get(choice_id, {}).get('title', '')
-            if not choice_title:
-                # If we don't have the node, just use the video ID
-                choice_title = f'Video {choice_id}'
-            node[f'choice_{i}_label'] = choice_title
-            
-            # Add to outgoing connections
-            node['outgoing'].append({
-                'to': choice_id,
-                'label': choice_title
-            })
+        # Add to outgoing connections
+        node['outgoing'].append({
+            'to': choice_id,
+            'label': choice_title
+        })
     
-    # Build incoming connections for each node
-    for vid, node in _nodes.items():
+    # Clean descriptions: remove choice links, prompts and choice titles
+    node['clean_description'] = clean_description(node.get('description', ''), choice_labels[:9])
+
+
+def _link_incoming(nodes):
+    """Rebuild every node's incoming_from list from the outgoing edges"""
+    for node in nodes.values():
+        node['incoming_from'] = []
+    for vid, node in nodes.items():
         for outgoing in node.get('outgoing', []):
             target_id = outgoing['to']
-            if target_id in _nodes:
-                _nodes[target_id]['incoming_from'].append({
+            if target_id in nodes:
+                nodes[target_id]['incoming_from'].append({
                     'from': vid,
                     'label': node.get('title', '')
                 })
-    
-    # Clean descriptions: extract first sentence and remove choice titles
-    for vid, node in _nodes.items():
-        desc = node.get('description', '')
-        clean_first = ''
-        if desc:
-            # Split into lines first
-            lines = desc.split('\n')
-            cleaned_lines = []
-            
-            for line in lines:
-                line_stripped = line.strip()
-                # Skip lines that contain ► (these are choice links)
-                if '►' in line:
-                    continue
-                # Skip empty lines
-                if not line_stripped:
-                    continue
-                # Skip lines that look like prompts (short questions/phrases before links)
-                # Common patterns: "TRY AGAIN?", "MORE?", "SHH...", etc.
-                if line_stripped.endswith('?') and len(line_stripped) < 20:
-                    continue
-                # Skip lines that are URLs
-                if line_stripped.startswith('http://') or line_stripped.startswith('https://'):
+
+
+def _link_nodes(nodes):
+    """Fill in choice_N fields, outgoing/incoming edges and clean descriptions"""
+    for node in nodes.values():
+        _link_node(node, nodes)
+    _link_incoming(nodes)
+
+
+def _merge_refresh(root_id, touched, refreshed_ids, path):
+    """Write a refresh's changed and added nodes into the graph as it is now.
+
+    The refresh ran on a copy for seconds or minutes; anything else written to
+    the graph meanwhile (a trailer or bonus video, the bonus button, card
+    data) is kept. Nodes the refresh re-parsed replace the stored ones, new
+    nodes are only added if nobody else added them first, and incoming edges
+    are rebuilt over the merged nodes.
+    """
+    def apply(graphs):
+        graph = graphs['graphs'].get(root_id)
+        if graph is None:
+            # Deleted while refreshing
+            return
+        current = graph.setdefault('nodes', {})
+        for vid, node in touched.items():
+            if vid in refreshed_ids:
+                old = current.get(vid)
+                if old is None:
+                    # Removed meanwhile
                     continue
-                    
-                cleaned_lines.append(line)
-            
-            # Rejoin cleaned lines
-            first_part = '\n'.join(cleaned_lines).strip()
-            
-            # Get all choice labels for this node
-            choice_labels = [node.get(f'choice_{i}_label', '') for i in range(1, 10) if f'choice_{i}_label' in node]
-            
-            # Remove lines that exactly match choice labels
-            lines = first_part.split('\n')
-            cleaned_lines = []
-            for line in lines:
-                line_stripped = line.strip()
-                if line_stripped and line_stripped not in choice_labels:
-                    cleaned_lines.append(line)
-            
-            first_part = '\n'.join(cleaned_lines).strip()
-            
-            # Remove appended choice titles from the end (concatenated without spaces/newlines)
-            for label in choice_labels:
-                if label and first_part.endswith(label):
-                    first_part = first_part[:-len(label)].strip()
-            
-            clean_first = first_part
-        
-        node['clean_description'] = clean_first
+                for key in MERGED_NODE_FIELDS:
+                    if key not in node and old.get(key) is not None:
+                        node[key] = old[key]
+            elif vid in current:
+                # Added by someone else meanwhile, e.g. as a bonus video
+                continue
+            current[vid] = node
+        _link_incoming(current)
 
-    _write_graph()
+    update_graphs(apply, path)
+
+
+def refresh_story(root_id, path=GRAPHS_PATH, fetch=None, max_nodes=1000, delay=0.2):
+    """Recrawl a saved story, redoing work only for videos whose title or description changed.
 
+    Every node is fetched again (bypassing the video store's freshness) and
+    its content hash compared with the stored one. Unchanged nodes are left
+    exactly as they are; changed ones are re-parsed and re-linked, and the
+    crawl only continues from links that did not exist before. Returns a
+    summary of checked, changed, added and failed video ids.
+    """
+    graph = read_graphs(path).get('graphs', {}).get(root_id)
+    if graph is None:
+        raise ValueError(f'no graph {root_id}')
+    if fetch is None:
+        fetch = lambda video_id: video_store.get_video(video_id, max_age=0)
+    nodes = copy.deepcopy(graph.get('nodes') or {})
+    # Trailer and bonus nodes are added by hand: their edges are not derived from descriptions
+    extras = set(graph.get('bonus_video_ids') or [])
+    if graph.get('trailer_video_id') and graph['trailer_video_id'] != 'none':
+        extras.add(graph['trailer_video_id'])
+
+    changed, retitled, failed = set(), set(), []
+    for vid, node in list(nodes.items()):
+        try:
+            video = fetch(vid)
+        except Exception:
+            # Keep what we have; the failure ledger schedules another try
+            failed.append(vid)
+            continue
+        old_hash = node.get('content_hash') or content_hash(node.get('title', vid), node.get('description', ''))
+        fresh = _node_from_video(vid, video)
+        if fresh['content_hash'] == old_hash:
+            node['content_hash'] = old_hash
+        else:
+            if fresh['title'] != node.get('title'):
+                retitled.add(vid)
+            node.update(fresh)
+            changed.add(vid)
+        if delay:
+            time.sleep(delay)
+
+    old_targets = {vid: {o.get('to') for o in nodes[vid].get('outgoing', [])} for vid in changed}
+    # Parents of a retitled video carry its old title as a choice label
+    relink = {vid for vid in changed if vid not in extras}
+    relink |= {inc['from'] for vid in retitled for inc in nodes[vid].get('incoming_from', []) if inc.get('from') in nodes}
+    for vid in relink - extras:
+        _link_node(nodes[vid], nodes)
+    for vid in changed & extras:
+        nodes[vid]['clean_description'] = clean_description(nodes[vid].get('description', ''))
+
+    # Only links that appeared in this refresh lead anywhere new
+    stop_ids = set(graph.get('stop_video_ids') or [])
+    stack = [o['to'] for vid in changed - extras - stop_ids for o in nodes[vid].get('outgoing', [])
+             if o['to'] not in nodes and o['to'] not in old_targets[vid]]
+    # Links that failed to fetch before are tried again (the ledger skips them until they are due)
+    pending = {o['to'] for vid, node in nodes.items() if vid not in extras and vid not in stop_ids
+               for o in node.get('outgoing', []) if o.get('to') and o['to'] not in nodes}
+    stack += list(failures.known_failures(pending))
+    before = set(nodes)
+    _crawl(stack, nodes, [], set(nodes), stop_ids, fetch, None, max_nodes, delay)
+    added = set(nodes) - before
+    if added:
+        # New nodes need their edges, and their parents need the new titles as labels
+        for vid, node in nodes.items():
+            if vid not in extras and (vid in added or any(o.get('to') in added for o in node.get('outgoing', []))):
+                _link_node(node, nodes)
+    _link_incoming(nodes)
+
+    old_nodes = graph.get('nodes') or {}
+    touched = {vid for vid, node in nodes.items() if old_nodes.get(vid) != node}
+    if touched:
+        _merge_refresh(root_id, {vid: nodes[vid] for vid in touched}, set(old_nodes), path)
+    return {
+        'checked': len(before),
+        'changed': sorted(changed),
+        'added': sorted(added),
+        'failed': failed
+    }
+
+
+def run_crawl(start_video_id, max_nodes=1000, part2_video_id=None, stop_video_ids=None, trailer_video_id=None, bonus_video_ids=None):
+    global crawl_state, _nodes, _edges, _visited
+    crawl_state['state'] = 'running'
+    crawl_state['root_video_id'] = start_video_id
+    crawl_state['part2_video_id'] = part2_video_id
+    crawl_state['stop_video_ids'] = stop_video_ids or []
+    crawl_state['trailer_video_id'] = trailer_video_id
+    crawl_state['bonus_video_ids'] = bonus_video_ids or []
+    _publish()
+    last_save = None
+
+    def on_node(nodes, edges):
+        nonlocal last_save
+        crawl_state['nodes'] = len(nodes)
+        crawl_state['edges'] = len(edges)
+        # The status is cheap and goes out every node; the partial graph at most every SAVE_INTERVAL
+        if last_save is None or time.monotonic() - last_save >= SAVE_INTERVAL:
+            _write_graph()
+            last_save = time.monotonic()
+        _publish()
+
+    crawl_story(start_video_id, max_nodes=max_nodes, stop_video_ids=stop_video_ids,
+                trailer_video_id=trailer_video_id, bonus_video_ids=bonus_video_ids,
+                on_node=on_node, nodes=_nodes, edges=_edges, visited=_visited)
+
+    crawl_state['state'] = 'done'
+    _write_graph()
+    # Only report 'done' once the final graph (with edges and clean descriptions) is saved
+    _publish()
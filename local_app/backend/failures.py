@@ -0,0 +1,117 @@
+"""
+Ledger of videos that could not be fetched.
+
+Every failed fetch through video_store is recorded here with its kind (see
+youtube_api.VideoFetchError) and a time before which it is not tried again:
+
+    transient   retried with exponential backoff from RETRY_BASE['transient']
+    throttled   the same, starting from a longer base
+    private     negatively cached for NEGATIVE_TTL, then checked again
+    removed     likewise
+
+Until then video_store.get_video raises straight away instead of going to
+YouTube, so dead videos are not refetched on every crawl. A successful
+fetch clears the entry. Operators can list the ledger and retry the due
+entries:
+
+    python failures.py [--kind KIND] [--due] [--retry] [--clear VIDEO_ID]
+
+or use GET /failures and POST /failures/retry.
+"""
+import json
+import sys
+import time
+
+import state_store
+from youtube_api import VideoFetchError, PERMANENT_FAILURES
+
+KINDS = ('transient', 'throttled', 'private', 'removed')
+RETRY_BASE = {'transient': 60, 'throttled': 15 * 60}
+MAX_BACKOFF = 24 * 3600
+NEGATIVE_TTL = 7 * 24 * 3600
+RETRY_LIMIT = 50
+
+
+def retry_delay(kind, attempts):
+    """Seconds until a video that failed `attempts` times in a row may be fetched again"""
+    if kind in PERMANENT_FAILURES:
+        return NEGATIVE_TTL
+    return min(MAX_BACKOFF, RETRY_BASE.get(kind, RETRY_BASE['transient']) * 2 ** (attempts - 1))
+
+
+def record_failure(video_id, error):
+    """Store a failed fetch. Exceptions other than VideoFetchError count as transient."""
+    if isinstance(error, VideoFetchError):
+        kind, message = error.kind, error.reason
+    else:
+        kind, message = 'transient', str(error)
+    return state_store.save_failure(video_id, kind, message, lambda attempts: retry_delay(kind, attempts))
+
+
+def record_success(video_id):
+    state_store.clear_failure(video_id)
+
+
+def check(video_id):
+    """Raise VideoFetchError if `video_id` failed before and is not due for another try yet."""
+    entries = state_store.get_failures([video_id])
+    if entries and entries[0]['retry_at'] > time.time():
+        entry = entries[0]
+        wait = int(entry['retry_at'] - time.time())
+        raise VideoFetchError(video_id, entry['kind'], f"{entry['error']} (not retried for another {wait}s)")
+
+
+def known_failures(video_ids):
+    """{video_id: entry} for the ids that are in the ledger."""
+    return {entry['video_id']: entry for entry in state_store.get_failures(list(video_ids))}
+
+
+def list_failures(kind=None, due=False):
+    return state_store.get_failures(kinds=[kind] if kind else None, due=due)
+
+
+def retry_due(limit=RETRY_LIMIT):
+    """Fetch up to `limit` transient/throttled videos whose retry time has come. Returns {'recovered', 'failed'}."""
+    import video_store
+
+    recovered, failed = [], []
+    for entry in state_store.get_failures(kinds=['transient', 'throttled'], due=True)[:limit]:
+        try:
+            video_store.get_video(entry['video_id'], max_age=0)
+            recovered.append(entry['video_id'])
+        except Exception:
+            failed.append(entry['video_id'])
+    return {'recovered': recovered, 'failed': failed}
+
+
+def main(argv):
+    kind = None
+    if '--kind' in argv:
+        kind = argv[argv.index('--kind') + 1] if argv.index('--kind') + 1 < len(argv) else None
+        if kind not in KINDS:
+            print(f'--kind must be one of {", ".join(KINDS)}')
+            return 2
+    if '--clear' in argv:
+        i = argv.index('--clear') + 1
+        if i >= len(argv):
+            print('--clear needs a video id')
+            return 2
+        record_success(argv[i])
+        print(f'Cleared {argv[i]}')
+        return 0
+    if '--retry' in argv:
+        print(json.dumps(retry_due()))
+        return 0
+
+    now = time.time()
+    entries = list_failures(kind, due='--due' in argv)
+    for entry in entries:
+        wait = max(0, int(entry['retry_at'] - now))
+        print(f"{entry['video_id']}  {entry['kind']:<9}  attempts={entry['attempts']}  "
+              f"retry in {wait}s  {entry['error']}")
+    print(f'{len(entries)} entries')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
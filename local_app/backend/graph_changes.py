@@ -0,0 +1,103 @@
+"""
+Per-graph versions and a bounded log of what changed between them.
+
+update_graphs() calls bump_versions() with the document before and after a
+change: every graph whose contents differ gets `version` + 1 and a list of
+ops describing the difference, which record() stores in state.db. A viewer
+that has version v asks changes_since(v) for the ops it missed instead of
+reloading the whole graph. Ops are:
+
+    {"op": "set", "field": f, "value": v}          graph field set
+    {"op": "unset", "field": f}                    graph field removed
+    {"op": "add", "id": vid, "node": {...}}        node added
+    {"op": "update", "id": vid, "set": {...}, "unset": [...]}
+                                                   node fields changed (edges
+                                                   are the outgoing and
+                                                   incoming_from fields)
+    {"op": "remove", "id": vid}                    node removed
+
+Only the last CHANGE_LOG_SIZE versions of a graph are kept; a client that
+is further behind (or whose version the log never saw, e.g. after state.db
+was reset) gets the full graph instead.
+"""
+import os
+
+import state_store
+
+CHANGE_LOG_SIZE = 100
+
+
+def diff_graph(old, new):
+    """Return the ops turning graph `old` into graph `new` (version fields ignored)."""
+    ops = []
+    for field in new:
+        if field not in ('nodes', 'version') and old.get(field) != new[field]:
+            ops.append({'op': 'set', 'field': field, 'value': new[field]})
+    for field in old:
+        if field not in ('nodes', 'version') and field not in new:
+            ops.append({'op': 'unset', 'field': field})
+
+    old_nodes = old.get('nodes') or {}
+    new_nodes = new.get('nodes') or {}
+    for vid, node in new_nodes.items():
+        before = old_nodes.get(vid)
+        if before is None:
+            ops.append({'op': 'add', 'id': vid, 'node': node})
+        elif before != node:
+            changed = {k: v for k, v in node.items() if before.get(k) != v}
+            removed = [k for k in before if k not in node]
+            op = {'op': 'update', 'id': vid, 'set': changed}
+            if removed:
+                op['unset'] = removed
+            ops.append(op)
+    for vid in old_nodes:
+        if vid not in new_nodes:
+            ops.append({'op': 'remove', 'id': vid})
+    return ops
+
+
+def bump_versions(old_data, new_data):
+    """Set `version` on every graph of new_data and return {graph_id: (version, ops)} for the changed ones."""
+    old_graphs = old_data.get('graphs', {})
+    changes = {}
+    for graph_id, graph in new_data.get('graphs', {}).items():
+        old = old_graphs.get(graph_id) or {}
+        version = old.get('version', 0)
+        ops = diff_graph(old, graph)
+        if ops:
+            version += 1
+            changes[graph_id] = (version, ops)
+        graph['version'] = version
+    return changes
+
+
+def _source(path):
+    # The log is shared by every graphs file; entries are keyed by the file they belong to
+    return os.path.abspath(path)
+
+
+def record(path, changes):
+    """Store the ops from bump_versions(), dropping versions older than CHANGE_LOG_SIZE."""
+    if changes:
+        state_store.save_changes(_source(path), changes, CHANGE_LOG_SIZE)
+
+
+def changes_since(path, graph_id, graph, since):
+    """Patch for a client holding version `since` of `graph` (the current stored graph).
+
+    Returns {'version', 'since', 'changes': [{'version', 'ops'}, ...]}, or
+    {'version', 'snapshot': graph} when the log can't bridge the gap.
+    """
+    current = graph.get('version', 0)
+    if since == current:
+        return {'version': current, 'since': since, 'changes': []}
+    if 0 <= since < current:
+        # Entries newer than the file belong to a write that failed after logging; skip them
+        rows = [row for row in state_store.get_changes(_source(path), graph_id, since) if row[0] <= current]
+        if [version for version, _ in rows] == list(range(since + 1, current + 1)):
+            return {
+                'version': current,
+                'since': since,
+                'changes': [{'version': version, 'ops': ops} for version, ops in rows]
+            }
+    return {'version': current, 'snapshot': graph}
@@ -0,0 +1,333 @@
+"""
+Read-only binary snapshot of graphs.json, opened with mmap.
+
+Serving /graph/<id> from the parsed file means every worker process keeps
+its own copy of the whole dict tree. A snapshot holds the same graphs in a
+flat file that every worker maps read-only, so they share the OS page cache
+and nothing is parsed:
+
+    header    magic, version, counts and section offsets
+    graphs    per graph: id, node range, and the served JSON bodies (plain,
+              compact and skeleton wire format) with their ETags and gzip /
+              brotli encodings
+    nodes     per node: video id, title and node-detail JSON; each graph's
+              nodes are sorted by id, followed by ids that only appear as
+              edge targets
+    rows      CSR row offsets, node_count + 1 entries
+    edges     CSR column array: global index of each edge's target node
+    heap      UTF-8 strings and bodies, addressed by (offset, length)
+
+All integers are little-endian u32. update_graphs() writes a snapshot after
+every save; it is named after the graphs.json mtime, size and inode it was
+built from (`graphs.json.<mtime>-<size>-<inode>.snap`), so a reader that
+stats the file knows which snapshot is current, a stale one is never used
+(not even after a replace within the mtime resolution that kept the size),
+and Windows never has to replace a file another worker has mapped.
+
+Bodies and strings are returned as memoryviews into the map rather than
+copies; app.py turns them into bytes only when handing them to the server.
+"""
+import glob
+import mmap
+import os
+import struct
+import threading
+from collections import deque
+
+from graph_store import GRAPHS_PATH, _encode, _etag, _signature, _write_bytes, compress, load_graphs
+
+MAGIC = b'YTGS'
+SNAPSHOT_VERSION = 2
+
+HEADER = struct.Struct('<4sIIIIIIIIII')
+FORMATS = ('plain', 'compact', 'skeleton')
+ENCODINGS = ('identity', 'etag', 'gzip', 'br')
+
+# id, first node, node count, target-only count, then (body, etag, gzip, br) refs for each format
+GRAPH = struct.Struct('<' + 'I' * (5 + 2 * len(FORMATS) * len(ENCODINGS)))
+# id ref, title ref, detail ref
+NODE = struct.Struct('<IIIIII')
+
+_open = {}
+_open_lock = threading.Lock()
+
+
+def snapshot_path(path, signature):
+    mtime_ns, size, inode = signature
+    return f'{path}.{mtime_ns}-{size}-{inode}.snap'
+
+
+class _Heap:
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+        self._strings = {}
+
+    def add(self, value):
+        """Append bytes (or a str) and return its (offset, length) ref; equal strings are stored once."""
+        if isinstance(value, str):
+            if value in self._strings:
+                return self._strings[value]
+            ref = self._strings[value] = self.add(value.encode('utf-8'))
+            return ref
+        if not value:
+            return (0, 0)
+        ref = (self.size, len(value))
+        self.parts.append(value)
+        self.size += len(value)
+        return ref
+
+
+def build_snapshot(data):
+    """Return the snapshot bytes for a parsed graphs.json document."""
+    from wire_format import encode_graph, node_detail
+
+    heap = _Heap()
+    graph_records, node_records, rows, edges = [], [], [0], []
+
+    for graph_id, graph in data.get('graphs', {}).items():
+        nodes = graph.get('nodes') or {}
+        node_ids = sorted(nodes)
+        targets = sorted({out.get('to') for node in nodes.values() for out in node.get('outgoing') or []
+                          if out.get('to') and out.get('to') not in nodes})
+        first = len(node_records)
+        index = {vid: first + i for i, vid in enumerate(node_ids + targets)}
+
+        for vid in node_ids:
+            node = nodes[vid]
+            node_records.append(heap.add(vid) + heap.add(node.get('title') or '') + heap.add(_encode(node_detail(node))))
+            edges.extend(index[out['to']] for out in node.get('outgoing') or [] if out.get('to'))
+            rows.append(len(edges))
+        for vid in targets:
+            node_records.append(heap.add(vid) + (0, 0, 0, 0))
+            rows.append(len(edges))
+
+        refs = []
+        for value in (graph, encode_graph(graph), encode_graph(graph, skeleton=True)):
+            body = _encode(value)
+            br = compress(body, 'br')
+            refs += heap.add(body) + heap.add(_etag(body)) + heap.add(compress(body, 'gzip')) + heap.add(br or b'')
+        graph_records.append(heap.add(graph_id) + (first, len(node_ids), len(targets)) + tuple(refs))
+
+    graphs_off = HEADER.size
+    nodes_off = graphs_off + GRAPH.size * len(graph_records)
+    rows_off = nodes_off + NODE.size * len(node_records)
+    edges_off = rows_off + 4 * len(rows)
+    heap_off = edges_off + 4 * len(edges)
+
+    out = [HEADER.pack(MAGIC, SNAPSHOT_VERSION, len(graph_records), len(node_records), len(edges),
+                       graphs_off, nodes_off, rows_off, edges_off, heap_off, heap.size)]
+    out += [GRAPH.pack(*record) for record in graph_records]
+    out += [NODE.pack(*record) for record in node_records]
+    out.append(struct.pack(f'<{len(rows)}I', *rows))
+    out.append(struct.pack(f'<{len(edges)}I', *edges))
+    out += heap.parts
+    return b''.join(out)
+
+
+def write_snapshot(data, path=GRAPHS_PATH, signature=None):
+    """Write the snapshot for `data`, the contents of `path` at `signature`, and remove older ones."""
+    if signature is None:
+        signature = _signature(path)
+    target = snapshot_path(path, signature)
+    if not os.path.exists(target):
+        _write_bytes(target, build_snapshot(data))
+    prune_snapshots(path, keep=target)
+    return target
+
+
+def prune_snapshots(path, keep):
+    for old in glob.glob(f'{glob.escape(path)}.*.snap'):
+        if old != keep:
+            try:
+                os.remove(old)
+            except OSError:
+                # Still mapped by a worker on Windows; removed after a later save
+                pass
+
+
+class GraphSnapshot:
+    """One snapshot file mapped into memory. Safe to share between threads."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.graph_count, self.node_count, self.edge_count, self._graphs_off,
+         self._nodes_off, self._rows_off, self._edges_off, self._heap_off, _) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != SNAPSHOT_VERSION:
+            self._mm.close()
+            raise ValueError(f'{filename} is not a version {SNAPSHOT_VERSION} graph snapshot')
+
+    def _bytes(self, offset, length):
+        # A view, not a copy; it keeps the map alive for as long as it is referenced
+        start = self._heap_off + offset
+        return memoryview(self._mm)[start:start + length]
+
+    def _str(self, offset, length):
+        return str(self._bytes(offset, length), 'utf-8')
+
+    def _graph(self, i):
+        return GRAPH.unpack_from(self._mm, self._graphs_off + GRAPH.size * i)
+
+    def graph_ids(self):
+        return [self._str(*self._graph(i)[:2]) for i in range(self.graph_count)]
+
+    def _find_graph(self, graph_id):
+        # A handful of graphs per file: a scan is cheaper than an index
+        key = graph_id.encode('utf-8')
+        for i in range(self.graph_count):
+            record = self._graph(i)
+            if record[1] == len(key) and self._bytes(*record[:2]) == key:
+                return record
+        return None
+
+    def has_graph(self, graph_id):
+        return self._find_graph(graph_id) is not None
+
+    def graph_body(self, graph_id, fmt='plain', encoding='identity'):
+        """Return the stored JSON body of a graph in `fmt` (or its ETag / gzip / br encoding) as a memoryview, or None."""
+        record = self._find_graph(graph_id)
+        if record is None:
+            return None
+        at = 5 + 2 * (len(ENCODINGS) * FORMATS.index(fmt) + ENCODINGS.index(encoding))
+        offset, length = record[at:at + 2]
+        if not length:
+            return None
+        return self._bytes(offset, length)
+
+    def graph(self, graph_id, fmt='plain'):
+        """(body, etag) for a graph, like CachedGraphs.graph(), or None."""
+        body = self.graph_body(graph_id, fmt)
+        if body is None:
+            return None
+        return body, str(self.graph_body(graph_id, fmt, 'etag'), 'ascii')
+
+    def node_id(self, index):
+        return self._str(*NODE.unpack_from(self._mm, self._nodes_off + NODE.size * index)[:2])
+
+    def node_title(self, index):
+        return self._str(*NODE.unpack_from(self._mm, self._nodes_off + NODE.size * index)[2:4])
+
+    def node_detail(self, graph_id, video_id):
+        """JSON body of wire_format.node_detail() for a crawled node as a memoryview, or None."""
+        index = self.node_index(graph_id, video_id)
+        if index is None:
+            return None
+        return self._bytes(*NODE.unpack_from(self._mm, self._nodes_off + NODE.size * index)[4:])
+
+    def node_details(self, graph_id, video_ids):
+        """JSON body {"nodes": {video_id: detail}} for the ids that are crawled nodes of the graph."""
+        parts = []
+        for video_id in dict.fromkeys(video_ids):
+            detail = self.node_detail(graph_id, video_id)
+            if detail is not None:
+                parts.append(_encode(video_id) + b':' + detail)
+        return b'{"nodes":{' + b','.join(parts) + b'}}'
+
+    def node_index(self, graph_id, video_id):
+        """Global index of a crawled node of the graph, found by binary search, or None."""
+        record = self._find_graph(graph_id)
+        if record is None:
+            return None
+        key = video_id.encode('utf-8')
+        lo, hi = record[2], record[2] + record[3]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length = NODE.unpack_from(self._mm, self._nodes_off + NODE.size * mid)[:2]
+            # Memoryviews can't be ordered; ids are a few bytes, so compare copies
+            start = self._heap_off + offset
+            current = self._mm[start:start + length]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def successors(self, index):
+        start, end = struct.unpack_from('<II', self._mm, self._rows_off + 4 * index)
+        if start == end:
+            return ()
+        return struct.unpack_from(f'<{end - start}I', self._mm, self._edges_off + 4 * start)
+
+    def _bfs(self, start):
+        depth = {start: 0}
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            for target in self.successors(current):
+                if target not in depth:
+                    depth[target] = depth[current] + 1
+                    queue.append(target)
+        return depth
+
+    def reachable(self, graph_id, video_id):
+        """Video ids reachable from video_id (itself included) with their choice depth, or None if unknown."""
+        start = self.node_index(graph_id, video_id)
+        if start is None:
+            return None
+        return {self.node_id(index): d for index, d in self._bfs(start).items()}
+
+    def stats(self, graph_id):
+        """Structural summary of a graph, or None if there is no such graph."""
+        record = self._find_graph(graph_id)
+        if record is None:
+            return None
+        first, count, targets = record[2:5]
+        edges = endings = 0
+        for index in range(first, first + count):
+            n = len(self.successors(index))
+            edges += n
+            endings += not n
+        root = self.node_index(graph_id, graph_id)
+        depth = self._bfs(root) if root is not None else {}
+        crawled = [d for index, d in depth.items() if index < first + count]
+        return {
+            'nodes': count,
+            'edges': edges,
+            # Nodes without choices: endings, death screens, or bonus videos
+            'endings': endings,
+            # Linked videos that were never crawled (stop videos, other stories)
+            'uncrawled_targets': targets,
+            'reachable_from_root': len(crawled),
+            'max_depth': max(crawled, default=0)
+        }
+
+    def close(self):
+        """Unmap the file. Raises BufferError while views returned by this snapshot are still referenced."""
+        self._mm.close()
+
+
+def open_snapshot(path=GRAPHS_PATH):
+    """Return the GraphSnapshot matching the current graphs.json, building it if needed. None if there is no file."""
+    try:
+        signature = _signature(path)
+    except FileNotFoundError:
+        return None
+    filename = snapshot_path(path, signature)
+    current = _open.get(path)
+    if current is not None and current.filename == filename:
+        return current
+    with _open_lock:
+        current = _open.get(path)
+        if current is None or current.filename != filename:
+            while not os.path.exists(filename):
+                # Written by something that bypassed update_graphs (or before snapshots existed).
+                # Only trust the load if the file did not change while it was read.
+                data = load_graphs(path)
+                if _signature(path) == signature:
+                    filename = write_snapshot(data, path, signature)
+                    break
+                signature = _signature(path)
+                filename = snapshot_path(path, signature)
+            try:
+                snapshot = GraphSnapshot(filename)
+            except ValueError:
+                # Left by an older version of this module: rebuild it in the current format
+                os.remove(filename)
+                snapshot = GraphSnapshot(write_snapshot(load_graphs(path), path, signature))
+            # The previous map is closed when the last request using it lets go
+            current = _open[path] = snapshot
+    return current
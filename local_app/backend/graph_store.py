@@ -0,0 +1,347 @@
+"""
+Shared read-modify-write access to graphs.json.
+
+The crawl thread, the Flask handlers and the card backfill script all write
+the same file. update_graphs() takes a lock file, re-reads the current
+contents, applies a change and replaces the file atomically, so concurrent
+writers merge with each other instead of overwriting each other's work.
+
+Reads go through a per-process cache of the parsed file (and its serialized
+form), checked against the file's mtime/size/inode on every call, so a hot
+read is a stat() and a dict lookup. Writes made in this process update the
+cache directly; writes from other processes are picked up by the stat check.
+
+Each version also has a strong ETag (a hash of the served body) and gzip /
+brotli encodings of that body, stored next to the file as
+`graphs.json.<etag>.gz|.br` so every worker can reuse them.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only gzip is offered
+    brotli = None
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+GRAPHS_PATH = os.path.join(DATA_DIR, 'graphs.json')
+
+LOCK_TIMEOUT = 30
+# A lock older than this was left behind by a writer that crashed
+STALE_LOCK_SECONDS = 120
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+@contextmanager
+def graphs_lock(path=GRAPHS_PATH, timeout=LOCK_TIMEOUT):
+    """Hold an exclusive lock on `path` across threads and processes (not re-entrant)."""
+    lock_path = path + '.lock'
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f'could not lock {path}')
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def load_graphs(path=GRAPHS_PATH):
+    """Read graphs.json, returning an empty {'graphs': {}} document if it is missing or unreadable."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'graphs': {}}
+    if not isinstance(data, dict) or 'graphs' not in data:
+        return {'graphs': {}}
+    return data
+
+
+def write_graphs(data, path=GRAPHS_PATH):
+    """Write the whole document to a temp file and swap it in, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Windows refuses to replace a file another process is reading; retry briefly
+    for attempt in range(10):
+        try:
+            os.replace(tmp, path)
+            return
+        except PermissionError:
+            if attempt == 9:
+                raise
+            time.sleep(0.05)
+
+
+def _encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _etag(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def compress(body, encoding):
+    """Return `body` compressed with 'gzip' or 'br', or None if the encoding is unavailable."""
+    if encoding == 'gzip':
+        # mtime=0 keeps the output identical across workers for the same body
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return None
+
+
+_SUFFIXES = {'gzip': 'gz', 'br': 'br'}
+
+
+class CachedGraphs:
+    """The parsed contents of graphs.json at one file signature, plus its compact JSON encoding.
+
+    `data` is shared between threads and must be treated as read-only. The
+    body, ETag, compressed variants, per-graph bodies and wire-format bodies
+    are all computed on first use and then reused for every response.
+    """
+
+    def __init__(self, data, signature, path=None):
+        self.data = data
+        self.signature = signature
+        self.path = path
+        self._body = None
+        self._etag = None
+        self._variants = {}
+        self._graphs = {}
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = _encode(self.data)
+        return self._body
+
+    @property
+    def etag(self):
+        if self._etag is None:
+            self._etag = _etag(self.body)
+        return self._etag
+
+    def _variant_path(self, encoding):
+        return f'{self.path}.{self.etag}.{_SUFFIXES[encoding]}'
+
+    def compressed(self, encoding):
+        """Return the body compressed with `encoding`, from the file next to graphs.json when one exists."""
+        if encoding not in _SUFFIXES:
+            return None
+        if encoding not in self._variants:
+            variant = None
+            if self.path:
+                try:
+                    with open(self._variant_path(encoding), 'rb') as f:
+                        variant = f.read()
+                except OSError:
+                    pass
+            if variant is None:
+                variant = compress(self.body, encoding)
+                if variant is not None and self.path:
+                    _write_bytes(self._variant_path(encoding), variant)
+            self._variants[encoding] = variant
+        return self._variants[encoding]
+
+    def precompress(self):
+        """Write every available compressed variant and delete ones left from older versions."""
+        if not self.path:
+            return
+        keep = set()
+        for encoding in _SUFFIXES:
+            if self.compressed(encoding) is not None:
+                keep.add(self._variant_path(encoding))
+        pattern = glob.escape(self.path)
+        for suffix in _SUFFIXES.values():
+            for old in glob.glob(f'{pattern}.*.{suffix}'):
+                if old not in keep:
+                    try:
+                        os.remove(old)
+                    except OSError:
+                        pass
+
+    def _derived(self, key, build):
+        # (body, etag, {encoding: bytes}) for a value computed from `data`, or None if build() gives None
+        if key not in self._graphs:
+            value = build()
+            if value is None:
+                return None
+            body = _encode(value)
+            self._graphs[key] = (body, _etag(body), {})
+        return self._graphs[key]
+
+    def _derived_compressed(self, key, build, encoding):
+        # Derived variants are small and only kept in memory
+        found = self._derived(key, build)
+        if found is None:
+            return None
+        body, _, variants = found
+        if encoding not in variants:
+            variants[encoding] = compress(body, encoding)
+        return variants[encoding]
+
+    def _graph_builder(self, graph_id, fmt):
+        def build():
+            graph = self.data.get('graphs', {}).get(graph_id)
+            if graph is None or fmt == 'plain':
+                return graph
+            from wire_format import encode_graph
+            return encode_graph(graph, skeleton=fmt == 'skeleton')
+        return build
+
+    def graph(self, graph_id, fmt='plain'):
+        """Return (body, etag) for a single graph, or None if there is no such graph.
+
+        fmt 'compact' or 'skeleton' gives the body in a wire format of wire_format.py.
+        """
+        found = self._derived(('graph', graph_id, fmt), self._graph_builder(graph_id, fmt))
+        return found[:2] if found is not None else None
+
+    def graph_compressed(self, graph_id, encoding, fmt='plain'):
+        return self._derived_compressed(('graph', graph_id, fmt), self._graph_builder(graph_id, fmt), encoding)
+
+    def _wire_builder(self, fmt):
+        def build():
+            from wire_format import encode_graphs
+            return encode_graphs(self.data, skeleton=fmt == 'skeleton')
+        return build
+
+    def wire(self, fmt='compact'):
+        """(body, etag) of the whole document in wire format 'compact' or 'skeleton'."""
+        return self._derived(('wire', fmt), self._wire_builder(fmt))[:2]
+
+    def wire_compressed(self, fmt, encoding):
+        return self._derived_compressed(('wire', fmt), self._wire_builder(fmt), encoding)
+
+
+def _write_bytes(path, content):
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except OSError:
+        # Only a cache: the next reader computes it again
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def _signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def cached_graphs(path=GRAPHS_PATH):
+    """Return the CachedGraphs for the file's current contents, or None if there is no file."""
+    try:
+        signature = _signature(path)
+    except FileNotFoundError:
+        return None
+    entry = _cache.get(path)
+    if entry is not None and entry.signature == signature:
+        return entry
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is None or entry.signature != signature:
+            # If the file changes again while loading, its new signature won't match and it is reloaded
+            entry = CachedGraphs(load_graphs(path), signature, path)
+            _cache[path] = entry
+    return entry
+
+
+def read_graphs(path=GRAPHS_PATH):
+    """Return the parsed file from the cache. Read-only: change it with update_graphs()."""
+    entry = cached_graphs(path)
+    return entry.data if entry is not None else {'graphs': {}}
+
+
+def _log_changes(old, new, path):
+    # Bump each changed graph's version and log the ops, before the file is written so that a
+    # reader who sees the new version can always find its entry
+    from graph_changes import bump_versions, record
+    changes = bump_versions(old, new)
+    try:
+        record(path, changes)
+    except Exception:
+        # Without the entry, clients behind this version just get the full graph
+        pass
+
+
+def update_graphs(fn, path=GRAPHS_PATH):
+    """Apply fn(data) to the current file contents under the lock and save them.
+
+    fn gets a private copy, so readers of the cached version are unaffected,
+    and the result becomes the new cached version without re-reading the file.
+    fn may put the caller's own objects into data (a crawl stores its live
+    nodes); the cached version is a copy of the result, so later changes to
+    them are not seen by readers and show up in the next update's diff.
+    Returns whatever fn returns. Keep fn fast (no network) - other writers wait on it.
+    """
+    with graphs_lock(path):
+        entry = cached_graphs(path)
+        data = json.loads(entry.body) if entry is not None else {'graphs': {}}
+        result = fn(data)
+        _log_changes(entry.data if entry is not None else {'graphs': {}}, data, path)
+        body = _encode(data)
+        data = json.loads(body)
+        write_graphs(data, path)
+        entry = CachedGraphs(data, _signature(path), path)
+        entry._body = body
+        with _cache_lock:
+            _cache[path] = entry
+    # Outside the lock: variant files are named by ETag, so other writers can't clash
+    _publish(entry)
+    return result
+
+
+def _publish(entry):
+    # Compressed variants and the binary snapshot of a freshly written version
+    entry.precompress()
+    try:
+        from graph_snapshot import write_snapshot
+        write_snapshot(entry.data, entry.path, entry.signature)
+    except OSError:
+        # Readers build a missing snapshot themselves
+        pass
+
+
+def publish_graphs(path=GRAPHS_PATH):
+    """Load a file written without update_graphs() (see graph_stream) and build its variants and snapshot."""
+    entry = cached_graphs(path)
+    if entry is not None:
+        _publish(entry)
@@ -0,0 +1,425 @@
+"""
+Incremental reader/writer for graphs.json.
+
+Walks the file one graph or one node at a time instead of json.load-ing the
+whole thing, so memory is bounded by the largest node (or graph) rather than
+by the file:
+
+    for graph_id, node_id, node in iter_nodes(path): ...
+    for graph_id, graph in iter_graphs(path): ...
+
+GraphsWriter produces the same layout as json.dump(..., indent=2) into a temp
+file and swaps it in when done, and transform_nodes/transform_graphs stream a
+file through a callback. Both hold graph_store's lock on the output file while
+they run, so they don't race update_graphs or each other, and like
+update_graphs they bump the `version` of every graph they change and log its
+ops (graph_changes), then build the new file's compressed variants and
+snapshot.
+"""
+import copy
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from graph_changes import diff_graph, record
+from graph_store import STALE_LOCK_SECONDS, graphs_lock, publish_graphs
+
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Pull parser over a text file that decodes one JSON value at a time."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=CHUNK_SIZE):
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what was already consumed so the buffer never holds more than one value
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise ValueError(f'expected {ch!r} at offset {self.pos} of buffer, got {self.peek()!r}')
+        self.pos += 1
+
+    def value(self):
+        """Decode the complete JSON value at the cursor."""
+        self.peek()
+        size = CHUNK_SIZE
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof or not self._fill(size):
+                    self.pos = end
+                    return value
+                continue
+            except json.JSONDecodeError:
+                if self.eof or not self._fill(size):
+                    raise
+            size *= 2
+
+    def members(self):
+        """Yield the keys of the object at the cursor.
+
+        The caller must consume each member's value (with value() or a nested
+        members()) before asking for the next key.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            c = self.peek()
+            self.pos += 1
+            if c == '}':
+                return
+            if c != ',':
+                raise ValueError(f'expected "," or "}}" after member {key!r}, got {c!r}')
+
+
+def iter_events(path, skip_nodes=False):
+    """Yield (kind, graph_id, key, value) tuples describing graphs.json in file order.
+
+    kinds: 'top' (top-level key other than graphs), 'graphs', 'graph',
+    'field', 'nodes', 'node', 'nodes_end', 'graph_end', 'graphs_end'.
+    With skip_nodes, node values are decoded and dropped without being yielded.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        r = _Reader(f)
+        for top_key in r.members():
+            if top_key != 'graphs':
+                yield ('top', None, top_key, r.value())
+                continue
+            yield ('graphs', None, None, None)
+            for graph_id in r.members():
+                yield ('graph', graph_id, None, None)
+                for key in r.members():
+                    if key != 'nodes':
+                        yield ('field', graph_id, key, r.value())
+                        continue
+                    yield ('nodes', graph_id, None, None)
+                    for node_id in r.members():
+                        node = r.value()
+                        if not skip_nodes:
+                            yield ('node', graph_id, node_id, node)
+                    yield ('nodes_end', graph_id, None, None)
+                yield ('graph_end', graph_id, None, None)
+            yield ('graphs_end', None, None, None)
+
+
+def iter_nodes(path):
+    """Yield (graph_id, node_id, node) for every node, one at a time."""
+    for kind, graph_id, key, value in iter_events(path):
+        if kind == 'node':
+            yield graph_id, key, value
+
+
+def iter_graphs(path):
+    """Yield (graph_id, graph) with only one graph held in memory at a time."""
+    graph = None
+    for kind, graph_id, key, value in iter_events(path):
+        if kind == 'graph':
+            graph = {}
+        elif kind == 'field':
+            graph[key] = value
+        elif kind == 'nodes':
+            graph['nodes'] = {}
+        elif kind == 'node':
+            graph['nodes'][key] = value
+        elif kind == 'graph_end':
+            yield graph_id, graph
+            graph = None
+
+
+def read_graph_fields(path):
+    """Return {graph_id: graph-level fields} without keeping any nodes."""
+    fields = {}
+    for kind, graph_id, key, value in iter_events(path, skip_nodes=True):
+        if kind == 'graph':
+            fields[graph_id] = {}
+        elif kind == 'field':
+            fields[graph_id][key] = value
+    return fields
+
+
+def _dump(value, level):
+    # json.dumps with indent=2, shifted right so it nests at `level` spaces
+    return json.dumps(value, ensure_ascii=False, indent=2).replace('\n', '\n' + ' ' * level)
+
+
+class GraphsWriter:
+    """Write graphs.json incrementally, in the same layout as json.dump(indent=2).
+
+    Holds graphs_lock(path) from entry to exit. Output goes to a unique temp
+    file next to `path` and replaces it on a clean exit, so readers never see
+    a half-written file. Call write_event() with the tuples produced by
+    iter_events(), or use write_graph() for whole graphs; call log_changes()
+    for each changed graph before writing its version field. On a clean exit
+    the new file is published (graph_store.publish_graphs), which loads it once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = None
+        self.f = None
+        self._lock = None
+        self._touched = 0
+        # One flag per open object: True until its first member is written
+        self._first = []
+
+    def __enter__(self):
+        self._lock = graphs_lock(self.path)
+        self._lock.__enter__()
+        self._touched = time.time()
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, self.tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.', suffix='.tmp', dir=directory)
+            self.f = os.fdopen(fd, 'w', encoding='utf-8')
+        except BaseException:
+            self._lock.__exit__(None, None, None)
+            raise
+        self.f.write('{')
+        self._first = [True]
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            try:
+                if exc_type is None:
+                    self._close()
+            finally:
+                self.f.close()
+            if exc_type is None:
+                os.replace(self.tmp_path, self.path)
+            else:
+                try:
+                    os.remove(self.tmp_path)
+                except OSError:
+                    pass
+        finally:
+            self._lock.__exit__(None, None, None)
+        if exc_type is None:
+            publish_graphs(self.path)
+        return False
+
+    def log_changes(self, graph_id, version, ops):
+        """Log `ops` (from diff_graph) for a graph at `version` and return its new version.
+
+        Logged as soon as the graph is done, like update_graphs does before its
+        write: entries newer than the file are ignored by changes_since and
+        replaced by the next write if this one is abandoned.
+        """
+        if not ops:
+            return version
+        record(self.path, {graph_id: (version + 1, ops)})
+        return version + 1
+
+    def _keep_lock(self):
+        # A long rewrite must not look like a stale lock to other writers
+        now = time.time()
+        if now - self._touched > STALE_LOCK_SECONDS / 4:
+            self._touched = now
+            try:
+                os.utime(self.path + '.lock')
+            except OSError:
+                pass
+
+    def _member(self, key):
+        self._keep_lock()
+        level = 2 * len(self._first)
+        self.f.write(('\n' if self._first[-1] else ',\n') + ' ' * level + json.dumps(key, ensure_ascii=False) + ': ')
+        self._first[-1] = False
+        return level
+
+    def _open(self, key):
+        self._member(key)
+        self.f.write('{')
+        self._first.append(True)
+
+    def _close(self):
+        empty = self._first.pop()
+        self.f.write('}' if empty else '\n' + ' ' * (2 * len(self._first)) + '}')
+
+    def write_event(self, event):
+        kind, graph_id, key, value = event
+        if kind in ('top', 'field', 'node'):
+            level = self._member(key)
+            self.f.write(_dump(value, level))
+        elif kind == 'graphs':
+            self._open('graphs')
+        elif kind == 'graph':
+            self._open(graph_id)
+        elif kind == 'nodes':
+            self._open('nodes')
+        elif kind in ('nodes_end', 'graph_end', 'graphs_end'):
+            self._close()
+
+    def write_graph(self, graph_id, graph):
+        self._open(graph_id)
+        for key, value in graph.items():
+            if key == 'nodes' and isinstance(value, dict):
+                self._open('nodes')
+                for node_id, node in value.items():
+                    self.write_event(('node', graph_id, node_id, node))
+                self._close()
+            else:
+                self.write_event(('field', graph_id, key, value))
+        self._close()
+
+
+def transform_nodes(path, fn, out_path=None):
+    """Stream `path` through fn(graph_id, node_id, node, graph_fields).
+
+    fn mutates the node in place and returns True when it changed it.
+    `graph_fields` are the graph-level fields (trailer/bonus ids etc.), read
+    in a first pass because they follow the nodes in the file. The file is
+    only rewritten when something changed. Returns the number of changed nodes.
+
+    A graph's `version` field is written after its nodes, once it is known
+    whether any of them changed.
+    """
+    changed = 0
+    try:
+        with GraphsWriter(out_path or path) as w:
+            # Read under the writer's lock, so both passes see the same file
+            fields = read_graph_fields(path)
+            ops = []
+            for event in iter_events(path):
+                kind, graph_id, key, value = event
+                if kind == 'graph':
+                    ops = []
+                elif kind == 'field' and key == 'version':
+                    continue
+                elif kind == 'node':
+                    before = copy.deepcopy(value)
+                    if fn(graph_id, key, value, fields.get(graph_id, {})):
+                        changed += 1
+                        ops.extend(diff_graph({'nodes': {key: before}}, {'nodes': {key: value}}))
+                elif kind == 'graph_end':
+                    version = fields.get(graph_id, {}).get('version')
+                    if ops or version is not None:
+                        w.write_event(('field', graph_id, 'version', w.log_changes(graph_id, version or 0, ops)))
+                w.write_event(event)
+            if not changed and not out_path:
+                # Nothing to save - abandon the temp file instead of rewriting an identical one
+                raise _Unchanged()
+    except _Unchanged:
+        pass
+    return changed
+
+
+class _Unchanged(Exception):
+    pass
+
+
+def _apply(fn, graph_id, graph):
+    # Diffed next to fn, so a pool worker sends back the ops rather than a second copy of the graph
+    before = copy.deepcopy(graph)
+    result = fn(graph_id, graph)
+    return graph_id, graph, result, diff_graph(before, graph)
+
+
+def transform_graphs(path, fn, out_path=None, workers=None, on_graph=None, on_top=None):
+    """Stream `path` one graph at a time through fn(graph_id, graph).
+
+    fn mutates the graph in place and returns a truthy value when it changed
+    it. With `workers` other than 1 graphs are processed in a process pool (fn
+    must be picklable) while a bounded number are in flight; output keeps file
+    order. on_graph(graph_id, result) is called with fn's return value as each
+    graph is written. Every graph whose contents changed gets a new version
+    and change log entry. With on_top, on_top(fields) is called after the
+    last graph with the file's other top-level fields and returns the ones to
+    write; they then follow "graphs" in the output. Returns the number of
+    changed graphs; the file is only rewritten if that is > 0 or on_top
+    changed the top-level fields.
+    """
+    changed = 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+    pending = deque()
+
+    def drain(w, limit):
+        nonlocal changed
+        while len(pending) > limit:
+            graph_id, graph, ops, did_change = pending.popleft()
+            if pool:
+                graph_id, graph, did_change, ops = did_change.result()
+            if ops:
+                graph['version'] = w.log_changes(graph_id, graph.get('version', 0), ops)
+            if did_change:
+                changed += 1
+            if on_graph:
+                on_graph(graph_id, did_change)
+            w.write_graph(graph_id, graph)
+
+    try:
+        try:
+            with GraphsWriter(out_path or path) as w:
+                graph = None
+                top = {}
+                for event in iter_events(path):
+                    kind, graph_id, key, value = event
+                    if kind == 'top' and on_top:
+                        # Held back: on_top may depend on the graphs, which can come after them
+                        top[key] = value
+                    elif kind == 'graph':
+                        graph = {}
+                    elif kind == 'field':
+                        graph[key] = value
+                    elif kind == 'nodes':
+                        graph['nodes'] = {}
+                    elif kind == 'node':
+                        graph['nodes'][key] = value
+                    elif kind == 'nodes_end':
+                        pass
+                    elif kind == 'graph_end':
+                        if pool:
+                            pending.append((graph_id, None, None, pool.submit(_apply, fn, graph_id, graph)))
+                        else:
+                            _, graph, did_change, ops = _apply(fn, graph_id, graph)
+                            pending.append((graph_id, graph, ops, did_change))
+                        graph = None
+                        drain(w, max_in_flight)
+                    else:
+                        if kind == 'graphs_end':
+                            drain(w, 0)
+                        w.write_event(event)
+                new_top = on_top(dict(top)) if on_top else top
+                for key, value in new_top.items():
+                    w.write_event(('top', None, key, value))
+                if not changed and not out_path and new_top == top:
+                    raise _Unchanged()
+        except _Unchanged:
+            pass
+    finally:
+        if pool:
+            pool.shutdown()
+    return changed
@@ -0,0 +1,200 @@
+"""
+Bulk ingestion: crawl many stories in one run into a single graphs.json.
+
+    python ingest.py manifest.json [--out PATH] [--stories N] [--fetches N] [--parse-workers N]
+
+The manifest is a JSON list of stories (or {"stories": [...]}) with the same
+fields as the /crawl form; stop_urls and bonus_urls may be comma-separated
+strings or lists:
+
+    [{"url": "https://youtu.be/...", "part2_url": "", "stop_urls": "",
+      "trailer_url": "", "bonus_urls": "", "max_nodes": 1000}]
+
+Up to --stories stories are crawled at once. Every video is fetched at most
+once per run - videos shared between stories come from the run's cache, and
+videos fetched recently by any crawl come from video_store. A crawl still
+walks its story depth-first, but prefetches the links of every node it
+reaches, so several pages of one story are downloaded at the same time and
+--fetches requests are in flight across all stories. Fetched pages are
+parsed by --parse-workers processes (default: one per core, 1 parses in
+this process) through a pipeline.VideoPipeline. Each story is saved through
+graph_store as soon as it finishes, so an interrupted run keeps what it
+already crawled. Flask is not needed; app.py offers the same thing as
+POST /ingest.
+"""
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from crawler import crawl_story, graph_record, save_graph, GRAPHS_PATH
+from graph_store import read_graphs
+from pipeline import VideoPipeline
+from youtube_api import download_video
+from yt_parser import extract_video_id
+
+MAX_STORIES = 2
+MAX_FETCHES = 4
+# Pause after each fetch, taken by the fetching thread so the overall request rate stays bounded
+FETCH_DELAY = 0.2
+
+
+def _ids(value):
+    if isinstance(value, str):
+        value = value.split(',')
+    ids = []
+    for url in value or []:
+        video_id = extract_video_id(url.strip()) if url.strip() else None
+        if video_id:
+            ids.append(video_id)
+    return ids
+
+
+def parse_story(spec):
+    """Turn a manifest entry into crawl arguments. Raises ValueError for an unusable entry."""
+    root_id = extract_video_id(spec.get('url') or '')
+    if not root_id:
+        raise ValueError(f"unsupported url: {spec.get('url')!r}")
+
+    # 'none' means explicitly no trailer, empty means it can be added later
+    trailer_url = (spec.get('trailer_url') or '').strip()
+    if trailer_url.lower() == 'none':
+        trailer_id = 'none'
+    else:
+        trailer_id = extract_video_id(trailer_url) if trailer_url else None
+
+    part2_url = spec.get('part2_url') or ''
+    return {
+        'root_id': root_id,
+        'part2_id': extract_video_id(part2_url) if part2_url else None,
+        'stop_video_ids': _ids(spec.get('stop_urls')),
+        'trailer_video_id': trailer_id,
+        'bonus_video_ids': _ids(spec.get('bonus_urls')),
+        'max_nodes': int(spec.get('max_nodes') or 1000)
+    }
+
+
+def load_manifest(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest.get('stories', [])
+    return [parse_story(spec) for spec in manifest]
+
+
+def _ingest_story(story, pipeline, path):
+    requested = set()
+
+    def prefetch(video_ids):
+        # Fetch the links a node leads to while the crawl works depth-first, but never
+        # start more videos than the story may have nodes
+        new = [vid for vid in dict.fromkeys(video_ids) if vid not in requested]
+        new = new[:max(0, story['max_nodes'] - len(requested))]
+        requested.update(new)
+        pipeline.prefetch(new)
+
+    nodes = crawl_story(
+        story['root_id'],
+        max_nodes=story['max_nodes'],
+        stop_video_ids=story['stop_video_ids'],
+        trailer_video_id=story['trailer_video_id'],
+        bonus_video_ids=story['bonus_video_ids'],
+        # Videos already in the shared store (from any graph) never enter the pipeline
+        fetch=pipeline.get_video,
+        prefetch=prefetch,
+        delay=0
+    )
+    # A refresh should not undo a hidden bonus button set by hand
+    existing = read_graphs(path).get('graphs', {}).get(story['root_id'], {})
+    graph = graph_record(
+        nodes, story['root_id'],
+        part2_id=story['part2_id'],
+        stop_video_ids=story['stop_video_ids'],
+        trailer_video_id=story['trailer_video_id'],
+        bonus_video_ids=story['bonus_video_ids'],
+        hide_bonus_button=existing.get('hide_bonus_button', False)
+    )
+    save_graph(story['root_id'], graph, path)
+    return len(nodes)
+
+
+def ingest(stories, path=GRAPHS_PATH, max_stories=MAX_STORIES, max_fetches=MAX_FETCHES, parse_workers=None,
+           on_story=None, download=download_video):
+    """Crawl `stories` (from parse_story) and save each into `path`.
+
+    on_story(root_id, node_count, error) is called as each one finishes.
+    download is the pipeline's fetch stage (see VideoPipeline). Returns a summary dict.
+    """
+    # The same root twice in a manifest is crawled once
+    unique = {}
+    for story in stories:
+        unique.setdefault(story['root_id'], story)
+
+    results = {}
+    with VideoPipeline(fetchers=max_fetches, parse_workers=parse_workers, delay=FETCH_DELAY, download=download) as pipeline, \
+            ThreadPoolExecutor(max_workers=max(1, max_stories)) as pool:
+        futures = {pool.submit(_ingest_story, story, pipeline, path): root_id for root_id, story in unique.items()}
+        for future in as_completed(futures):
+            root_id = futures[future]
+            try:
+                count, error = future.result(), None
+            except Exception as e:
+                count, error = 0, str(e)
+            results[root_id] = {'nodes': count, 'error': error}
+            if on_story:
+                on_story(root_id, count, error)
+
+    return {
+        'stories': results,
+        'videos_fetched': pipeline.fetched,
+        'cache_hits': pipeline.hits
+    }
+
+
+def main(argv):
+    args = []
+    path = GRAPHS_PATH
+    max_stories = MAX_STORIES
+    max_fetches = MAX_FETCHES
+    parse_workers = None
+    i = 0
+    while i < len(argv):
+        if argv[i] in ('--out', '--stories', '--fetches', '--parse-workers') and i + 1 < len(argv):
+            value = argv[i + 1]
+            if argv[i] == '--out':
+                path = value
+            elif argv[i] == '--stories':
+                max_stories = int(value)
+            elif argv[i] == '--fetches':
+                max_fetches = int(value)
+            else:
+                parse_workers = int(value)
+            i += 2
+            continue
+        args.append(argv[i])
+        i += 1
+
+    if not args:
+        print(__doc__.strip())
+        return 2
+
+    try:
+        stories = load_manifest(args[0])
+    except (OSError, ValueError) as e:
+        print(f'Bad manifest: {e}')
+        return 2
+
+    print(f'Ingesting {len(stories)} stories into {path}')
+
+    def report(root_id, count, error):
+        print(f'{root_id}: ' + (f'failed: {error}' if error else f'{count} nodes'))
+
+    summary = ingest(stories, path, max_stories=max_stories, max_fetches=max_fetches, parse_workers=parse_workers,
+                     on_story=report)
+    failed = sum(1 for r in summary['stories'].values() if r['error'])
+    print(f"Done: {len(summary['stories']) - failed} stories saved, {failed} failed, "
+          f"{summary['videos_fetched']} videos fetched, {summary['cache_hits']} served from cache")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,104 @@
+"""
+Background jobs for graph edits that need live YouTube fetches.
+
+A handler calls submit() and answers 202 with the job id straight away; the
+job runs on a small thread pool in the same process, and its state is kept
+in state.db so GET /jobs/<id> works from any worker.
+
+Jobs only live as long as the process that queued them. While it runs, a
+heartbeat thread keeps their updated_at fresh; a queued or running job whose
+heartbeat stops (the worker was recycled or crashed) is reported as an error
+once it is state_store.STALE_SECONDS old, like a dead crawl.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import state_store
+
+JOB_WORKERS = 2
+FETCH_WORKERS = 8
+
+# Well inside state_store.STALE_SECONDS, so a live job is never taken for a lost one
+HEARTBEAT_SECONDS = 30
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+
+# Ids of this process's queued and running jobs
+_active = set()
+_active_lock = threading.Lock()
+_heartbeat = None
+
+
+def _beat():
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        with _active_lock:
+            job_ids = list(_active)
+        if job_ids:
+            try:
+                state_store.touch_jobs(job_ids)
+            except Exception:
+                # Try again on the next beat; a job is only lost after several missed ones
+                pass
+
+
+def _start_heartbeat():
+    # Started on first use rather than at import, so it runs in the worker, not a pre-fork parent
+    global _heartbeat
+    with _active_lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_beat, name='job-heartbeat', daemon=True)
+            _heartbeat.start()
+
+
+def _run(job_id, fn):
+    try:
+        state_store.update_job(job_id, 'running')
+        try:
+            result = fn()
+        except Exception as e:
+            state_store.update_job(job_id, 'error', error=str(e))
+            return
+        state_store.update_job(job_id, 'done', result=result)
+    finally:
+        with _active_lock:
+            _active.discard(job_id)
+
+
+def submit(kind, params, fn):
+    """Queue fn() as a job and return its id. fn's return value (JSON-able) becomes the job result."""
+    _start_heartbeat()
+    job_id = uuid.uuid4().hex
+    state_store.create_job(job_id, kind, params)
+    with _active_lock:
+        _active.add(job_id)
+    _executor.submit(_run, job_id, fn)
+    return job_id
+
+
+def get_job(job_id):
+    return state_store.get_job(job_id)
+
+
+def unfinished(kind):
+    """Params of the `kind` jobs still queued or running in a live worker."""
+    return state_store.unfinished_jobs(kind)
+
+
+def fetch_videos(video_ids):
+    """Fetch several videos concurrently. Returns {video_id: video} for the ones that succeeded."""
+    # Through the shared store: a video another graph already has is not fetched again
+    from video_store import get_video
+
+    def fetch(video_id):
+        try:
+            return video_id, get_video(video_id)
+        except Exception:
+            return video_id, None
+
+    if not video_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(video_ids))) as pool:
+        return {vid: video for vid, video in pool.map(fetch, video_ids) if video is not None}
@@ -0,0 +1,254 @@
+"""
+Versioned data migrations for graphs.json.
+
+Every graph records the schema version it has been migrated to in its
+`schema_version` field, and the file's top-level `schema_version` is the
+version all graphs have reached. MIGRATIONS lists the steps in order; each
+step upgrades one graph in place and returns the number of nodes it changed.
+Steps must be safe to run again on data that already has the change.
+
+    python migrations.py [--dry-run] [--workers N] [--path PATH]
+
+Graphs are migrated in a process pool. Each migrated graph is checkpointed to
+data/migrations/<file>/ as soon as it finishes, with a hash of the graph it
+was made from, so an interrupted run resumes where it stopped. A checkpoint
+is only reused for the same file and an unchanged source graph. Only graph
+ids and source hashes are kept in memory: at the end the file is streamed
+through graph_stream.transform_graphs, which reads each migrated graph back
+from its checkpoint, skips any graph that changed while the run was going
+(it stays pending for the next run) and logs the changes like
+update_graphs. Then the checkpoints are removed.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from yt_parser import clean_description
+from graph_stream import iter_events, iter_graphs, transform_graphs
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+GRAPHS_PATH = os.path.join(DATA_DIR, 'graphs.json')
+CHECKPOINT_DIR = os.path.join(DATA_DIR, 'migrations')
+
+
+def add_extra_clean_descriptions(graph):
+    """Add clean_description to trailer and bonus nodes created before it existed."""
+    nodes = graph.get('nodes', {})
+    extra_ids = list(graph.get('bonus_video_ids') or [])
+    trailer_id = graph.get('trailer_video_id')
+    if trailer_id and trailer_id != 'none':
+        extra_ids.append(trailer_id)
+
+    changed = 0
+    for node_id in extra_ids:
+        node = nodes.get(node_id)
+        if node is not None and 'clean_description' not in node:
+            node['clean_description'] = clean_description(node.get('description', ''))
+            changed += 1
+    return changed
+
+
+# (version, description, step) - append new steps, never reorder or renumber
+MIGRATIONS = [
+    (1, 'clean_description for trailer and bonus nodes', add_extra_clean_descriptions),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate_graph(graph_id, graph):
+    """Run every pending step on one graph. Returns (graph_id, graph, [(version, changed), ...])."""
+    applied = []
+    current = graph.get('schema_version', 0)
+    for version, _, step in MIGRATIONS:
+        if version <= current:
+            continue
+        applied.append((version, step(graph)))
+        graph['schema_version'] = version
+    return graph_id, graph, applied
+
+
+def graph_hash(graph):
+    """Content hash of one graph, independent of key order."""
+    # `version` is left out: update_graphs adds it to graphs it didn't change
+    content = {key: value for key, value in graph.items() if key != 'version'}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _checkpoint_dir(path):
+    # One directory per graphs file, so runs against different files never share checkpoints
+    return os.path.join(CHECKPOINT_DIR, hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:16])
+
+
+def _checkpoint_path(path, graph_id):
+    return os.path.join(_checkpoint_dir(path), f'{graph_id}.json')
+
+
+def _load_checkpoint(path, graph_id, source_hash):
+    try:
+        with open(_checkpoint_path(path, graph_id), 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    # Checkpoints from an older migration list, another file or a since-edited graph are redone
+    if (checkpoint.get('schema_version') != SCHEMA_VERSION or checkpoint.get('source') != os.path.abspath(path)
+            or checkpoint.get('source_hash') != source_hash):
+        return None
+    return checkpoint['graph']
+
+
+def _save_checkpoint(path, graph_id, source_hash, graph):
+    os.makedirs(_checkpoint_dir(path), exist_ok=True)
+    target = _checkpoint_path(path, graph_id)
+    tmp = target + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'schema_version': SCHEMA_VERSION, 'source': os.path.abspath(path), 'source_hash': source_hash,
+                   'graph': graph}, f, ensure_ascii=False)
+    os.replace(tmp, target)
+
+
+def _describe(applied):
+    return ', '.join(f'v{version}: {changed} nodes' for version, changed in applied) or 'nothing to do'
+
+
+def _pending_graphs(path):
+    """Return ids of graphs below SCHEMA_VERSION and the file's top-level version."""
+    pending = []
+    file_version = 0
+    for kind, graph_id, key, value in iter_events(path, skip_nodes=True):
+        if kind == 'top' and key == 'schema_version':
+            file_version = value
+        elif kind == 'graph':
+            pending.append(graph_id)
+        elif kind == 'field' and key == 'schema_version' and value >= SCHEMA_VERSION:
+            pending.remove(graph_id)
+    return pending, file_version
+
+
+def _write_migrated(path, sources):
+    """Swap migrated graphs into `path`, one at a time. Returns the ids of the graphs swapped in.
+
+    sources maps graph_id -> hash of the graph it was made from; the migrated
+    graph is read from its checkpoint. A graph whose current contents no
+    longer match that hash was changed by someone else meanwhile and is left
+    for the next run. The top-level version is raised once every graph has
+    reached it.
+    """
+    swapped = []
+    behind = []
+
+    def swap(graph_id, graph):
+        source_hash = sources.get(graph_id)
+        migrated = None
+        if source_hash is not None and graph_hash(graph) == source_hash:
+            migrated = _load_checkpoint(path, graph_id, source_hash)
+        if migrated is None:
+            if graph.get('schema_version', 0) < SCHEMA_VERSION:
+                behind.append(graph_id)
+            return False
+        # The checkpoint holds the version the run started from; keep the current one
+        if 'version' in graph:
+            migrated['version'] = graph['version']
+        graph.clear()
+        graph.update(migrated)
+        swapped.append(graph_id)
+        return True
+
+    def top(fields):
+        if not behind:
+            fields['schema_version'] = SCHEMA_VERSION
+        return fields
+
+    # In this process: swap() only reads a checkpoint, and a closure can't go to a pool
+    transform_graphs(path, swap, workers=1, on_top=top)
+    return swapped
+
+
+def run_migrations(path=GRAPHS_PATH, dry_run=False, workers=None):
+    """Bring every graph in `path` up to SCHEMA_VERSION. Returns the number of graphs migrated."""
+    pending, file_version = _pending_graphs(path)
+    if not pending:
+        print(f'All graphs are at schema version {SCHEMA_VERSION}')
+        if file_version != SCHEMA_VERSION and not dry_run:
+            _write_migrated(path, {})
+        return 0
+
+    print(f'{len(pending)} graphs to migrate to schema version {SCHEMA_VERSION}' + (' (dry run)' if dry_run else ''))
+
+    # graph_id -> hash of the graph it was migrated from; the graphs themselves are in the checkpoints
+    sources = {}
+    hashes = {}
+    done = 0
+
+    def report(graph_id, graph, applied):
+        nonlocal done
+        done += 1
+        print(f'[{done}/{len(pending)}] {graph_id}: {_describe(applied)}')
+        if not dry_run:
+            _save_checkpoint(path, graph_id, hashes[graph_id], graph)
+            sources[graph_id] = hashes[graph_id]
+
+    def todo():
+        nonlocal done
+        wanted = set(pending)
+        for graph_id, graph in iter_graphs(path):
+            if graph_id not in wanted:
+                continue
+            hashes[graph_id] = graph_hash(graph)
+            resumed = None if dry_run else _load_checkpoint(path, graph_id, hashes[graph_id])
+            if resumed is None:
+                yield graph_id, graph
+                continue
+            done += 1
+            sources[graph_id] = hashes[graph_id]
+            print(f'[{done}/{len(pending)}] {graph_id}: resumed from checkpoint')
+
+    if workers == 1:
+        for graph_id, graph in todo():
+            report(*migrate_graph(graph_id, graph))
+    else:
+        max_in_flight = 2 * (workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = deque()
+            for graph_id, graph in todo():
+                futures.append(pool.submit(migrate_graph, graph_id, graph))
+                while len(futures) > max_in_flight:
+                    report(*futures.popleft().result())
+            while futures:
+                report(*futures.popleft().result())
+
+    if dry_run:
+        return done
+
+    swapped = _write_migrated(path, sources)
+    # Checkpoints of graphs that changed meanwhile are stale as well
+    shutil.rmtree(_checkpoint_dir(path), ignore_errors=True)
+    skipped = len(sources) - len(swapped)
+    print(f'Migrated {len(swapped)} graphs to schema version {SCHEMA_VERSION}'
+          + (f'; {skipped} changed during the run and are left for the next one' if skipped else ''))
+    return len(swapped)
+
+
+def main(argv):
+    dry_run = '--dry-run' in argv
+    workers = None
+    path = GRAPHS_PATH
+    for i, arg in enumerate(argv):
+        if arg == '--workers' and i + 1 < len(argv):
+            workers = int(argv[i + 1])
+        elif arg == '--path' and i + 1 < len(argv):
+            path = argv[i + 1]
+
+    if not os.path.exists(path):
+        print('graphs.json not found')
+        return
+
+    run_migrations(path, dry_run=dry_run, workers=workers)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
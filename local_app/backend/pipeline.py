@@ -0,0 +1,216 @@
+"""
+Fetch -> parse -> enrich pipeline for bulk crawls.
+
+Once fetching is concurrent, the CPU half of get_video (json.loads of
+ytInitialData, regex scans, unescaping) and parse_description hold the GIL
+and cap a crawl at one core. VideoPipeline runs them as stages joined by
+bounded queues:
+
+    fetch    `fetchers` threads download watch pages (youtube_api.download_video)
+             and pass on the raw bytes
+    parse    a process pool turns each page into a compact record: the video
+             dict with its parsed 'links' (parse_record)
+    enrich   one thread updates the failure ledger and saves the record to
+             video_store, then hands it to whoever asked for the video
+
+A full queue blocks the stage feeding it, so a slow stage holds back the ones
+before it instead of piling up pages in memory. parse_workers=None uses one
+process per core and parse_workers=1 parses in a thread of this process, as
+with --workers in tools/validate_graphs.py.
+
+A crawl asks for one video at a time, so on its own it keeps a single page
+in flight. prefetch() lets it name the videos it will ask for next (the
+links it just found), which fills the fetch stage up to `fetchers`.
+ingest.py crawls through a pipeline; tools/bench_pipeline.py measures it
+on synthetic pages. The speedup from more parse processes has so far only
+been checked on a single-core machine, where there is none; run the
+benchmark on the target machine before relying on parse_workers > 1.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import failures
+import video_store
+from youtube_api import download_video, parse_watch_page
+from yt_parser import parse_description
+
+FETCHERS = 4
+# Downloaded pages waiting to be parsed; a watch page is up to a few hundred KB
+QUEUE_SIZE = 16
+
+_STOP = object()
+
+
+def parse_record(video_id, raw):
+    """Parse stage: a download_video() result -> video dict with 'links'. Runs in a worker process."""
+    video = parse_watch_page(video_id, raw['page'], raw.get('title'), raw.get('encoding') or 'utf-8')
+    video['links'] = parse_description(video.get('description', ''))
+    return video
+
+
+def store_record(video_id, video, error):
+    """Default enrich stage: record the outcome in the failure ledger and store the video"""
+    if error is not None:
+        failures.record_failure(video_id, error)
+        raise error
+    return video_store.save_fetched(video_id, video)
+
+
+class VideoPipeline:
+    """Fetches videos through the three stages. Use it as a context manager, or call close().
+
+    submit(video_id) returns a Future of the enriched video. Each video goes
+    through the pipeline at most once; later requests share the first result.
+    prefetch(video_ids) submits without waiting.
+    download(video_id) and enrich(video_id, video, error) replace the default
+    stages (the benchmark uses them to stay off the network and state.db).
+    """
+
+    def __init__(self, fetchers=FETCHERS, parse_workers=None, queue_size=QUEUE_SIZE, delay=0,
+                 download=download_video, enrich=store_record):
+        self._download = download
+        self._enrich = enrich
+        self._delay = delay
+        self._futures = {}
+        # Submitted by prefetch() and not asked for since
+        self._prefetched = set()
+        self._lock = threading.Lock()
+        self.fetched = 0
+        self.hits = 0
+
+        workers = parse_workers or os.cpu_count() or 1
+        # Spawned, not forked: a fork copies locks held by this process's other threads and can deadlock
+        self._pool = None
+        if workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._fetch_q = queue.Queue(queue_size)
+        self._parse_q = queue.Queue(queue_size)
+        # Records being parsed or waiting for enrich: enough to keep every worker busy
+        self._enrich_q = queue.Queue(2 * workers)
+
+        self._fetch_threads = [self._start(self._fetch_loop) for _ in range(max(1, fetchers))]
+        self._parse_thread = self._start(self._parse_loop)
+        self._enrich_thread = self._start(self._enrich_loop)
+
+    def _start(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def submit(self, video_id, prefetch=False):
+        with self._lock:
+            future = self._futures.get(video_id)
+            if future is not None:
+                if video_id in self._prefetched:
+                    # The first real request for a prefetched video is not a cache hit
+                    self._prefetched.discard(video_id)
+                elif not prefetch:
+                    self.hits += 1
+                return future
+            future = self._futures[video_id] = Future()
+            if prefetch:
+                self._prefetched.add(video_id)
+        # Blocks while the fetch queue is full
+        self._fetch_q.put(video_id)
+        return future
+
+    def prefetch(self, video_ids, max_age=video_store.MAX_AGE):
+        """Start fetching the videos get_video() would fetch, without waiting for them.
+
+        Skips ids already submitted, stored and fresh, or waiting out a failure.
+        Returns the number submitted.
+        """
+        with self._lock:
+            wanted = [vid for vid in dict.fromkeys(video_ids) if vid not in self._futures]
+        if wanted and max_age:
+            stored = video_store.get_videos(wanted, max_age)
+            wanted = [vid for vid in wanted if vid not in stored]
+        if wanted:
+            now = time.time()
+            waiting = {vid for vid, entry in failures.known_failures(wanted).items() if entry['retry_at'] > now}
+            wanted = [vid for vid in wanted if vid not in waiting]
+        for video_id in wanted:
+            self.submit(video_id, prefetch=True)
+        return len(wanted)
+
+    def get_video(self, video_id, max_age=video_store.MAX_AGE):
+        """video_store.get_video through the pipeline: the stored copy if fresh, else a fetch unless the ledger says wait"""
+        if max_age:
+            stored = video_store.get_videos([video_id], max_age).get(video_id)
+            if stored is not None:
+                return stored
+        failures.check(video_id)
+        return self.submit(video_id).result()
+
+    def _fetch_loop(self):
+        while True:
+            video_id = self._fetch_q.get()
+            if video_id is _STOP:
+                return
+            try:
+                raw, error = self._download(video_id), None
+            except Exception as e:
+                raw, error = None, e
+            if self._delay:
+                # Taken per fetcher, so `fetchers` bounds the request rate as well as concurrency
+                time.sleep(self._delay)
+            self._parse_q.put((video_id, raw, error))
+
+    def _parse_loop(self):
+        while True:
+            item = self._parse_q.get()
+            if item is _STOP:
+                self._enrich_q.put(_STOP)
+                return
+            video_id, raw, error = item
+            if error is None and self._pool is not None:
+                parsed = self._pool.submit(parse_record, video_id, raw)
+            else:
+                parsed = Future()
+                try:
+                    if error is not None:
+                        raise error
+                    parsed.set_result(parse_record(video_id, raw))
+                except Exception as e:
+                    parsed.set_exception(e)
+            self._enrich_q.put((video_id, parsed))
+
+    def _enrich_loop(self):
+        while True:
+            item = self._enrich_q.get()
+            if item is _STOP:
+                return
+            video_id, parsed = item
+            try:
+                video, error = parsed.result(), None
+            except Exception as e:
+                video, error = None, e
+            future = self._futures[video_id]
+            try:
+                future.set_result(self._enrich(video_id, video, error))
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                self.fetched += 1
+
+    def close(self):
+        """Finish the videos already submitted, then stop the stages and the worker processes"""
+        for _ in self._fetch_threads:
+            self._fetch_q.put(_STOP)
+        for thread in self._fetch_threads:
+            thread.join()
+        self._parse_q.put(_STOP)
+        self._parse_thread.join()
+        self._enrich_thread.join()
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
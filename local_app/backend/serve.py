@@ -0,0 +1,101 @@
+"""
+Production entry point: serves app.py with several workers instead of the
+single-threaded Flask dev server.
+
+    python serve.py [--host HOST] [--port PORT] [--workers N] [--threads N]
+
+Uses gunicorn (worker processes x threads) where it is installed, and
+waitress (one process, --threads threads; --workers is ignored) otherwise -
+gunicorn does not run on Windows. Crawl state lives in data/state.db and
+graph writes go through graph_store, so every worker sees the same crawl
+status and graph data.
+
+Everything else is per worker process: the background job pool (jobs.py),
+the parsed graph cache, the title LRU and, while an /ingest job runs, its
+parse process pool. Each extra worker costs that much memory again, so the
+default is one worker per core, at most MAX_DEFAULT_WORKERS.
+"""
+import os
+import sys
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5000
+DEFAULT_THREADS = 4
+MAX_DEFAULT_WORKERS = 4
+
+
+def default_workers():
+    # Requests are short (crawls and jobs run in background threads), so a few workers with threads go a long way
+    return min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS)
+
+
+def run_gunicorn(app, host, port, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    options = {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        # Crawls run in background threads, so requests themselves stay short
+        'timeout': 60,
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+def run_waitress(app, host, port, threads):
+    from waitress import serve
+    serve(app, host=host, port=port, threads=threads)
+
+
+def main(argv):
+    host = DEFAULT_HOST
+    port = DEFAULT_PORT
+    workers = default_workers()
+    threads = DEFAULT_THREADS
+    for i, arg in enumerate(argv):
+        if i + 1 >= len(argv):
+            break
+        if arg == '--host':
+            host = argv[i + 1]
+        elif arg == '--port':
+            port = int(argv[i + 1])
+        elif arg == '--workers':
+            workers = int(argv[i + 1])
+        elif arg == '--threads':
+            threads = int(argv[i + 1])
+
+    from app import app
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+
+    if gunicorn is not None and os.name != 'nt':
+        print(f'Serving on http://{host}:{port} with gunicorn ({workers} workers x {threads} threads)')
+        run_gunicorn(app, host, port, workers, threads)
+        return
+
+    try:
+        import waitress  # noqa: F401
+    except ImportError:
+        print('Install gunicorn (Linux/macOS) or waitress (Windows): pip install -r requirements.txt')
+        return 1
+
+    # One process: more threads would only queue up behind the GIL
+    print(f'Serving on http://{host}:{port} with waitress ({threads} threads)')
+    run_waitress(app, host, port, threads)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
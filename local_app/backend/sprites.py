@@ -0,0 +1,193 @@
+"""
+Pack node thumbnails for a graph into sprite sheets plus a JSON offset map.
+
+The graph page loads one map (`sprites/<graph_id>.json`) and a sheet or two
+instead of one thumbnail request per node. Maps are updated incrementally:
+only nodes that are not in the map yet are fetched and appended.
+
+Sheets are served as JPEG. Tiles are only ever appended, so only the last,
+partly filled sheet is ever written again; it keeps a lossless PNG copy
+(`<graph_id>-<n>.src.png`) that every rewrite is encoded from, so earlier
+tiles are not recompressed generation after generation. The copy is dropped
+once the sheet is full. Updates from several workers are serialized by a
+lock file next to the map.
+
+Run directly to build sprites for all graphs (or only the ids given):
+    python sprites.py [--rebuild] [graph_id ...]
+"""
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+from graph_store import graphs_lock
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+GRAPHS_PATH = os.path.join(DATA_DIR, 'graphs.json')
+SPRITES_DIR = os.path.join(DATA_DIR, 'sprites')
+
+# Tiles are twice the size the viewer draws them (80x45) so they stay sharp when zoomed
+TILE_WIDTH = 160
+TILE_HEIGHT = 90
+COLUMNS = 16
+ROWS = 16
+TILES_PER_SHEET = COLUMNS * ROWS
+
+THUMBNAIL_URL = 'https://i.ytimg.com/vi/{}/mqdefault.jpg'
+FETCH_WORKERS = 8
+JPEG_QUALITY = 80
+
+
+def _map_path(graph_id):
+    return os.path.join(SPRITES_DIR, f'{graph_id}.json')
+
+
+def _sheet_name(graph_id, index):
+    return f'{graph_id}-{index}.jpg'
+
+
+def _source_path(graph_id, index):
+    return os.path.join(SPRITES_DIR, f'{graph_id}-{index}.src.png')
+
+
+def _open_sheet(graph_id, index, sprite_map):
+    """The pixels of an existing sheet, from its lossless copy when it has one"""
+    if index < len(sprite_map['sheets']):
+        for path in (_source_path(graph_id, index), os.path.join(SPRITES_DIR, _sheet_name(graph_id, index))):
+            if os.path.exists(path):
+                return Image.open(path).convert('RGB')
+    return Image.new('RGB', (COLUMNS * TILE_WIDTH, ROWS * TILE_HEIGHT))
+
+
+def _save_sheet(graph_id, index, sheet, full):
+    name = _sheet_name(graph_id, index)
+    tmp_path = os.path.join(SPRITES_DIR, name + '.tmp')
+    sheet.save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    os.replace(tmp_path, os.path.join(SPRITES_DIR, name))
+    source = _source_path(graph_id, index)
+    if full:
+        # Never reopened again: the JPEG is all that is needed
+        try:
+            os.remove(source)
+        except OSError:
+            pass
+    else:
+        sheet.save(source + '.tmp', 'PNG')
+        os.replace(source + '.tmp', source)
+
+
+def load_sprite_map(graph_id):
+    """Return the sprite map for a graph, or None if it has not been built."""
+    try:
+        with open(_map_path(graph_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _empty_map():
+    return {
+        'version': 0,
+        'tile': [TILE_WIDTH, TILE_HEIGHT],
+        'columns': COLUMNS,
+        'rows': ROWS,
+        'sheets': [],
+        'tiles': {}
+    }
+
+
+def _fetch_thumbnail(session, video_id):
+    try:
+        r = session.get(THUMBNAIL_URL.format(video_id), timeout=10)
+        if not r.ok:
+            return None
+        img = Image.open(io.BytesIO(r.content)).convert('RGB')
+        return img.resize((TILE_WIDTH, TILE_HEIGHT))
+    except Exception:
+        return None
+
+
+def update_graph_sprites(graph_id, graph, rebuild=False):
+    """Append tiles for nodes of `graph` that are missing from its sprite map.
+
+    Returns the number of tiles added.
+    """
+    sprite_map = None if rebuild else load_sprite_map(graph_id)
+    known = sprite_map['tiles'] if sprite_map is not None and sprite_map.get('tile') == [TILE_WIDTH, TILE_HEIGHT] else {}
+    missing = [vid for vid in graph.get('nodes', {}) if vid not in known]
+    if not missing:
+        return 0
+
+    # Fetched before taking the lock, so other workers only wait for the repack
+    session = requests.Session()
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        images = list(pool.map(lambda vid: _fetch_thumbnail(session, vid), missing))
+    fetched = [(vid, img) for vid, img in zip(missing, images) if img is not None]
+    if not fetched:
+        return 0
+
+    os.makedirs(SPRITES_DIR, exist_ok=True)
+    with graphs_lock(_map_path(graph_id)):
+        # Re-read under the lock: another worker may have added tiles meanwhile
+        sprite_map = None if rebuild else load_sprite_map(graph_id)
+        if sprite_map is None or sprite_map.get('tile') != [TILE_WIDTH, TILE_HEIGHT]:
+            sprite_map = _empty_map()
+        tiles = sprite_map['tiles']
+        fetched = [(vid, img) for vid, img in fetched if vid not in tiles]
+        if not fetched:
+            return 0
+
+        # Next free slot: tiles are only ever appended, so it follows the last used one
+        slot = len(tiles)
+        open_sheets = {}
+        for vid, img in fetched:
+            sheet_index, pos = divmod(slot, TILES_PER_SHEET)
+            sheet = open_sheets.get(sheet_index)
+            if sheet is None:
+                sheet = open_sheets[sheet_index] = _open_sheet(graph_id, sheet_index, sprite_map)
+
+            row, col = divmod(pos, COLUMNS)
+            x, y = col * TILE_WIDTH, row * TILE_HEIGHT
+            sheet.paste(img, (x, y))
+            tiles[vid] = [sheet_index, x, y]
+            slot += 1
+
+        for sheet_index, sheet in open_sheets.items():
+            _save_sheet(graph_id, sheet_index, sheet, full=slot >= (sheet_index + 1) * TILES_PER_SHEET)
+            if sheet_index >= len(sprite_map['sheets']):
+                sprite_map['sheets'].append(_sheet_name(graph_id, sheet_index))
+
+        # Bumped on every change so the viewer can cache-bust rewritten sheets
+        sprite_map['version'] += 1
+        tmp_map = _map_path(graph_id) + '.tmp'
+        with open(tmp_map, 'w', encoding='utf-8') as f:
+            json.dump(sprite_map, f, ensure_ascii=False)
+        os.replace(tmp_map, _map_path(graph_id))
+
+        return len(fetched)
+
+
+def main(argv):
+    rebuild = '--rebuild' in argv
+    graph_ids = [a for a in argv if not a.startswith('--')]
+
+    if not os.path.exists(GRAPHS_PATH):
+        print('graphs.json not found')
+        return
+
+    with open(GRAPHS_PATH, 'r', encoding='utf-8') as f:
+        graphs = json.load(f).get('graphs', {})
+
+    for graph_id, graph in graphs.items():
+        if graph_ids and graph_id not in graph_ids:
+            continue
+        added = update_graph_sprites(graph_id, graph, rebuild=rebuild)
+        print(f'{graph_id}: added {added} tiles')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,321 @@
+"""
+Server state shared by every worker process, kept in SQLite (data/state.db).
+
+Module globals only exist inside one process. Under a multi-worker server a
+crawl started by one worker has to be visible to /status on all of them, and
+two workers must not both start a crawl, so that state lives here instead.
+Each thread gets its own connection; the database runs in WAL mode so readers
+never wait for the writer.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+STATE_PATH = os.path.join(DATA_DIR, 'state.db')
+
+# A 'running' crawl or a queued/running job without a heartbeat for this long is assumed dead (its worker exited)
+STALE_SECONDS = 300
+
+LOST_JOB_ERROR = 'job lost: the worker running it stopped'
+
+IDLE_STATUS = {'state': 'idle', 'nodes': 0, 'edges': 0, 'root_video_id': None, 'part2_video_id': None}
+
+SCHEMA = [
+    # Single row (id = 1) holding the crawl_state dict of the current or last crawl
+    '''CREATE TABLE IF NOT EXISTS crawl (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        state TEXT NOT NULL,
+        status TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )''',
+    # Background jobs (see jobs.py); params/result are JSON
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        state TEXT NOT NULL,
+        params TEXT,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )''',
+    # Persistent cache of video titles (see titles.py)
+    '''CREATE TABLE IF NOT EXISTS titles (
+        video_id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    )''',
+    # Videos shared by every graph (see video_store.py); video and links are JSON
+    '''CREATE TABLE IF NOT EXISTS videos (
+        video_id TEXT PRIMARY KEY,
+        video TEXT NOT NULL,
+        links TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    )''',
+    # Videos that could not be fetched and when to try them again (see failures.py)
+    '''CREATE TABLE IF NOT EXISTS failures (
+        video_id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        error TEXT,
+        attempts INTEGER NOT NULL,
+        first_failed_at REAL NOT NULL,
+        last_failed_at REAL NOT NULL,
+        retry_at REAL NOT NULL
+    )''',
+    # Bounded per-graph change log (see graph_changes.py); ops is JSON
+    '''CREATE TABLE IF NOT EXISTS changes (
+        source TEXT NOT NULL,
+        graph_id TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        ops TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (source, graph_id, version)
+    )''',
+]
+
+_local = threading.local()
+
+
+def connect():
+    """Return this thread's connection, creating the database on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        # Autocommit; multi-statement updates use explicit BEGIN IMMEDIATE
+        conn = sqlite3.connect(STATE_PATH, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            conn.execute(statement)
+        _local.conn = conn
+    return conn
+
+
+def _put_crawl(conn, status):
+    conn.execute(
+        'INSERT OR REPLACE INTO crawl (id, state, status, updated_at) VALUES (1, ?, ?, ?)',
+        (status.get('state', 'idle'), json.dumps(status, ensure_ascii=False), time.time())
+    )
+
+
+def get_crawl_status():
+    """Return the crawl_state dict last saved by any process."""
+    row = connect().execute('SELECT status FROM crawl WHERE id = 1').fetchone()
+    return json.loads(row[0]) if row else dict(IDLE_STATUS)
+
+
+def save_crawl_status(status):
+    """Publish the crawl's current state; also serves as its heartbeat."""
+    _put_crawl(connect(), status)
+
+
+def running_crawl_root():
+    """Return the root video of the live crawl, or None if none is running (or its worker died)."""
+    row = connect().execute('SELECT state, status, updated_at FROM crawl WHERE id = 1').fetchone()
+    if row and row[0] == 'running' and time.time() - row[2] < STALE_SECONDS:
+        return json.loads(row[1]).get('root_video_id')
+    return None
+
+
+def claim_crawl(status):
+    """Atomically save `status` as the running crawl unless a live one exists.
+
+    Returns True if the caller now owns the crawl.
+    """
+    conn = connect()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT state, updated_at FROM crawl WHERE id = 1').fetchone()
+        if row and row[0] == 'running' and time.time() - row[1] < STALE_SECONDS:
+            conn.execute('ROLLBACK')
+            return False
+        _put_crawl(conn, status)
+        conn.execute('COMMIT')
+        return True
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def create_job(job_id, kind, params):
+    now = time.time()
+    connect().execute(
+        'INSERT INTO jobs (id, kind, state, params, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+        (job_id, kind, 'queued', json.dumps(params, ensure_ascii=False), now, now)
+    )
+
+
+def update_job(job_id, state, result=None, error=None):
+    connect().execute(
+        'UPDATE jobs SET state = ?, result = ?, error = ?, updated_at = ? WHERE id = ?',
+        (state, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), job_id)
+    )
+
+
+def touch_jobs(job_ids):
+    """Heartbeat for the unfinished jobs a live process still holds."""
+    now = time.time()
+    connect().executemany(
+        "UPDATE jobs SET updated_at = ? WHERE id = ? AND state IN ('queued', 'running')",
+        [(now, job_id) for job_id in job_ids]
+    )
+
+
+def unfinished_jobs(kind):
+    """Return the params of `kind` jobs that are queued or running with a live heartbeat."""
+    rows = connect().execute(
+        "SELECT params FROM jobs WHERE kind = ? AND state IN ('queued', 'running') AND updated_at >= ?",
+        (kind, time.time() - STALE_SECONDS)
+    ).fetchall()
+    return [json.loads(row[0]) if row[0] else {} for row in rows]
+
+
+def get_job(job_id):
+    """Return a job as a dict, or None if there is no such job.
+
+    A queued or running job whose heartbeat is older than STALE_SECONDS was
+    lost with its worker; it is marked as failed and returned as such.
+    """
+    conn = connect()
+    now = time.time()
+    conn.execute(
+        "UPDATE jobs SET state = 'error', error = ?, updated_at = ? "
+        "WHERE id = ? AND state IN ('queued', 'running') AND updated_at < ?",
+        (LOST_JOB_ERROR, now, job_id, now - STALE_SECONDS)
+    )
+    row = conn.execute(
+        'SELECT id, kind, state, params, result, error, created_at, updated_at FROM jobs WHERE id = ?',
+        (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        'id': row[0],
+        'kind': row[1],
+        'state': row[2],
+        'params': json.loads(row[3]) if row[3] else None,
+        'result': json.loads(row[4]) if row[4] else None,
+        'error': row[5],
+        'created_at': row[6],
+        'updated_at': row[7]
+    }
+
+
+def get_cached_titles(video_ids, max_age):
+    """Return {video_id: title} for ids with a stored title newer than `max_age` seconds."""
+    if not video_ids:
+        return {}
+    placeholders = ','.join('?' * len(video_ids))
+    rows = connect().execute(
+        f'SELECT video_id, title FROM titles WHERE fetched_at > ? AND video_id IN ({placeholders})',
+        [time.time() - max_age] + list(video_ids)
+    ).fetchall()
+    return dict(rows)
+
+
+def save_titles(titles):
+    now = time.time()
+    connect().executemany(
+        'INSERT OR REPLACE INTO titles (video_id, title, fetched_at) VALUES (?, ?, ?)',
+        [(video_id, title, now) for video_id, title in titles.items()]
+    )
+
+
+def get_stored_videos(video_ids, max_age):
+    """Return {video_id: (video, links)} for ids fetched less than `max_age` seconds ago."""
+    if not video_ids:
+        return {}
+    placeholders = ','.join('?' * len(video_ids))
+    rows = connect().execute(
+        f'SELECT video_id, video, links FROM videos WHERE fetched_at > ? AND video_id IN ({placeholders})',
+        [time.time() - max_age] + list(video_ids)
+    ).fetchall()
+    return {video_id: (json.loads(video), json.loads(links)) for video_id, video, links in rows}
+
+
+def save_video(video_id, video, links):
+    connect().execute(
+        'INSERT OR REPLACE INTO videos (video_id, video, links, fetched_at) VALUES (?, ?, ?, ?)',
+        (video_id, json.dumps(video, ensure_ascii=False), json.dumps(links, ensure_ascii=False), time.time())
+    )
+
+
+FAILURE_COLUMNS = ('video_id', 'kind', 'error', 'attempts', 'first_failed_at', 'last_failed_at', 'retry_at')
+
+
+def save_failure(video_id, kind, error, retry_delay):
+    """Record a failed fetch. retry_delay(attempts) gives the seconds until it may be tried again.
+
+    Returns the stored entry as a dict.
+    """
+    conn = connect()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT attempts, first_failed_at FROM failures WHERE video_id = ?', (video_id,)).fetchone()
+        attempts, first = (row[0] + 1, row[1]) if row else (1, now)
+        entry = dict(zip(FAILURE_COLUMNS, (video_id, kind, error, attempts, first, now, now + retry_delay(attempts))))
+        conn.execute(
+            f'INSERT OR REPLACE INTO failures ({", ".join(FAILURE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            tuple(entry.values())
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return entry
+
+
+def clear_failure(video_id):
+    connect().execute('DELETE FROM failures WHERE video_id = ?', (video_id,))
+
+
+def get_failures(video_ids=None, kinds=None, due=False):
+    """Return ledger entries as dicts, optionally only for some ids / kinds, or only those due for a retry."""
+    query = f'SELECT {", ".join(FAILURE_COLUMNS)} FROM failures WHERE 1 = 1'
+    args = []
+    if video_ids is not None:
+        query += f' AND video_id IN ({",".join("?" * len(video_ids))})'
+        args += list(video_ids)
+    if kinds:
+        query += f' AND kind IN ({",".join("?" * len(kinds))})'
+        args += list(kinds)
+    if due:
+        query += ' AND retry_at <= ?'
+        args.append(time.time())
+    rows = connect().execute(query + ' ORDER BY retry_at', args).fetchall()
+    return [dict(zip(FAILURE_COLUMNS, row)) for row in rows]
+
+
+def save_changes(source, changes, keep):
+    """Store {graph_id: (version, ops)} and drop entries more than `keep` versions old."""
+    conn = connect()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for graph_id, (version, ops) in changes.items():
+            # REPLACE: a version logged by a write that then failed is reused by the next one
+            conn.execute(
+                'INSERT OR REPLACE INTO changes (source, graph_id, version, ops, created_at) VALUES (?, ?, ?, ?, ?)',
+                (source, graph_id, version, json.dumps(ops, ensure_ascii=False), now)
+            )
+            conn.execute(
+                'DELETE FROM changes WHERE source = ? AND graph_id = ? AND version <= ?',
+                (source, graph_id, version - keep)
+            )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def get_changes(source, graph_id, since):
+    """Return [(version, ops), ...] newer than `since`, oldest first."""
+    rows = connect().execute(
+        'SELECT version, ops FROM changes WHERE source = ? AND graph_id = ? AND version > ? ORDER BY version',
+        (source, graph_id, since)
+    ).fetchall()
+    return [(version, json.loads(ops)) for version, ops in rows]
@@ -0,0 +1,67 @@
+"""
+Title lookups for the input form.
+
+Titles come from oEmbed only (no watch page) and are memoized twice: an
+in-process LRU in front of the `titles` table in state.db, which every
+worker shares. Misses are fetched concurrently.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import state_store
+from youtube_api import get_title
+
+LRU_SIZE = 4096
+# Titles rarely change; refetch them after a week
+MAX_AGE = 7 * 24 * 3600
+FETCH_WORKERS = 8
+# Upper bound on ids per request, so one call can't fan out unboundedly
+MAX_IDS = 100
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+_session = requests.Session()
+
+
+def _remember(video_id, title):
+    with _lock:
+        _lru[video_id] = title
+        _lru.move_to_end(video_id)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def get_titles(video_ids):
+    """Return {video_id: title or None} for up to MAX_IDS ids."""
+    video_ids = list(dict.fromkeys(video_ids))[:MAX_IDS]
+    titles = {}
+    missing = []
+    with _lock:
+        for video_id in video_ids:
+            if video_id in _lru:
+                _lru.move_to_end(video_id)
+                titles[video_id] = _lru[video_id]
+            else:
+                missing.append(video_id)
+
+    if missing:
+        stored = state_store.get_cached_titles(missing, MAX_AGE)
+        for video_id, title in stored.items():
+            titles[video_id] = title
+            _remember(video_id, title)
+        missing = [video_id for video_id in missing if video_id not in stored]
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(missing))) as pool:
+            fetched = dict(zip(missing, pool.map(lambda vid: get_title(vid, session=_session), missing)))
+        # Failed lookups are not cached: they may be transient, and are retried next time
+        found = {video_id: title for video_id, title in fetched.items() if title}
+        state_store.save_titles(found)
+        for video_id, title in found.items():
+            _remember(video_id, title)
+        titles.update(fetched)
+
+    return {video_id: titles.get(video_id) for video_id in video_ids}
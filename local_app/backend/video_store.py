@@ -0,0 +1,61 @@
+"""
+One store of fetched videos for every graph.
+
+Trailers, bloopers and videos linked from several stories used to be
+fetched again by each crawl that met them. get_video() here keeps every
+fetched video - metadata, card data and its parsed choice links - in the
+`videos` table of state.db, keyed by video id, and only goes to YouTube
+when the stored copy is older than MAX_AGE. Graph nodes still carry their
+own copy of these fields (the viewer, exporter and snapshot read them from
+graphs.json); this table is where a crawl gets them from.
+"""
+import failures
+import youtube_api
+import state_store
+from yt_parser import parse_description
+
+# Descriptions change rarely; a day keeps a re-crawl cheap without going stale for long
+MAX_AGE = 24 * 3600
+
+
+def get_video(video_id, max_age=MAX_AGE, fetch=None):
+    """Return the video dict for `video_id` (as youtube_api.get_video, plus 'links'), fetching only if needed.
+
+    'links' is parse_description() of the description. max_age=0 always refetches.
+    Fetches go through the failure ledger: a video that failed recently raises
+    VideoFetchError without a request, and every outcome updates the ledger.
+    """
+    if max_age:
+        stored = state_store.get_stored_videos([video_id], max_age).get(video_id)
+        if stored is not None:
+            video, links = stored
+            return dict(video, links=links)
+
+    failures.check(video_id)
+    try:
+        video = (fetch or youtube_api.get_video)(video_id)
+    except Exception as e:
+        failures.record_failure(video_id, e)
+        raise
+    return save_fetched(video_id, video)
+
+
+def save_fetched(video_id, video):
+    """Store a freshly fetched video and clear its failures. Returns it with 'links'.
+
+    'links' is parsed from the description unless the video already has them
+    (pipeline parse workers do that off the main process).
+    """
+    failures.record_success(video_id)
+    video = dict(video)
+    links = video.pop('links', None)
+    if links is None:
+        links = parse_description(video.get('description', ''))
+    state_store.save_video(video_id, video, links)
+    return dict(video, links=links)
+
+
+def get_videos(video_ids, max_age=MAX_AGE):
+    """Return {video_id: video} of the stored, fresh videos among `video_ids` (no fetching)."""
+    stored = state_store.get_stored_videos(list(video_ids), max_age)
+    return {video_id: dict(video, links=links) for video_id, (video, links) in stored.items()}
@@ -0,0 +1,147 @@
+"""
+Compact wire format for sending graphs to the viewer.
+
+A stored node repeats its edges up to four times (outgoing, incoming_from,
+choice_N and choice_N_label), and every label is a copy of some title. The
+wire format keeps each fact once:
+
+    {
+      "v": 1,
+      "graph": {"title": ..., "part2_video_id": ..., ...},
+      "strings": ["", "Put Out the Fire", "maxresdefault.jpg", ...],
+      "ids": ["j64oZLF443g", ...],   # node ids first, then ids only seen as edge targets
+      "title": [1, ...],             # per node, index into strings
+      "thumb": [2, ...],             # per node; a bare file name means i.ytimg.com/vi/<id>/<name>
+      "url": [0, ...],               # per node; 0 means the usual watch?v=<id> URL
+      "length": [512, null, ...],    # per node, card_data.lengthSeconds
+      "edges": [0, 5, 1, ...],       # flat (source, target, label) triples of indices
+      "desc": ["...", ...]           # per node clean_description, kept apart from the structure
+    }
+
+Incoming edges, choice_N fields and incoming labels are not sent; the
+decoder (decode_graph here, decodeGraph in frontend/graph.js) rebuilds the
+lookups from the edge list. Raw HTML descriptions are not sent at all.
+
+The skeleton variant replaces "desc" with "preview": the first
+PREVIEW_CHARS characters, enough for the two lines drawn under a node. The
+rest (full descriptions, card data) is fetched per node with node_detail()
+through /graph/<id>/node/<vid>.
+"""
+
+WIRE_VERSION = 1
+
+GRAPH_FIELDS = ['title', 'part2_video_id', 'stop_video_ids', 'trailer_video_id', 'bonus_video_ids', 'hide_bonus_button', 'version']
+
+THUMB_PREFIX = 'https://i.ytimg.com/vi/'
+WATCH_URL = 'https://www.youtube.com/watch?v='
+
+# The viewer wraps descriptions into two 20-character lines; a little more keeps its ellipsis
+PREVIEW_CHARS = 60
+
+# Node fields the graph itself already carries, left out of node_detail()
+STRUCTURE_FIELDS = ('outgoing', 'incoming_from')
+
+
+class _StringTable:
+    def __init__(self):
+        # Index 0 is always the empty string, so 0 doubles as "missing"
+        self.strings = ['']
+        self._index = {'': 0}
+
+    def add(self, value):
+        value = value or ''
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def encode_graph(graph, skeleton=False):
+    """Return the wire form of one stored graph; with skeleton=True only description previews are included."""
+    nodes = graph.get('nodes') or {}
+    strings = _StringTable()
+    ids = list(nodes)
+    position = {vid: i for i, vid in enumerate(ids)}
+
+    def index_of(vid):
+        if vid not in position:
+            position[vid] = len(ids)
+            ids.append(vid)
+        return position[vid]
+
+    titles, thumbs, urls, lengths, descs, edges = [], [], [], [], [], []
+    for vid, node in nodes.items():
+        titles.append(strings.add(node.get('title')))
+
+        thumb = node.get('thumbnail') or ''
+        prefix = f'{THUMB_PREFIX}{vid}/'
+        name = thumb[len(prefix):] if thumb.startswith(prefix) else ''
+        thumbs.append(strings.add(name if name and '/' not in name else thumb))
+
+        url = node.get('url') or ''
+        urls.append(0 if url == WATCH_URL + vid else strings.add(url))
+
+        lengths.append((node.get('card_data') or {}).get('lengthSeconds'))
+        desc = node.get('clean_description') or ''
+        descs.append(desc[:PREVIEW_CHARS] if skeleton else desc)
+
+        source = position[vid]
+        for out in node.get('outgoing') or []:
+            edges.extend((source, index_of(out.get('to')), strings.add(out.get('label'))))
+
+    return {
+        'v': WIRE_VERSION,
+        'graph': {k: graph[k] for k in GRAPH_FIELDS if k in graph},
+        'strings': strings.strings,
+        'ids': ids,
+        'title': titles,
+        'thumb': thumbs,
+        'url': urls,
+        'length': lengths,
+        'edges': edges,
+        'preview' if skeleton else 'desc': descs
+    }
+
+
+def encode_graphs(data, skeleton=False):
+    """Wire form of a whole graphs.json document: {'graphs': {graph_id: wire}}."""
+    return {'graphs': {graph_id: encode_graph(graph, skeleton) for graph_id, graph in data.get('graphs', {}).items()}}
+
+
+def node_detail(node):
+    """Everything about a node except its edges and the choice_N fields derived from them."""
+    return {k: v for k, v in node.items() if k not in STRUCTURE_FIELDS and not k.startswith('choice_')}
+
+
+def decode_graph(wire):
+    """Rebuild a graph with the node fields the viewer reads (the Python twin of decodeGraph)."""
+    strings = wire['strings']
+    ids = wire['ids']
+    graph = dict(wire.get('graph') or {})
+    descs = wire['desc'] if 'desc' in wire else wire['preview']
+    nodes = {}
+    for i, title in enumerate(wire['title']):
+        vid = ids[i]
+        thumb = strings[wire['thumb'][i]]
+        node = {
+            'title': strings[title],
+            'thumbnail': (f'{THUMB_PREFIX}{vid}/{thumb}' if thumb and '/' not in thumb else thumb) or None,
+            'url': strings[wire['url'][i]] or WATCH_URL + vid,
+            'clean_description': descs[i],
+            'outgoing': [],
+            'incoming_from': []
+        }
+        if wire['length'][i] is not None:
+            node['card_data'] = {'lengthSeconds': wire['length'][i]}
+        nodes[vid] = node
+
+    edges = wire['edges']
+    for k in range(0, len(edges), 3):
+        source, target, label = ids[edges[k]], ids[edges[k + 1]], strings[edges[k + 2]]
+        nodes[source]['outgoing'].append({'to': target, 'label': label})
+        if target in nodes:
+            nodes[target]['incoming_from'].append({'from': source, 'label': nodes[source]['title']})
+
+    graph['nodes'] = nodes
+    return graph
@@ -1,108 +1,409 @@
+import asyncio
+import threading
 import requests
 import re
 import html
+import json
+from concurrent.futures import Future
 
+# Endscreen element fields kept in a node's card_data
+CARD_FIELDS = ['aspectRatio', 'endMs', 'left', 'startMs', 'targetId', 'top', 'width']
 
-def get_video(video_id, session=None):
+_decoder = json.JSONDecoder()
+
+# Watch pages are read in chunks of this size, stopping once everything needed has arrived
+WATCH_CHUNK = 64 * 1024
+# gzip/deflate, plus br when the Brotli package is installed (urllib3 then decodes it)
+ACCEPT_ENCODING = requests.utils.DEFAULT_ACCEPT_ENCODING
+# Script variables get_video reads; ytInitialData (the description) comes after the player response
+WATCH_PAGE_VARS = ('ytInitialPlayerResponse', 'ytInitialData')
+
+# In-flight fetches, keyed by (what, video_id): concurrent callers for the same video share one request
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _join(key):
+    """Return (future, owner): the in-flight future for `key`, and whether the caller must run it."""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future, False
+        future = _inflight[key] = Future()
+        return future, True
+
+
+def _run(key, future, fn):
+    try:
+        future.set_result(fn())
+    except BaseException as e:
+        # Waiters get the same exception instead of hanging
+        future.set_exception(e)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _singleflight(key, fn):
+    future, owner = _join(key)
+    if owner:
+        _run(key, future, fn)
+    return future.result()
+
+
+async def _singleflight_async(key, fn):
+    future, owner = _join(key)
+    if owner:
+        asyncio.get_running_loop().run_in_executor(None, _run, key, future, fn)
+    # shield: a cancelled caller must not cancel the fetch other callers are waiting for
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+
+def extract_json_var(page, name):
+    """Return the JSON object assigned to `name` in a watch page (e.g. ytInitialPlayerResponse), or None"""
+    m = re.search(r'\b' + re.escape(name) + r'\s*=\s*\{', page)
+    if not m:
+        return None
+    try:
+        # raw_decode stops at the end of the object, whatever script follows it
+        value, _ = _decoder.raw_decode(page, m.end() - 1)
+        return value
+    except ValueError:
+        return None
+
+
+def extract_card_data(player_response):
+    """Read video details and endscreen elements from ytInitialPlayerResponse.
+
+    Returns the same shape the browser-side EXTRACT_SCRIPT of the card backfill
+    produces: videoId, title, lengthSeconds, description and endscreen list.
+    """
+    details = player_response.get('videoDetails') or {}
+    result = {
+        'videoId': details.get('videoId'),
+        'title': details.get('title'),
+        'lengthSeconds': details.get('lengthSeconds'),
+        'description': details.get('shortDescription') or '',
+        'endscreen': []
+    }
+
+    renderer_list = ((player_response.get('endscreen') or {}).get('endscreenRenderer') or {}).get('elements') or []
+    for element in renderer_list:
+        renderer = element.get('endscreenElementRenderer')
+        if not renderer:
+            continue
+        endpoint = renderer.get('endpoint') or {}
+        result['endscreen'].append({
+            'style': renderer.get('style'),
+            'startMs': renderer.get('startMs'),
+            'endMs': renderer.get('endMs'),
+            'left': renderer.get('left'),
+            'top': renderer.get('top'),
+            'width': renderer.get('width'),
+            'aspectRatio': renderer.get('aspectRatio'),
+            'title': (renderer.get('title') or {}).get('simpleText', ''),
+            'metadata': (renderer.get('metadata') or {}).get('simpleText', ''),
+            'targetId': (endpoint.get('watchEndpoint') or {}).get('videoId') or (endpoint.get('urlEndpoint') or {}).get('url')
+        })
+
+    return result
+
+
+def clean_card_data(data):
+    """Reduce extracted card data to what is stored on a node: layout/timing fields and lengthSeconds"""
+    cleaned = {'endscreen': []}
+    for el in data.get('endscreen', []):
+        new_el = {k: el.get(k) for k in CARD_FIELDS if el.get(k) is not None}
+        if new_el:
+            cleaned['endscreen'].append(new_el)
+    if data.get('lengthSeconds') is not None:
+        cleaned['lengthSeconds'] = data.get('lengthSeconds')
+    return cleaned
+
+
+def _fetch_card_data(video_id, session=None):
+    """Download a watch page and extract its card data without a browser.
+
+    Returns the extracted dict (see extract_card_data) or {'error': message}.
+    """
     s = session or requests
-    url = f'https://www.youtube.com/watch?v={video_id}'
-    # Try oEmbed for title/thumbnail, then fetch page for description
-    title = None
-    thumbnail = f'https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg'
-    description = ''
+    try:
+        page = read_watch_page(s, video_id, needs=('ytInitialPlayerResponse',), headers={'Accept-Language': 'en-US,en'})
+        player_response = extract_json_var(page, 'ytInitialPlayerResponse')
+        if not player_response:
+            return {'error': 'No player data found'}
+        return extract_card_data(player_response)
+    except VideoFetchError as e:
+        return {'error': e.reason}
+    except Exception as e:
+        return {'error': str(e)}
 
+
+def _has_vars(page, names):
+    # A variable is complete once the <script> that assigns it has closed
+    for name in names:
+        start = page.find(f'{name} = '.encode('ascii'))
+        if start < 0 or page.find(b'</script>', start) < 0:
+            return False
+    return True
+
+
+def read_watch_bytes(s, video_id, needs=WATCH_PAGE_VARS, headers=None):
+    """Download a watch page only as far as the scripts assigning `needs` (the whole page if they never appear).
+
+    The response is streamed with compression negotiated, and the connection
+    is closed as soon as those scripts are complete; everything after them
+    (most of a 1 MB+ page) is never transferred. Returns (page bytes, charset).
+    Raises VideoFetchError.
+    """
+    url = f'https://www.youtube.com/watch?v={video_id}'
     try:
-        oembed = s.get('https://www.youtube.com/oembed', params={'url': url, 'format': 'json'}, timeout=10)
-        if oembed.ok:
-            data = oembed.json()
-            title = data.get('title')
-            if title:
-                title = html.unescape(title)
-    except Exception:
-        pass
+        r = s.get(url, timeout=10, stream=True, headers=dict(headers or {}, **{'Accept-Encoding': ACCEPT_ENCODING}))
+    except requests.RequestException as e:
+        raise VideoFetchError(video_id, 'transient', str(e))
+    try:
+        if not r.ok:
+            raise VideoFetchError(video_id, _failure_kind(r.status_code), f'HTTP {r.status_code}')
+        if '/sorry/' in r.url:
+            raise VideoFetchError(video_id, 'throttled', 'redirected to the unusual-traffic page')
+        page = bytearray()
+        for chunk in r.iter_content(WATCH_CHUNK):
+            page += chunk
+            if _has_vars(page, needs):
+                break
+        return bytes(page), r.encoding or 'utf-8'
+    except requests.RequestException as e:
+        raise VideoFetchError(video_id, 'transient', str(e))
+    finally:
+        # Drops the connection if the body wasn't read to the end
+        r.close()
+
+
+def read_watch_page(s, video_id, needs=WATCH_PAGE_VARS, headers=None):
+    """read_watch_bytes, decoded to text"""
+    page, encoding = read_watch_bytes(s, video_id, needs, headers)
+    return page.decode(encoding, errors='replace')
+
 
+def _get_title(video_id, session=None):
+    """Look up just a video's title via oEmbed (a few hundred bytes, no watch page). None if unavailable."""
+    s = session or requests
+    url = f'https://www.youtube.com/watch?v={video_id}'
     try:
-        r = s.get(url, timeout=10)
+        r = s.get('https://www.youtube.com/oembed', params={'url': url, 'format': 'json'}, timeout=10)
         if r.ok:
-            # Extract description with URLs from ytInitialData
-            # Look for the description with commandRuns which contains the actual links
-            initial_data_match = re.search(r'var ytInitialData = ({.*?});', r.text)
-            if initial_data_match:
-                try:
-                    import json
-                    data = json.loads(initial_data_match.group(1))
-                    
-                    # Navigate to video secondary info renderer for description
-                    contents = data.get('contents', {})
-                    two_col = contents.get('twoColumnWatchNextResults', {})
-                    results = two_col.get('results', {}).get('results', {})
-                    contents_list = results.get('contents', [])
-                    
-                    for content in contents_list:
-                        video_secondary = content.get('videoSecondaryInfoRenderer', {})
-                        if 'attributedDescription' in video_secondary:
-                            desc_data = video_secondary['attributedDescription']
-                            
-                            # Build description with HTML links from commandRuns
-                            if 'content' in desc_data:
-                                desc_parts = []
-                                content_text = desc_data.get('content', '')
-                                command_runs = desc_data.get('commandRuns', [])
-                                
-                                if command_runs:
-                                    # Reconstruct with links
-                                    last_end = 0
-                                    for run in command_runs:
-                                        start_index = run.get('startIndex', 0)
-                                        length = run.get('length', 0)
-                                        
-                                        # Add text before this link
-                                        if start_index > last_end:
-                                            desc_parts.append(content_text[last_end:start_index])
-                                        
-                                        # Extract URL from command
-                                        command = run.get('onTap', {}).get('innertubeCommand', {})
-                                        url_endpoint = command.get('commandMetadata', {}).get('webCommandMetadata', {}).get('url', '')
-                                        
-                                        link_text = content_text[start_index:start_index + length]
-                                        
-                                        if url_endpoint:
-                                            # Convert to full URL if needed
-                                            if url_endpoint.startswith('/'):
-                                                url_endpoint = f'https://www.youtube.com{url_endpoint}'
-                                            desc_parts.append(f'<a href="{url_endpoint}">{link_text}</a>')
-                                        else:
-                                            desc_parts.append(link_text)
-                                        
-                                        last_end = start_index + length
-                                    
-                                    # Add remaining text
-                                    if last_end < len(content_text):
-                                        desc_parts.append(content_text[last_end:])
-                                    
-                                    description = ''.join(desc_parts)
-                                else:
-                                    # No links, just use content
-                                    description = content_text
-                                
-                                break
-                except Exception as e:
-                    pass
-            
-            # Fallback to og:description or meta name=description
-            if not description:
-                m = re.search(r'<meta property="og:description" content="([^"]*)"', r.text)
-                if not m:
-                    m = re.search(r'<meta name="description" content="([^"]*)"', r.text)
-                if m:
-                    description = html.unescape(m.group(1)).strip()
-            
-            # sometimes title tag is available
-            if not title:
-                mt = re.search(r'<title>(.*?)</title>', r.text, re.I | re.S)
-                if mt:
-                    title = html.unescape(mt.group(1).replace(' - YouTube', '').strip())
+            title = r.json().get('title')
+            return html.unescape(title) if title else None
     except Exception:
         pass
+    return None
+
+
+class VideoFetchError(Exception):
+    """A video could not be read. `kind` says whether trying again can help:
+
+    transient  network error, timeout, 5xx or a page without video data
+    throttled  YouTube asked us to slow down (429 or the /sorry/ page)
+    private    the video exists but is private
+    removed    the video is gone (404, or the player reports an error)
+    """
+
+    def __init__(self, video_id, kind, message):
+        super().__init__(f'{video_id}: {kind}: {message}')
+        self.video_id = video_id
+        self.kind = kind
+        self.reason = message
+
+    def __reduce__(self):
+        # Raised in parse workers too; the default pickling would lose kind and reason
+        return (VideoFetchError, (self.video_id, self.kind, self.reason))
+
+
+# Failures that won't go away by retrying soon
+PERMANENT_FAILURES = ('private', 'removed')
+
+
+def _failure_kind(status_code):
+    if status_code == 429:
+        return 'throttled'
+    if status_code in (404, 410):
+        return 'removed'
+    return 'transient'
+
+
+def _unavailable_kind(player_response):
+    """Failure kind the player reports for a video it won't show, or None if it's playable or unclear"""
+    playability = (player_response or {}).get('playabilityStatus') or {}
+    status = playability.get('status')
+    reason = (playability.get('reason') or '').lower()
+    if status == 'LOGIN_REQUIRED' and 'private' in reason:
+        return 'private'
+    if status in ('ERROR', 'UNPLAYABLE'):
+        return 'removed'
+    return None
+
+
+def download_video(video_id, session=None):
+    """The network half of _get_video: {'title': oEmbed title or None, 'page': watch page bytes, 'encoding': charset}.
+
+    Raises VideoFetchError when the page can't be downloaded.
+    """
+    s = session or requests
+    # oEmbed is optional: the page has the title too
+    title = _get_title(video_id, s)
+    page, encoding = read_watch_bytes(s, video_id)
+    return {'title': title, 'page': page, 'encoding': encoding}
+
+
+def parse_watch_page(video_id, page, title=None, encoding='utf-8'):
+    """The parsing half of _get_video: turn a downloaded watch page (bytes or text) into the video dict.
+
+    Needs no network, so it can run in another process. Raises VideoFetchError
+    when the page says the video can't be shown.
+    """
+    if isinstance(page, bytes):
+        page = page.decode(encoding, errors='replace')
+    url = f'https://www.youtube.com/watch?v={video_id}'
+    thumbnail = f'https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg'
+    description = ''
+    card_data = None
+
+    # Extract description with URLs from ytInitialData
+    # Look for the description with commandRuns which contains the actual links
+    initial_data_match = re.search(r'var ytInitialData = ({.*?});', page)
+    if initial_data_match:
+        try:
+            description = _description_from_initial_data(json.loads(initial_data_match.group(1)))
+        except Exception:
+            pass
+    
+    # Fallback to og:description or meta name=description
+    if not description:
+        m = re.search(r'<meta property="og:description" content="([^"]*)"', page)
+        if not m:
+            m = re.search(r'<meta name="description" content="([^"]*)"', page)
+        if m:
+            description = html.unescape(m.group(1)).strip()
+    
+    # Endscreen cards come from the player response embedded in the same page
+    player_response = extract_json_var(page, 'ytInitialPlayerResponse')
+    if player_response:
+        card_data = clean_card_data(extract_card_data(player_response))
+    
+    if not title and not description:
+        # Nothing usable: say why, so the caller knows whether to try again
+        kind = _unavailable_kind(player_response)
+        if kind:
+            reason = ((player_response.get('playabilityStatus') or {}).get('reason')) or kind
+            raise VideoFetchError(video_id, kind, reason)
+    if not initial_data_match and not player_response:
+        # A consent page, a truncated download or a changed layout: the title alone would be
+        # saved as a node without its description and links, so try again later instead
+        raise VideoFetchError(video_id, 'transient', 'no video data in page')
+    
+    # sometimes title tag is available
+    if not title:
+        mt = re.search(r'<title>(.*?)</title>', page, re.I | re.S)
+        if mt:
+            title = html.unescape(mt.group(1).replace(' - YouTube', '').strip())
 
-    return {'title': title or video_id, 'description': description, 'thumbnail': thumbnail, 'url': url}
+    video = {'title': title or video_id, 'description': description, 'thumbnail': thumbnail, 'url': url}
+    if card_data is not None:
+        video['card_data'] = card_data
+    return video
+
+
+def _get_video(video_id, session=None):
+    """Fetch a video's title, description (with choice links as <a> tags), thumbnail and card data.
+
+    Raises VideoFetchError when the video can't be read, instead of returning a placeholder.
+    """
+    return parse_watch_page(video_id, **download_video(video_id, session))
+
+
+def get_video(video_id, session=None):
+    """See _get_video. Callers asking for a video that is already being fetched wait for that fetch."""
+    return _singleflight(('video', video_id), lambda: _get_video(video_id, session))
+
+
+def get_title(video_id, session=None):
+    """See _get_title; coalesced like get_video."""
+    return _singleflight(('title', video_id), lambda: _get_title(video_id, session))
+
+
+def fetch_card_data(video_id, session=None):
+    """See _fetch_card_data; coalesced like get_video."""
+    return _singleflight(('cards', video_id), lambda: _fetch_card_data(video_id, session))
+
+
+async def get_video_async(video_id):
+    """get_video for asyncio code: shares in-flight fetches with thread callers, runs new ones in the default executor."""
+    return await _singleflight_async(('video', video_id), lambda: _get_video(video_id))
+
+
+async def get_title_async(video_id):
+    return await _singleflight_async(('title', video_id), lambda: _get_title(video_id))
+
+
+async def fetch_card_data_async(video_id):
+    return await _singleflight_async(('cards', video_id), lambda: _fetch_card_data(video_id))
+
+
+def _description_from_initial_data(data):
+    """Rebuild the description from ytInitialData, with its links as <a> tags. '' if not found."""
+    description = ''
+    # Navigate to video secondary info renderer for description
+    contents = data.get('contents', {})
+    two_col = contents.get('twoColumnWatchNextResults', {})
+    results = two_col.get('results', {}).get('results', {})
+    contents_list = results.get('contents', [])
+    
+    for content in contents_list:
+        video_secondary = content.get('videoSecondaryInfoRenderer', {})
+        if 'attributedDescription' in video_secondary:
+            desc_data = video_secondary['attributedDescription']
+            
+            # Build description with HTML links from commandRuns
+            if 'content' in desc_data:
+                desc_parts = []
+                content_text = desc_data.get('content', '')
+                command_runs = desc_data.get('commandRuns', [])
+                
+                if command_runs:
+                    # Reconstruct with links
+                    last_end = 0
+                    for run in command_runs:
+                        start_index = run.get('startIndex', 0)
+                        length = run.get('length', 0)
+                        
+                        # Add text before this link
+                        if start_index > last_end:
+                            desc_parts.append(content_text[last_end:start_index])
+                        
+                        # Extract URL from command
+                        command = run.get('onTap', {}).get('innertubeCommand', {})
+                        url_endpoint = command.get('commandMetadata', {}).get('webCommandMetadata', {}).get('url', '')
+                        
+                        link_text = content_text[start_index:start_index + length]
+                        
+                        if url_endpoint:
+                            # Convert to full URL if needed
+                            if url_endpoint.startswith('/'):
+                                url_endpoint = f'https://www.youtube.com{url_endpoint}'
+                            desc_parts.append(f'<a href="{url_endpoint}">{link_text}</a>')
+                        else:
+                            desc_parts.append(link_text)
+                        
+                        last_end = start_index + length
+                    
+                    # Add remaining text
+                    if last_end < len(content_text):
+                        desc_parts.append(content_text[last_end:])
+                    
+                    description = ''.join(desc_parts)
+                else:
+                    # No links, just use content
+                    description = content_text
+                
+                break
+    return description
@@ -4,6 +4,15 @@ import html
 YOUTUBE_RE = re.compile(r'(?:https?://)?(?:www\.)?(?:youtube\.com/watch\?v=|youtu\.be/)([A-Za-z0-9_-]{11})')
 
 
+def extract_video_id(video_url):
+    """Return the video id from a watch?v= or youtu.be/ URL, or None"""
+    if 'v=' in video_url:
+        return video_url.split('v=')[-1].split('&')[0]
+    elif 'youtu.be/' in video_url:
+        return video_url.split('youtu.be/')[-1].split('?')[0]
+    return None
+
+
 def parse_description(text):
     """Parse YouTube links from description HTML or plain text.
 
@@ -36,3 +45,46 @@ def parse_description(text):
             choices.append({'video_id': vid, 'text': ''})
 
     return choices
+
+
+def clean_description(description, choice_labels=None):
+    """Strip choice links, short prompts and bare URLs from a description.
+
+    When `choice_labels` are given, lines equal to a label and labels glued to
+    the end of the text are removed too (YouTube often appends the choice
+    titles without a separator).
+    """
+    if not description:
+        return ''
+
+    cleaned_lines = []
+    for line in description.split('\n'):
+        line_stripped = line.strip()
+        # Skip lines that contain ► (these are choice links)
+        if '►' in line:
+            continue
+        # Skip empty lines
+        if not line_stripped:
+            continue
+        # Skip lines that look like prompts (short questions/phrases before links)
+        # Common patterns: "TRY AGAIN?", "MORE?", "SHH...", etc.
+        if line_stripped.endswith('?') and len(line_stripped) < 20:
+            continue
+        # Skip lines that are URLs
+        if line_stripped.startswith('http://') or line_stripped.startswith('https://'):
+            continue
+        cleaned_lines.append(line)
+
+    text = '\n'.join(cleaned_lines).strip()
+    if not choice_labels:
+        return text
+
+    # Remove lines that exactly match choice labels
+    text = '\n'.join(line for line in text.split('\n') if line.strip() and line.strip() not in choice_labels).strip()
+
+    # Remove appended choice titles from the end (concatenated without spaces/newlines)
+    for label in choice_labels:
+        if label and text.endswith(label):
+            text = text[:-len(label)].strip()
+
+    return text
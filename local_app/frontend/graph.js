@@ -15,17 +15,85 @@
 
   let currentGraphKey = null;
   let allGraphData = null;
+  // Graphs arrive in the skeleton wire format (backend/wire_format.py) and are decoded on first use
+  const decodedGraphs = new Map();
+  // Full node details, fetched on hover/click: `${graphKey}/${nodeId}` -> Promise of detail or null
+  const nodeDetails = new Map();
+  // Sprite maps per graph (null when no sprites have been built for it yet)
+  const spriteMaps = new Map();
+
+  function loadSpriteMap(graphKey) {
+    if (spriteMaps.has(graphKey)) return Promise.resolve(spriteMaps.get(graphKey));
+    return fetch(`/sprites/${encodeURIComponent(graphKey)}.json`)
+      .then(r => r.ok ? r.json() : null)
+      .catch(() => null)
+      .then(map => {
+        spriteMaps.set(graphKey, map);
+        return map;
+      });
+  }
+
+  // Rebuild the node map (outgoing and incoming edges) from the wire format
+  function decodeGraph(wire) {
+    const s = wire.strings, ids = wire.ids;
+    // The skeleton only carries the start of each description; the rest comes from loadDetails
+    const desc = wire.desc || wire.preview;
+    const graph = Object.assign({}, wire.graph);
+    const nodes = {};
+    wire.title.forEach((title, i) => {
+      const id = ids[i], thumb = s[wire.thumb[i]];
+      nodes[id] = {
+        title: s[title],
+        thumbnail: thumb && !thumb.includes('/') ? `https://i.ytimg.com/vi/${id}/${thumb}` : (thumb || null),
+        url: s[wire.url[i]] || `https://www.youtube.com/watch?v=${id}`,
+        clean_description: desc[i],
+        outgoing: [],
+        incoming_from: []
+      };
+      if (wire.length[i] != null) nodes[id].card_data = {lengthSeconds: wire.length[i]};
+    });
+    const e = wire.edges;
+    for (let k = 0; k < e.length; k += 3) {
+      const from = ids[e[k]], to = ids[e[k + 1]];
+      nodes[from].outgoing.push({to, label: s[e[k + 2]]});
+      if (nodes[to]) nodes[to].incoming_from.push({from, label: nodes[from].title});
+    }
+    graph.nodes = nodes;
+    return graph;
+  }
+
+  function loadDetails(graphKey, ids) {
+    const missing = ids.filter(id => !nodeDetails.has(`${graphKey}/${id}`));
+    // The batch endpoint takes up to 100 ids
+    for (let i = 0; i < missing.length; i += 100) {
+      const chunk = missing.slice(i, i + 100);
+      const request = fetch(`/graph/${encodeURIComponent(graphKey)}/nodes?ids=${chunk.map(encodeURIComponent).join(',')}`)
+        .then(r => r.ok ? r.json() : {nodes: {}})
+        .catch(() => ({nodes: {}}));
+      chunk.forEach(id => nodeDetails.set(`${graphKey}/${id}`, request.then(data => data.nodes[id] || null)));
+    }
+    return Promise.all(ids.map(id => nodeDetails.get(`${graphKey}/${id}`)));
+  }
+
+  function forgetDetails(graphKey, ids) {
+    ids.forEach(id => nodeDetails.delete(`${graphKey}/${id}`));
+  }
+
+  function getGraph(graphKey) {
+    if (!decodedGraphs.has(graphKey)) decodedGraphs.set(graphKey, decodeGraph(allGraphData.graphs[graphKey]));
+    return decodedGraphs.get(graphKey);
+  }
 
   // Load graph list and populate dropdown
-  fetch('/graph').then(r=>r.json()).then(data => {
+  fetch('/graph?format=skeleton').then(r=>r.json()).then(data => {
     allGraphData = data;
     const graphSelect = document.getElementById('graphSelect');
-    const keys = Object.keys(data.graphs || {'default': data});
+    const keys = Object.keys(data.graphs);
     
     keys.forEach((key, idx) => {
       const option = document.createElement('option');
       option.value = key;
-      option.textContent = data.graphs ? data.graphs[key].title || key : 'Main Graph';
+      option.textContent = data.graphs[key].graph.title || key;
       graphSelect.appendChild(option);
     });
     
@@ -42,6 +110,54 @@
     renderGraph(currentGraphKey);
   });
 
+  // Apply change-log ops (backend/graph_changes.py) to a loaded graph
+  function applyOps(graph, ops) {
+    ops.forEach(op => {
+      if (op.op === 'set') graph[op.field] = op.value;
+      else if (op.op === 'unset') delete graph[op.field];
+      else if (op.op === 'add') graph.nodes[op.id] = op.node;
+      else if (op.op === 'remove') delete graph.nodes[op.id];
+      else if (op.op === 'update') {
+        const node = graph.nodes[op.id] || (graph.nodes[op.id] = {});
+        Object.assign(node, op.set);
+        (op.unset || []).forEach(field => delete node[field]);
+      }
+    });
+  }
+
+  // Bring the shown graph up to date with only what changed since its version, then redraw
+  async function syncGraph(graphKey) {
+    const graph = getGraph(graphKey);
+    const patch = await fetch(`/graph/${encodeURIComponent(graphKey)}/changes?since=${graph.version || 0}`).then(r => r.json());
+    if (patch.snapshot) {
+      decodedGraphs.set(graphKey, patch.snapshot);
+      forgetDetails(graphKey, Object.keys(graph.nodes));
+    } else {
+      patch.changes.forEach(change => {
+        applyOps(graph, change.ops);
+        forgetDetails(graphKey, change.ops.filter(op => op.id).map(op => op.id));
+      });
+      graph.version = patch.version;
+    }
+    renderGraph(graphKey);
+  }
+
+  // Trailer and bonus videos are fetched in a background job: poll it until it finishes.
+  // A job the server can't find, or one that takes too long, ends as an error
+  const JOB_TIMEOUT_MS = 10 * 60 * 1000;
+
+  async function waitForJob(jobId) {
+    const deadline = Date.now() + JOB_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, 1000));
+      const response = await fetch(`/jobs/${jobId}`);
+      const job = await response.json().catch(() => ({}));
+      if (!response.ok) return {state: 'error', error: job.error || `job status failed (HTTP ${response.status})`};
+      if (job.state === 'done' || job.state === 'error') return job;
+    }
+    return {state: 'error', error: 'timed out waiting for the job to finish'};
+  }
+
   // Add trailer button handler
   document.getElementById('addTrailerBtn').addEventListener('click', async () => {
     const trailerUrl = prompt('Enter trailer YouTube URL:');
@@ -57,10 +173,11 @@
         })
       });
       
-      const result = await response.json();
-      if (response.ok) {
-        alert('Trailer added successfully! Reloading graph...');
-        location.reload();
+      let result = await response.json();
+      if (response.status === 202) result = await waitForJob(result.job_id);
+      if (response.ok && result.state !== 'error') {
+        await syncGraph(currentGraphKey);
+        alert('Trailer added successfully!');
       } else {
         alert('Error: ' + (result.error || 'Unknown error'));
       }
@@ -84,10 +201,11 @@
         })
       });
       
-      const result = await response.json();
-      if (response.ok) {
-        alert('Bonus content added successfully! Reloading graph...');
-        location.reload();
+      let result = await response.json();
+      if (response.status === 202) result = await waitForJob(result.job_id);
+      if (response.ok && result.state !== 'error') {
+        await syncGraph(currentGraphKey);
+        alert('Bonus content added successfully!');
       } else {
         alert('Error: ' + (result.error || 'Unknown error'));
       }
@@ -143,7 +261,7 @@
       .attr('d','M 0 0 L 10 5 L 0 10 z')
       .attr('fill','#666');
     
-    const graph = allGraphData.graphs ? allGraphData.graphs[graphKey] : allGraphData;
+    const graph = getGraph(graphKey);
     
     // Show/hide add trailer button: show only if trailer is null/undefined, hide if set to any value (including 'none')
     const addTrailerBtn = document.getElementById('addTrailerBtn');
@@ -165,7 +283,11 @@
       toggleBonusBtn.style.display = 'block';
     }
     
-    render(graph);
+    loadSpriteMap(graphKey).then(spriteMap => {
+      // Ignore if the user switched graphs while the map was loading
+      if (graphKey !== currentGraphKey) return;
+      render(graph, spriteMap);
+    });
   }
 
   function truncate(s, n=40){ if(!s) return ''; return s.length>n ? s.slice(0,n-1)+'…' : s; }
@@ -221,7 +343,7 @@
     return lines;
   }
 
-  function render(graph){
+  function render(graph, spriteMap){
     const nodesData = graph.nodes;
     const part2VideoId = graph.part2_video_id;
     const stopVideoIds = new Set(graph.stop_video_ids || []);
@@ -620,7 +742,25 @@
     // Add image (16:9 aspect ratio)
     const imgWidth = 80;
     const imgHeight = 45; // 16:9 ratio
-    node.append('image').attr('href', d=>d.data.thumbnail).attr('x', -imgWidth/2).attr('y', -25).attr('width', imgWidth).attr('height', imgHeight).attr('clip-path', 'inset(0 round 6px)').attr('preserveAspectRatio', 'xMidYMid slice');
+    node.each(function(d) {
+      const g = d3.select(this);
+      const tile = spriteMap && spriteMap.tiles[d.data.id];
+      if (tile) {
+        // Show this node's tile by viewing the sheet through a viewBox window
+        const [sheet, sx, sy] = tile;
+        const [tileWidth, tileHeight] = spriteMap.tile;
+        g.append('svg')
+          .attr('x', -imgWidth/2).attr('y', -25).attr('width', imgWidth).attr('height', imgHeight)
+          .attr('viewBox', `${sx} ${sy} ${tileWidth} ${tileHeight}`)
+          .attr('clip-path', 'inset(0 round 6px)')
+          .append('image')
+          .attr('href', `/sprites/${spriteMap.sheets[sheet]}?v=${spriteMap.version}`)
+          .attr('width', spriteMap.columns * tileWidth)
+          .attr('height', spriteMap.rows * tileHeight);
+      } else {
+        g.append('image').attr('href', d.data.thumbnail).attr('x', -imgWidth/2).attr('y', -25).attr('width', imgWidth).attr('height', imgHeight).attr('clip-path', 'inset(0 round 6px)').attr('preserveAspectRatio', 'xMidYMid slice');
+      }
+    });
     
     // Add description
     node.each(function(d) {
@@ -635,6 +775,15 @@
     });
     
     node.append('title').text(d=>`${d.data.title}\n${d.data.clean_description || ''}`);
+
+    // Swap the preview for the full description once the node's details arrive
+    function showDetails(element, d, prefetchIds) {
+      const graphKey = currentGraphKey;
+      loadDetails(graphKey, [d.data.id].concat(prefetchIds || [])).then(([detail]) => {
+        if (!detail || graphKey !== currentGraphKey) return;
+        d3.select(element).select('title').text(`${d.data.title}\n${detail.clean_description || ''}`);
+      });
+    }
     
     // node.append('title').text(d=>`${d.data.title}\n${d.data.clean_description || ''}`);
 
@@ -642,6 +791,7 @@
 
     // Spotlight + hover with ALL incoming paths
     node.on('mouseover', function(event, d) {
+      showDetails(this, d);
       // Don't highlight on hover if locked
       if(isLocked) return;
       
@@ -782,6 +932,8 @@
     }).on('click', function(event, d) {
       // Prevent opening URL when clicking to lock
       event.stopPropagation();
+      // The next hover is likely one of this node's choices: fetch them in the same request
+      showDetails(this, d, (d.data.outgoing || []).map(o => o.to));
       
       // Lock the current highlight
       isLocked = true;
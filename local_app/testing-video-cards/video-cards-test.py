@@ -2,6 +2,9 @@
 """
 Batch YouTube Card Data Extractor
 Automatically extracts card timing and position data from YouTube videos
+
+By default cards are read straight from the watch-page HTML (no browser).
+Set USE_BROWSER in main() to fall back to driving Chrome with Selenium.
 """
 
 import json
@@ -9,12 +12,29 @@ import time
 import sys
 import os
 import re
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.by import By
+    from selenium.common.exceptions import WebDriverException
+except ImportError:
+    # Selenium is only needed for the browser fallback
+    webdriver = None
+    WebDriverException = Exception
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from graph_stream import iter_nodes
+from graph_store import update_graphs
+from youtube_api import fetch_card_data, clean_card_data
 
 # JavaScript to extract card data from the page
 EXTRACT_SCRIPT = """
@@ -132,29 +152,129 @@ def setup_driver(headless=True):
         'domain': '.youtube.com'
     })
     
+    # Consent is remembered by the browser profile, so it only needs accepting once per driver
+    accept_consent(driver)
+    
     return driver
 
-def load_graph_info(json_file):
-    """Load graphs.json and return existing node ids and referenced ids (outgoing/incoming)
-    Returns (set(existing_node_ids), set(referenced_ids))
-    """
+def accept_consent(driver):
+    """Click through the cookie consent popup if it appears"""
     try:
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        print(f"Error: File '{json_file}' not found")
-        return set(), set()
-    except json.JSONDecodeError:
-        print(f"Error: Invalid JSON in '{json_file}'")
-        return set(), set()
+        # Try multiple possible cookie consent button selectors
+        consent_selectors = [
+            "button[aria-label*='Accept']",
+            "button[aria-label*='accept']",
+            "button.yt-spec-button-shape-next--filled",
+            "ytd-button-renderer button"
+        ]
+        for selector in consent_selectors:
+            try:
+                consent_button = WebDriverWait(driver, 2).until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
+                )
+                aria_label = consent_button.get_attribute('aria-label')
+                if 'accept' in consent_button.text.lower() or (aria_label and 'accept' in aria_label.lower()):
+                    consent_button.click()
+                    time.sleep(1)
+                    break
+            except:
+                continue
+    except:
+        pass  # No consent popup or already accepted
+
+def quit_driver(driver):
+    if driver is None:
+        return
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+class DriverPool:
+    """A pool of headless Chrome drivers pulling video ids from a shared queue.
+
+    Each worker thread owns one driver. It is set up (language cookie and
+    consent) once, replaced if the browser crashes, and recycled after
+    `recycle_after` pages to keep Chrome's memory in check. Results are handed
+    back through run() so a single consumer merges them into the graph.
+    """
+
+    def __init__(self, size=4, headless=True, recycle_after=50, delay=1):
+        self.size = size
+        self.headless = headless
+        self.recycle_after = recycle_after
+        self.delay = delay
+
+    def _worker(self, work, results):
+        driver = None
+        pages = 0
+        try:
+            while True:
+                video_id = work.get()
+                if video_id is None:
+                    break
+                data = None
+                # One retry with a fresh browser if the current one has crashed
+                for attempt in range(2):
+                    try:
+                        if driver is None:
+                            driver = setup_driver(headless=self.headless)
+                            pages = 0
+                        data = extract_video_data(driver, video_id, delay=self.delay, quiet=True)
+                        pages += 1
+                        break
+                    except WebDriverException:
+                        quit_driver(driver)
+                        driver = None
+                results.put((video_id, data))
+                if driver is not None and pages >= self.recycle_after:
+                    quit_driver(driver)
+                    driver = None
+        finally:
+            quit_driver(driver)
+            results.put(None)
+
+    def run(self, video_ids):
+        """Yield (video_id, data or None) in completion order"""
+        work = queue.Queue()
+        results = queue.Queue()
+        for video_id in video_ids:
+            work.put(video_id)
+        size = max(1, min(self.size, len(video_ids)))
+        for _ in range(size):
+            work.put(None)
+
+        threads = [threading.Thread(target=self._worker, args=(work, results), daemon=True) for _ in range(size)]
+        for t in threads:
+            t.start()
+
+        running = size
+        while running:
+            item = results.get()
+            if item is None:
+                running -= 1
+                continue
+            yield item
 
-    existing = set()
+def load_graph_info(json_file):
+    """Stream graphs.json and return existing node titles, referenced ids (outgoing/incoming),
+    ids of nodes that have no card data yet and the first graph's key.
+    Returns (dict(existing_node_id -> title), set(referenced_ids), list(nodes_missing_cards), first_graph_key)
+    """
+    existing = {}
     referenced = set()
+    # dict as an ordered set: a node can appear in several graphs
+    missing_cards = {}
+    first_graph = None
 
-    for graph_key, graph_data in data.get('graphs', {}).items():
-        nodes = graph_data.get('nodes', {})
-        for node_id, node_data in nodes.items():
-            existing.add(node_id)
+    try:
+        for graph_key, node_id, node_data in iter_nodes(json_file):
+            if first_graph is None:
+                first_graph = graph_key
+            if not existing.get(node_id):
+                existing[node_id] = node_data.get('title') or ''
+            if not node_data.get('card_data'):
+                missing_cards[node_id] = True
 
             # collect outgoing 'to' ids
             for out in node_data.get('outgoing', []):
@@ -167,8 +287,14 @@ def load_graph_info(json_file):
                 fr = inc.get('from')
                 if fr:
                     referenced.add(fr)
+    except FileNotFoundError:
+        print(f"Error: File '{json_file}' not found")
+        return {}, set(), [], None
+    except (json.JSONDecodeError, ValueError):
+        print(f"Error: Invalid JSON in '{json_file}'")
+        return {}, set(), [], None
 
-    return existing, referenced
+    return existing, referenced, list(missing_cards), first_graph
 
 def load_existing_card_data(json_file):
     try:
@@ -179,38 +305,18 @@ def load_existing_card_data(json_file):
     except json.JSONDecodeError:
         return {}
 
-def extract_video_data(driver, video_id, delay=3):
-    """Extract card data from a single video"""
+def extract_video_data(driver, video_id, delay=3, quiet=False):
+    """Extract card data from a single video
+
+    Raises WebDriverException if the browser itself has died, so a pool can replace it.
+    """
     url = f"https://www.youtube.com/watch?v={video_id}"
     
     try:
-        print(f"  Loading {video_id}...", end=' ', flush=True)
+        if not quiet:
+            print(f"  Loading {video_id}...", end=' ', flush=True)
         driver.get(url)
         
-        # Handle cookie consent popup (if it appears)
-        try:
-            # Try multiple possible cookie consent button selectors
-            consent_selectors = [
-                "button[aria-label*='Accept']",
-                "button[aria-label*='accept']",
-                "button.yt-spec-button-shape-next--filled",
-                "ytd-button-renderer button"
-            ]
-            for selector in consent_selectors:
-                try:
-                    consent_button = WebDriverWait(driver, 2).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
-                    )
-                    aria_label = consent_button.get_attribute('aria-label')
-                    if 'accept' in consent_button.text.lower() or (aria_label and 'accept' in aria_label.lower()):
-                        consent_button.click()
-                        time.sleep(1)
-                        break
-                except:
-                    continue
-        except:
-            pass  # No consent popup or already accepted
-        
         # Wait for page to load the player if not present
         try:
             WebDriverWait(driver, 10).until(
@@ -239,47 +345,88 @@ def extract_video_data(driver, video_id, delay=3):
         except:
             pass  # No ads or already skipped
         
-        # Additional wait for JavaScript to fully load
-        time.sleep(delay)
+        # Wait (up to `delay` seconds) for the player data instead of sleeping a fixed time
+        try:
+            WebDriverWait(driver, delay).until(
+                lambda d: d.execute_script('return !!window.ytInitialPlayerResponse')
+            )
+        except Exception:
+            pass
         
         # Execute extraction script
         data = driver.execute_script(EXTRACT_SCRIPT)
         
         if 'error' in data:
-            print(f"❌ Error: {data['error']}")
+            if not quiet:
+                print(f"❌ Error: {data['error']}")
             return None
         
         # Count items found
-        endscreen_count = len(data.get('endscreen', []))
-        print(f"✓ Found {endscreen_count} endscreen elements")
+        if not quiet:
+            endscreen_count = len(data.get('endscreen', []))
+            print(f"✓ Found {endscreen_count} endscreen elements")
 
         
         return data
         
     except Exception as e:
-        print(f"❌ Failed: {str(e)}")
+        if not _driver_alive(driver):
+            raise
+        if not quiet:
+            print(f"❌ Failed: {str(e)}")
         return None
 
+def _driver_alive(driver):
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+def extract_video_data_http(session, video_id, quiet=False):
+    """Extract card data from a single video's watch-page HTML (no browser)"""
+    if not quiet:
+        print(f"  Fetching {video_id}...", end=' ', flush=True)
+    data = fetch_card_data(video_id, session=session)
+    
+    if 'error' in data:
+        if not quiet:
+            print(f"❌ Error: {data['error']}")
+        return None
+    
+    if not quiet:
+        endscreen_count = len(data.get('endscreen', []))
+        print(f"✓ Found {endscreen_count} endscreen elements")
+    return data
+
+def fetch_all_http(video_ids, workers=8):
+    """Yield (video_id, data or None) for every id, fetching `workers` pages at a time"""
+    import requests
+    session = requests.Session()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {pool.submit(extract_video_data_http, session, vid, True): vid for vid in video_ids}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Drop queued fetches if the consumer stops early (e.g. Ctrl-C)
+        pool.shutdown(wait=False, cancel_futures=True)
+
 def load_existing_videos(json_file):
     """Load video IDs from existing graphs.json"""
     try:
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        video_ids = {}
         
-        video_ids = []
+        # Extract all unique video IDs from the graph, in file order
+        for graph_key, node_id, node_data in iter_nodes(json_file):
+            video_ids[node_id] = True
         
-        # Extract all unique video IDs from the graph
-        for graph_key, graph_data in data.get('graphs', {}).items():
-            for node_id, node_data in graph_data.get('nodes', {}).items():
-                if node_id not in video_ids:
-                    video_ids.append(node_id)
-        
-        return video_ids
+        return list(video_ids)
     
     except FileNotFoundError:
         print(f"Error: File '{json_file}' not found")
         return []
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, ValueError):
         print(f"Error: Invalid JSON in '{json_file}'")
         return []
 
@@ -314,14 +461,107 @@ def clean_text_for_storage(text: str) -> str:
 
     return '\n'.join(cleaned_lines).strip()
 
+class EdgeIndex:
+    """Hash index of one graph's edges, kept in step with the nodes' edge lists.
+
+    Each node's set of `outgoing` targets / `incoming_from` sources is built
+    from its list the first time the node is touched, and updated on every
+    add, so membership checks are O(1) instead of a scan of the list.
+    """
+
+    def __init__(self):
+        self.targets = {}
+        self.sources = {}
+
+    def add_outgoing(self, node_id, node, target, label):
+        targets = self.targets.get(node_id)
+        if targets is None:
+            targets = self.targets[node_id] = {o.get('to') for o in node.setdefault('outgoing', [])}
+        if target in targets:
+            return False
+        node['outgoing'].append({'to': target, 'label': label})
+        targets.add(target)
+        return True
+
+    def add_incoming(self, node_id, node, source, label):
+        sources = self.sources.get(node_id)
+        if sources is None:
+            sources = self.sources[node_id] = {inc.get('from') for inc in node.setdefault('incoming_from', [])}
+        if source in sources:
+            return False
+        node['incoming_from'].append({'from': source, 'label': label})
+        sources.add(source)
+        return True
+
+def merge_node(current, ours):
+    """Fold our copy of a node into the one currently on disk without dropping anyone's data.
+
+    Edges are unioned, other fields are only filled where the file has none.
+    """
+    for key, value in ours.items():
+        if key == 'outgoing':
+            have = {o.get('to') for o in current.get('outgoing', [])}
+            current.setdefault('outgoing', []).extend(o for o in value if o.get('to') not in have)
+        elif key == 'incoming_from':
+            have = {inc.get('from') for inc in current.get('incoming_from', [])}
+            current.setdefault('incoming_from', []).extend(inc for inc in value if inc.get('from') not in have)
+        elif not current.get(key):
+            current[key] = value
+
+def load_progress(progress_file):
+    """Return the set of video ids a previous (interrupted) run already finished"""
+    try:
+        with open(progress_file, 'r', encoding='utf-8') as f:
+            return set(json.load(f).get('done', []))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return set()
+
+def save_checkpoint(json_file, pending, progress_file, done, backfill=None):
+    """Merge the nodes touched since the last checkpoint into graphs.json, then record progress.
+
+    `pending` maps (graph key, node id) to a patch node holding only what this
+    run found; `backfill` maps a video id to a patch for that node in every
+    graph that has it. Patches are folded in with merge_node while the file is
+    held by update_graphs, so nodes written meanwhile by other writers
+    (crawler.run_crawl, the app) are kept and this script never holds the
+    whole file itself. Progress is saved after the graph, so a crash in
+    between only means a few videos are fetched again.
+    """
+    def apply(data):
+        graphs = data.setdefault('graphs', {})
+        for (graph_key, node_id), ours in pending.items():
+            graph = graphs.setdefault(graph_key, {'title': '', 'nodes': {}})
+            merge_node(graph.setdefault('nodes', {}).setdefault(node_id, {}), ours)
+        for vid, ours in (backfill or {}).items():
+            for graph in graphs.values():
+                node = graph.get('nodes', {}).get(vid)
+                if node is not None:
+                    merge_node(node, ours)
+
+    if pending or backfill:
+        update_graphs(apply, json_file)
+        pending.clear()
+
+    tmp = progress_file + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'done': sorted(done)}, f)
+    os.replace(tmp, progress_file)
+
 def main():
     # Configuration
     # Prefer backend data file when available so updates go to the canonical store
     default_backend = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'backend', 'data', 'graphs.json'))
     INPUT_FILE =  default_backend if os.path.exists(default_backend) else 'graphs.json'
-    HEADLESS = False  # Set to False to see the browser
-    DELAY_BETWEEN_VIDEOS = 1  # Seconds to wait for each page to load
+    USE_BROWSER = False  # True = drive Chrome via Selenium instead of parsing the HTML directly
+    HEADLESS = True  # Set to False to see the browsers
+    WORKERS = 4  # Parallel browsers (or HTTP fetches)
+    RECYCLE_AFTER = 50  # Restart each browser after this many pages
+    DELAY_BETWEEN_VIDEOS = 3  # Max seconds to wait for each page's player data (browser only)
     MAX_VIDEOS = 0  # 0 = process all missing; >0 = limit to that many videos
+    CHECKPOINT_EVERY = 25  # Merge results into graphs.json after this many videos...
+    CHECKPOINT_SECONDS = 60  # ...or this many seconds, whichever comes first
+    RESUME = True  # Skip videos an interrupted earlier run already finished
+    PROGRESS_FILE = INPUT_FILE + '.cards-progress.json'
     
     print("=" * 60)
     print("YouTube Card Data Batch Extractor")
@@ -329,28 +569,19 @@ def main():
     
     # Load graph info and existing extracted card data
     print(f"\n📂 Loading graph info from {INPUT_FILE}...")
-    existing_nodes, referenced_ids = load_graph_info(INPUT_FILE)
-
-    # Load full graphs JSON so we can check which nodes already have card data
-    try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            graphs_json = json.load(f)
-    except Exception:
-        graphs_json = {"graphs": {}}
-
-    # Videos that exist as nodes but missing extracted card data
-    nodes_missing_cards = []
-    for gkey, gdata in graphs_json.get('graphs', {}).items():
-        for node_id, node_data in gdata.get('nodes', {}).items():
-            if node_id in existing_nodes:
-                if not node_data.get('card_data'):
-                    nodes_missing_cards.append(node_id)
+    # Also collects videos that exist as nodes but are missing extracted card data
+    titles, referenced_ids, nodes_missing_cards, container_graph_key = load_graph_info(INPUT_FILE)
 
     # Videos referenced in outgoing/incoming but missing as full nodes
-    missing_nodes = list(referenced_ids - existing_nodes)
+    missing_nodes = referenced_ids - titles.keys()
 
     # Prepare list: prioritize completely missing nodes, then nodes missing cards
-    to_process = missing_nodes + [v for v in nodes_missing_cards if v not in missing_nodes]
+    to_process = list(missing_nodes) + [v for v in nodes_missing_cards if v not in missing_nodes]
+
+    done = load_progress(PROGRESS_FILE) if RESUME else set()
+    if done:
+        to_process = [v for v in to_process if v not in done]
+        print(f"↻ Resuming: skipping {len(done)} videos finished by an earlier run")
 
     if not to_process:
         print("❌ No missing videos or missing card data found. Exiting.")
@@ -361,9 +592,15 @@ def main():
 
     print(f"✓ Found {len(to_process)} videos to process (missing: {len(missing_nodes)}, missing_cards: {len(nodes_missing_cards)})")
     
-    # Setup browser
-    print("\n🌐 Starting Chrome browser...")
-    driver = setup_driver(headless=HEADLESS)
+    # Setup browsers (or plain HTTP fetches); workers only extract, this thread merges
+    if USE_BROWSER:
+        if webdriver is None:
+            print("❌ selenium is not installed; set USE_BROWSER = False to use the HTTP extractor")
+            return
+        print(f"\n🌐 Starting {WORKERS} Chrome browsers...")
+        extracted = DriverPool(size=WORKERS, headless=HEADLESS, recycle_after=RECYCLE_AFTER, delay=DELAY_BETWEEN_VIDEOS).run(to_process)
+    else:
+        extracted = fetch_all_http(to_process, workers=WORKERS)
     
     # Extract data from all videos
     results = {}
@@ -384,176 +621,194 @@ def main():
     except Exception:
         crawler = None
 
-    # container graph key to add new nodes into (use first graph available)
-    container_graph_key = next(iter(graphs_json.get('graphs', {})), None)
+    # New nodes go into the first graph in the file (container_graph_key, from load_graph_info)
+
+    # Patch nodes per (graph key, node id) changed since the last checkpoint. They start from
+    # what is known about the node on disk (its title) and are merged into the file by save_checkpoint.
+    pending = {}
+    # Edge indexes over the patch nodes, so merging is linear in the number of endscreen elements
+    edge_indexes = {}
+    since_checkpoint = 0
+    last_checkpoint = time.time()
+    interrupted = False
+
+    def patch(graph_key, node_id):
+        node = pending.get((graph_key, node_id))
+        if node is None:
+            node = pending[(graph_key, node_id)] = {'title': titles.get(node_id, '')}
+        return node
+
+    def checkpoint(backfill=None):
+        nonlocal since_checkpoint, last_checkpoint
+        save_checkpoint(INPUT_FILE, pending, PROGRESS_FILE, done, backfill)
+        # The indexes point at patch nodes that were just merged
+        edge_indexes.clear()
+        since_checkpoint = 0
+        last_checkpoint = time.time()
 
-    for i, video_id in enumerate(to_process, 1):
-        print(f"[{i}/{len(to_process)}]", end=' ')
-
-        data = extract_video_data(driver, video_id, delay=DELAY_BETWEEN_VIDEOS)
+    try:
+        for i, (video_id, data) in enumerate(extracted, 1):
+            if data:
+                print(f"[{i}/{len(to_process)}] {video_id} ✓ Found {len(data.get('endscreen', []))} endscreen elements")
+            else:
+                print(f"[{i}/{len(to_process)}] {video_id} ❌ Failed")
         
-        if data:
-            results[video_id] = data
-            successful += 1
-            # Update graphs.json structure: add node if missing, add outgoing/incoming edges
-            try:
-                elements = data.get('endscreen', [])
-                # ensure container exists
-                if container_graph_key is None:
-                    container_graph_key = video_id
-                    graphs_json.setdefault('graphs', {}).setdefault(container_graph_key, {'title': '', 'nodes': {}})
-
-                nodes = graphs_json['graphs'][container_graph_key].setdefault('nodes', {})
-
-                # add current node if missing; overwrite only when suspiciously empty
-                node = nodes.setdefault(video_id, {})
-                # fill title if empty
-                if not node.get('title'):
-                    node['title'] = data.get('title') or ''
-                node.setdefault('thumbnail', f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg")
-                node.setdefault('url', f"https://www.youtube.com/watch?v={video_id}")
-                # fill description if empty using extracted full description
-                if not node.get('description'):
-                    node['description'] = data.get('description') or ''
-                node.setdefault('outgoing', [])
-                node.setdefault('incoming_from', [])
-                # set clean_description if missing
-                if not node.get('clean_description'):
-                    desc = data.get('description') or ''
-                    node['clean_description'] = clean_text_for_storage(desc) if desc else ''
-                # attach card data
-                node.setdefault('card_data', {})
-
-                # process outgoing targets
-                for el in elements:
-                    target = el.get('targetId')
-                    if not target:
-                        continue
-
-                    # ensure target node exists; if not, create minimal
-                    target_node = nodes.setdefault(target, {})
-                    target_node.setdefault('title', '')
-                    target_node.setdefault('thumbnail', f"https://i.ytimg.com/vi/{target}/maxresdefault.jpg")
-                    target_node.setdefault('url', f"https://www.youtube.com/watch?v={target}")
-                    target_node.setdefault('description', '')
-                    target_node.setdefault('outgoing', [])
-                    target_node.setdefault('incoming_from', [])
-
-                    # If the endscreen provided a title, use it when the target's title is empty
-                    try:
-                        el_title = el.get('title')
-                        if el_title and not target_node.get('title'):
-                            target_node['title'] = el_title
-                    except Exception:
-                        pass
-
-                    # Add element metadata onto the target node itself (only once)
-                    try:
-                        meta = el.get('metadata')
-                        if meta and not target_node.get('card_metadata'):
-                            target_node['card_metadata'] = meta
-                    except Exception:
-                        pass
-
-                    # add outgoing entry on current node (label = target video's title when available)
-                    try:
-                        outgoing_label = target_node.get('title') or el.get('title') or el.get('metadata') or ''
-                        if not any(o.get('to') == target for o in node.get('outgoing', [])):
-                            node['outgoing'].append({'to': target, 'label': outgoing_label})
-                    except Exception:
-                        pass
-
-                    # If this target was one of the missing nodes, invoke crawler to populate it (once)
-                    try:
-                        if crawler and target in missing_nodes and target not in crawled_targets:
-                            print(f"\nInvoking crawler.run_crawl for {target}...", end=' ')
-                            try:
-                                crawler.run_crawl(target, max_nodes=10)
-                                crawled_targets.add(target)
-                                print("done")
-                            except Exception as e:
-                                print(f"failed: {e}")
-                    except Exception:
-                        pass
-
-                    # add incoming entry to target (label = source video's title)
-                    try:
-                        incoming_label = node.get('title') or data.get('title') or ''
-                        if not any(inc.get('from') == video_id for inc in target_node.get('incoming_from', [])):
-                            target_node['incoming_from'].append({'from': video_id, 'label': incoming_label})
-                    except Exception:
-                        pass
-
-                # attach cleaned card data to current node only if missing (avoid duplicate overwrite)
-                if data and not node.get('card_data'):
-                    try:
-                        cleaned = {}
-                        cleaned['endscreen'] = []
-                        for el in data.get('endscreen', []):
+            if data:
+                results[video_id] = data
+                successful += 1
+                # Update graphs.json structure: add node if missing, add outgoing/incoming edges
+                try:
+                    elements = data.get('endscreen', [])
+                    # ensure container exists (created by save_checkpoint)
+                    if container_graph_key is None:
+                        container_graph_key = video_id
+
+                    edges = edge_indexes.setdefault(container_graph_key, EdgeIndex())
+
+                    # add current node if missing; overwrite only when suspiciously empty
+                    node = patch(container_graph_key, video_id)
+                    # fill title if empty
+                    if not node.get('title'):
+                        node['title'] = data.get('title') or ''
+                    titles[video_id] = node['title']
+                    node.setdefault('thumbnail', f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg")
+                    node.setdefault('url', f"https://www.youtube.com/watch?v={video_id}")
+                    # fill description if empty using extracted full description
+                    if not node.get('description'):
+                        node['description'] = data.get('description') or ''
+                    node.setdefault('outgoing', [])
+                    node.setdefault('incoming_from', [])
+                    # set clean_description if missing
+                    if not node.get('clean_description'):
+                        desc = data.get('description') or ''
+                        node['clean_description'] = clean_text_for_storage(desc) if desc else ''
+                    # attach card data
+                    node.setdefault('card_data', {})
+
+                    # process outgoing targets
+                    for el in elements:
+                        target = el.get('targetId')
+                        if not target:
+                            continue
+
+                        # ensure target node exists; if not, create minimal
+                        target_node = patch(container_graph_key, target)
+                        target_node.setdefault('thumbnail', f"https://i.ytimg.com/vi/{target}/maxresdefault.jpg")
+                        target_node.setdefault('url', f"https://www.youtube.com/watch?v={target}")
+                        target_node.setdefault('description', '')
+                        target_node.setdefault('outgoing', [])
+                        target_node.setdefault('incoming_from', [])
+
+                        # If the endscreen provided a title, use it when the target's title is empty
+                        try:
+                            el_title = el.get('title')
+                            if el_title and not target_node.get('title'):
+                                target_node['title'] = titles[target] = el_title
+                        except Exception:
+                            pass
+
+                        # Add element metadata onto the target node itself (only once)
+                        try:
+                            meta = el.get('metadata')
+                            if meta and not target_node.get('card_metadata'):
+                                target_node['card_metadata'] = meta
+                        except Exception:
+                            pass
+
+                        # add outgoing entry on current node (label = target video's title when available)
+                        try:
+                            outgoing_label = target_node.get('title') or el.get('title') or el.get('metadata') or ''
+                            edges.add_outgoing(video_id, node, target, outgoing_label)
+                        except Exception:
+                            pass
+
+                        # If this target was one of the missing nodes, invoke crawler to populate it (once)
+                        try:
+                            if crawler and target in missing_nodes and target not in crawled_targets:
+                                print(f"\nInvoking crawler.run_crawl for {target}...", end=' ')
+                                try:
+                                    crawler.run_crawl(target, max_nodes=10)
+                                    crawled_targets.add(target)
+                                    print("done")
+                                except Exception as e:
+                                    print(f"failed: {e}")
+                        except Exception:
+                            pass
+
+                        # add incoming entry to target (label = source video's title)
+                        try:
+                            incoming_label = node.get('title') or data.get('title') or ''
+                            edges.add_incoming(target, target_node, video_id, incoming_label)
+                        except Exception:
+                            pass
+
+                    # attach cleaned card data to current node only if missing (avoid duplicate overwrite)
+                    if data and not node.get('card_data'):
+                        try:
                             # keep only the essential layout/timing fields
-                            keep = ['aspectRatio', 'endMs', 'left', 'startMs', 'targetId', 'top', 'width']
-                            new_el = {k: el.get(k) for k in keep if el.get(k) is not None}
-                            if new_el:
-                                cleaned['endscreen'].append(new_el)
-                        if data.get('lengthSeconds') is not None:
-                            cleaned['lengthSeconds'] = data.get('lengthSeconds')
-                        node['card_data'] = cleaned
-                    except Exception:
-                        node['card_data'] = {}
-            except Exception as e:
-                print(f"\nWarning updating graphs.json: {e}")
-        else:
-            failed += 1
+                            node['card_data'] = clean_card_data(data)
+                        except Exception:
+                            node['card_data'] = {}
+                except Exception as e:
+                    print(f"\nWarning updating graphs.json: {e}")
+            else:
+                failed += 1
         
-        # Small delay between requests to be polite
-        time.sleep(0.5)
+            # Failed videos are left out of `done` so a resumed run retries them
+            if data:
+                done.add(video_id)
+            since_checkpoint += 1
+            if since_checkpoint >= CHECKPOINT_EVERY or time.time() - last_checkpoint >= CHECKPOINT_SECONDS:
+                checkpoint()
     
-    # Close browser
-    driver.quit()
+    except KeyboardInterrupt:
+        # Keep what was extracted so far; the next run resumes after it
+        interrupted = True
+        print("\n\n⚠️  Interrupted - saving a checkpoint before exiting...")
     
-    # Backfill any missing metadata on nodes for videos we just scraped
+    # Backfill any missing metadata on nodes for videos we just scraped, in every graph that has them
+    backfill = {}
     try:
         for vid, data in results.items():
-            for gkey, gdata in graphs_json.get('graphs', {}).items():
-                node = gdata.get('nodes', {}).get(vid)
-                if not node:
-                    continue
-                # title
-                if not node.get('title'):
-                    node['title'] = data.get('title') or ''
-                # thumbnail/url
-                if not node.get('thumbnail'):
-                    node['thumbnail'] = f"https://i.ytimg.com/vi/{vid}/maxresdefault.jpg"
-                if not node.get('url'):
-                    node['url'] = f"https://www.youtube.com/watch?v={vid}"
-                # description and clean_description
-                if not node.get('description'):
-                    node['description'] = data.get('description') or ''
-                if not node.get('clean_description'):
-                    node['clean_description'] = clean_text_for_storage(data.get('description') or '')
+            backfill[vid] = {
+                'title': data.get('title') or '',
+                'thumbnail': f"https://i.ytimg.com/vi/{vid}/maxresdefault.jpg",
+                'url': f"https://www.youtube.com/watch?v={vid}",
+                'description': data.get('description') or '',
+                'clean_description': clean_text_for_storage(data.get('description') or '')
+            }
     except Exception:
         pass
     
-    # Save updated graphs.json (with card data merged into nodes)
+    # Merge whatever is left since the last checkpoint into graphs.json
     print(f"\n💾 Saving updated graphs to {INPUT_FILE}...")
     try:
-        with open(INPUT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(graphs_json, f, indent=2, ensure_ascii=False)
+        checkpoint(backfill)
         graphs_saved = True
-    except Exception:
+    except Exception as e:
+        print(f"Error saving graphs: {e}")
         graphs_saved = False
     
+    # A finished run starts from scratch next time
+    if graphs_saved and not interrupted:
+        try:
+            os.remove(PROGRESS_FILE)
+        except OSError:
+            pass
+    
     # Summary
     print("\n" + "=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total attempted: {len(to_process)}")
+    print(f"Total attempted: {successful + failed} of {len(to_process)}")
     print(f"Successful:   {successful} ✓")
     print(f"Failed:       {failed} ✗")
     if graphs_saved:
         print(f"\nGraphs updated: {INPUT_FILE}")
     else:
         print("\nGraphs not updated due to write error")
+    if interrupted:
+        print("Run again to resume where this one stopped")
     print("=" * 60)
 
 if __name__ == "__main__":
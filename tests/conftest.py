@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+for path in (os.path.join(ROOT, 'local_app', 'backend'), os.path.join(ROOT, 'tools')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import state_store
+
+
+def _close_connection():
+    conn = getattr(state_store._local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        del state_store._local.conn
+
+
+@pytest.fixture(autouse=True)
+def state_db(tmp_path, monkeypatch):
+    """Point state.db at a fresh file so tests never touch backend/data"""
+    _close_connection()
+    monkeypatch.setattr(state_store, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(state_store, 'STATE_PATH', str(tmp_path / 'state.db'))
+    yield tmp_path / 'state.db'
+    _close_connection()
+
+
+@pytest.fixture
+def graphs_path(tmp_path):
+    return str(tmp_path / 'graphs.json')
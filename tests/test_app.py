@@ -0,0 +1,93 @@
+import gzip
+
+import pytest
+
+import app as app_module
+import graph_store
+from graph_store import update_graphs
+
+GRAPH = {'title': 'Story', 'nodes': {'r': {'title': 'Root', 'clean_description': 'Start ' * 50, 'outgoing': []}}}
+
+
+@pytest.fixture
+def client(graphs_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'GRAPHS_FILE', graphs_path)
+    update_graphs(lambda data: data['graphs'].__setitem__('r', GRAPH), graphs_path)
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize('url', ['/graph', '/graph/r', '/graph?format=compact'])
+def test_each_encoding_has_its_own_etag(client, url):
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    tag, _ = plain.get_etag()
+
+    zipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert zipped.get_etag() == (tag + '-gz', False)
+    assert gzip.decompress(zipped.get_data()) == plain.get_data()
+    assert 'Accept-Encoding' in zipped.vary
+
+    br = client.get(url, headers={'Accept-Encoding': 'br'})
+    if graph_store.brotli is None:
+        # Without the optional module, a br-only client gets the identity body
+        assert 'Content-Encoding' not in br.headers and br.get_etag() == (tag, False)
+    else:
+        assert br.headers['Content-Encoding'] == 'br'
+        assert br.get_etag() == (tag + '-br', False)
+        assert graph_store.brotli.decompress(br.get_data()) == plain.get_data()
+
+
+@pytest.mark.parametrize('suffix', ['', '-gz', '-br'])
+def test_if_none_match_hit_returns_the_matching_tag(client, suffix):
+    tag, _ = client.get('/graph/r').get_etag()
+    response = client.get('/graph/r', headers={'If-None-Match': f'"{tag}{suffix}"', 'Accept-Encoding': 'gzip'})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.get_etag() == (tag + suffix, False)
+
+
+def test_if_none_match_miss_after_a_change(client, graphs_path):
+    tag, _ = client.get('/graph/r').get_etag()
+    update_graphs(lambda data: data['graphs']['r'].__setitem__('title', 'Changed'), graphs_path)
+
+    response = client.get('/graph/r', headers={'If-None-Match': f'"{tag}", "{tag}-gz"'})
+    assert response.status_code == 200
+    assert response.get_json()['title'] == 'Changed'
+    assert response.get_etag()[0] != tag
+
+
+def test_ingest_and_crawl_refuse_each_others_stories(client, monkeypatch):
+    import crawler
+    import ingest
+    import jobs
+    import state_store
+
+    submitted = {}
+    monkeypatch.setattr(jobs, 'submit', lambda kind, params, fn: submitted.setdefault(kind, (params, fn)) and 'job')
+    calls = []
+    monkeypatch.setattr(ingest, 'ingest', lambda stories, **kwargs: calls.append(kwargs) or {'stories': {}})
+    story = {'url': 'https://youtu.be/aaaaaaaaaaa'}
+
+    assert crawler.claim_crawl('aaaaaaaaaaa')
+    response = client.post('/ingest', json={'stories': [story]})
+    assert response.status_code == 409
+
+    # Once the crawl is over the job is queued, and it parses in a capped pool
+    state_store.save_crawl_status(dict(state_store.IDLE_STATUS, state='done'))
+    assert client.post('/ingest', json={'stories': [story]}).status_code == 202
+    params, job = submitted['ingest']
+    assert params == {'stories': ['aaaaaaaaaaa']}
+    job()
+    assert 1 <= calls[0]['parse_workers'] <= app_module.INGEST_PARSE_WORKERS
+
+    # A crawl that starts while the job is queued stops it from running
+    assert crawler.claim_crawl('aaaaaaaaaaa')
+    with pytest.raises(RuntimeError):
+        job()
+    state_store.save_crawl_status(dict(state_store.IDLE_STATUS, state='done'))
+
+    state_store.create_job('queued-ingest', 'ingest', params)
+    response = client.post('/crawl', json={'url': 'https://youtu.be/aaaaaaaaaaa'})
+    assert response.status_code == 409
+    assert state_store.running_crawl_root() is None
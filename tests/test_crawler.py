@@ -0,0 +1,97 @@
+import functools
+
+import pytest
+
+import crawler
+from graph_store import read_graphs, update_graphs
+
+
+def _story():
+    return {
+        'rrrrrrrrrrr': ('Root', 'Start\nLeft ► https://youtu.be/aaaaaaaaaaa\nRight ► https://youtu.be/bbbbbbbbbbb'),
+        'aaaaaaaaaaa': ('Left', 'The end'),
+        'bbbbbbbbbbb': ('Right', 'The end')
+    }
+
+
+def _fetcher(story, during=None):
+    def fetch(vid):
+        if during and vid in during:
+            during.pop(vid)()
+        title, description = story[vid]
+        return {'title': title, 'description': description}
+    return fetch
+
+
+def _save_story(path, story):
+    nodes = crawler.crawl_story('rrrrrrrrrrr', fetch=_fetcher(story), delay=0)
+    crawler.save_graph('rrrrrrrrrrr', crawler.graph_record(nodes, 'rrrrrrrrrrr'), path)
+
+
+def test_refresh_keeps_edits_made_while_it_runs(graphs_path):
+    story = _story()
+    _save_story(graphs_path, story)
+
+    story['bbbbbbbbbbb'] = ('Right', 'Not the end\nOnwards ► https://youtu.be/ddddddddddd')
+    story['ddddddddddd'] = ('New', 'The end')
+
+    def add_bonus():
+        def apply(graphs):
+            graph = graphs['graphs']['rrrrrrrrrrr']
+            graph['nodes']['xxxxxxxxxxx'] = {'title': 'Bloopers', 'outgoing': [], 'incoming_from': []}
+            graph['bonus_video_ids'] = ['xxxxxxxxxxx']
+            graph['hide_bonus_button'] = True
+            graph['nodes']['aaaaaaaaaaa']['card_data'] = {'endscreen': []}
+        update_graphs(apply, graphs_path)
+
+    summary = crawler.refresh_story('rrrrrrrrrrr', graphs_path, fetch=_fetcher(story, {'aaaaaaaaaaa': add_bonus}), delay=0)
+    assert summary['changed'] == ['bbbbbbbbbbb']
+    assert summary['added'] == ['ddddddddddd']
+
+    graph = read_graphs(graphs_path)['graphs']['rrrrrrrrrrr']
+    assert graph['bonus_video_ids'] == ['xxxxxxxxxxx']
+    assert graph['hide_bonus_button'] is True
+    assert graph['nodes']['xxxxxxxxxxx']['title'] == 'Bloopers'
+    assert graph['nodes']['aaaaaaaaaaa']['card_data'] == {'endscreen': []}
+    assert [o['to'] for o in graph['nodes']['bbbbbbbbbbb']['outgoing']] == ['ddddddddddd']
+    assert graph['nodes']['ddddddddddd']['incoming_from'] == [{'from': 'bbbbbbbbbbb', 'label': 'Right'}]
+
+
+def test_refresh_without_changes_does_not_write(graphs_path):
+    story = _story()
+    _save_story(graphs_path, story)
+    version = read_graphs(graphs_path)['graphs']['rrrrrrrrrrr']['version']
+
+    summary = crawler.refresh_story('rrrrrrrrrrr', graphs_path, fetch=_fetcher(story), delay=0)
+    assert summary['changed'] == [] and summary['added'] == []
+    assert read_graphs(graphs_path)['graphs']['rrrrrrrrrrr']['version'] == version
+
+
+def test_refresh_of_a_deleted_graph_writes_nothing_back(graphs_path):
+    story = _story()
+    _save_story(graphs_path, story)
+    story['aaaaaaaaaaa'] = ('Left', 'Changed')
+
+    def delete():
+        update_graphs(lambda graphs: graphs['graphs'].pop('rrrrrrrrrrr'), graphs_path)
+
+    crawler.refresh_story('rrrrrrrrrrr', graphs_path, fetch=_fetcher(story, {'bbbbbbbbbbb': delete}), delay=0)
+    assert 'rrrrrrrrrrr' not in read_graphs(graphs_path)['graphs']
+
+
+@pytest.mark.parametrize('interval, saves', [(0, 4), (3600, 2)])
+def test_run_crawl_debounces_partial_saves(monkeypatch, interval, saves):
+    saved = []
+    monkeypatch.setattr(crawler, 'SAVE_INTERVAL', interval)
+    monkeypatch.setattr(crawler, 'crawl_story', functools.partial(crawler.crawl_story, fetch=_fetcher(_story()), delay=0))
+    monkeypatch.setattr(crawler, 'save_graph', lambda root_id, graph: saved.append(sorted(graph['nodes'])))
+    crawler.reset_state()
+
+    crawler.run_crawl('rrrrrrrrrrr')
+
+    # The first node is saved at once, so the graph shows up, and the finished graph always is
+    assert len(saved) == saves
+    assert saved[0] == ['rrrrrrrrrrr']
+    assert saved[-1] == ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'rrrrrrrrrrr']
+    assert crawler.get_status()['state'] == 'done'
+    assert crawler.get_status()['nodes'] == 3
@@ -0,0 +1,51 @@
+import pytest
+
+import failures
+from youtube_api import VideoFetchError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000000.0]
+    # failures and state_store share the time module
+    monkeypatch.setattr(failures.time, 'time', lambda: now[0])
+    return now
+
+
+def test_retry_delay_backs_off_and_caps():
+    assert [failures.retry_delay('transient', n) for n in (1, 2, 3)] == [60, 120, 240]
+    assert failures.retry_delay('throttled', 1) == 15 * 60
+    assert failures.retry_delay('transient', 30) == failures.MAX_BACKOFF
+    assert failures.retry_delay('removed', 1) == failures.retry_delay('private', 9) == failures.NEGATIVE_TTL
+
+
+def test_failures_wait_out_their_backoff(clock):
+    entry = failures.record_failure('vvvvvvvvvvv', VideoFetchError('vvvvvvvvvvv', 'transient', 'timeout'))
+    assert (entry['attempts'], entry['retry_at']) == (1, clock[0] + 60)
+    with pytest.raises(VideoFetchError) as e:
+        failures.check('vvvvvvvvvvv')
+    assert e.value.kind == 'transient'
+
+    clock[0] += 61
+    failures.check('vvvvvvvvvvv')
+    assert [entry['video_id'] for entry in failures.list_failures(due=True)] == ['vvvvvvvvvvv']
+
+    # Failing again doubles the wait
+    entry = failures.record_failure('vvvvvvvvvvv', RuntimeError('connection reset'))
+    assert (entry['attempts'], entry['retry_at'] - clock[0]) == (2, 120)
+    assert failures.list_failures(due=True) == []
+
+    failures.record_success('vvvvvvvvvvv')
+    failures.check('vvvvvvvvvvv')
+    assert failures.known_failures(['vvvvvvvvvvv']) == {}
+
+
+def test_removed_videos_are_negatively_cached(clock):
+    failures.record_failure('ggggggggggg', VideoFetchError('ggggggggggg', 'removed', 'Video unavailable'))
+    clock[0] += failures.NEGATIVE_TTL - 1
+    with pytest.raises(VideoFetchError):
+        failures.check('ggggggggggg')
+    assert list(failures.known_failures(['ggggggggggg', 'hhhhhhhhhhh'])) == ['ggggggggggg']
+    # Permanent kinds are not retried by retry_due
+    assert failures.list_failures(kind='removed')[0]['attempts'] == 1
+    assert failures.retry_due() == {'recovered': [], 'failed': []}
@@ -0,0 +1,97 @@
+import copy
+
+import crawler
+from graph_changes import changes_since, diff_graph
+from graph_store import read_graphs, update_graphs
+
+# A small story: r -> a, b; a -> c
+STORY = {
+    'r': ('Root', 'Start\nLeft ► https://youtu.be/aaaaaaaaaaa\nRight ► https://youtu.be/bbbbbbbbbbb'),
+    'aaaaaaaaaaa': ('Left', 'Go on ► https://youtu.be/ccccccccccc'),
+    'bbbbbbbbbbb': ('Right', 'The end'),
+    'ccccccccccc': ('Deeper', 'The end')
+}
+
+
+def _fetch(vid):
+    title, description = STORY[vid]
+    return {'title': title, 'description': description}
+
+
+def apply_ops(graph, ops):
+    """What a viewer does with a changes_since() patch"""
+    graph = copy.deepcopy(graph)
+    nodes = graph.setdefault('nodes', {})
+    for op in ops:
+        if op['op'] == 'set':
+            graph[op['field']] = op['value']
+        elif op['op'] == 'unset':
+            graph.pop(op['field'], None)
+        elif op['op'] == 'add':
+            nodes[op['id']] = op['node']
+        elif op['op'] == 'update':
+            nodes[op['id']].update(op['set'])
+            for key in op.get('unset', []):
+                nodes[op['id']].pop(key, None)
+        elif op['op'] == 'remove':
+            nodes.pop(op['id'], None)
+    return graph
+
+
+def _strip(graph):
+    return {k: v for k, v in graph.items() if k != 'version'}
+
+
+def test_diff_graph_ops():
+    old = {'title': 'A', 'gone': 1, 'version': 3, 'nodes': {'x': {'t': 1, 'u': 2}, 'y': {}}}
+    new = {'title': 'B', 'version': 4, 'nodes': {'x': {'t': 5}, 'z': {'t': 0}}}
+    assert diff_graph(old, new) == [
+        {'op': 'set', 'field': 'title', 'value': 'B'},
+        {'op': 'unset', 'field': 'gone'},
+        {'op': 'update', 'id': 'x', 'set': {'t': 5}, 'unset': ['u']},
+        {'op': 'add', 'id': 'z', 'node': {'t': 0}},
+        {'op': 'remove', 'id': 'y'}
+    ]
+
+
+def test_crawl_saves_are_logged_node_by_node(graphs_path):
+    # Saved the way run_crawl does: the live nodes dict goes into every save
+    seen = []
+
+    def save(nodes, edges):
+        crawler.save_graph('r', crawler.graph_record(nodes, 'r'), graphs_path)
+        graph = read_graphs(graphs_path)['graphs']['r']
+        seen.append((graph['version'], copy.deepcopy(graph)))
+
+    nodes = crawler.crawl_story('r', fetch=_fetch, on_node=save, delay=0)
+    crawler.save_graph('r', crawler.graph_record(nodes, 'r'), graphs_path)
+    final = read_graphs(graphs_path)['graphs']['r']
+
+    # Every save changed the graph, so every one got its own version
+    assert [version for version, _ in seen] == [1, 2, 3, 4]
+    assert final['version'] == 5
+    # The cached copy is not the crawl's dict: edges added after a save don't leak into it
+    assert seen[0][1]['nodes']['r'].get('outgoing') is None
+    assert final['nodes'] is not nodes
+
+    # A viewer at any version catches up to exactly the saved graph
+    for version, graph in seen:
+        patch = changes_since(graphs_path, 'r', final, version)
+        assert [change['version'] for change in patch['changes']] == list(range(version + 1, 6))
+        for change in patch['changes']:
+            graph = apply_ops(graph, change['ops'])
+        assert _strip(graph) == _strip(final)
+
+
+def test_update_graphs_copies_objects_fn_stores(graphs_path):
+    mine = {'title': 'mine', 'nodes': {}}
+    update_graphs(lambda data: data['graphs'].__setitem__('g', mine), graphs_path)
+    mine['nodes']['x'] = {'title': 'later'}
+
+    assert read_graphs(graphs_path)['graphs']['g']['nodes'] == {}
+    update_graphs(lambda data: data['graphs'].__setitem__('g', mine), graphs_path)
+    graph = read_graphs(graphs_path)['graphs']['g']
+    assert graph['version'] == 2
+    assert changes_since(graphs_path, 'g', graph, 1)['changes'][0]['ops'] == [
+        {'op': 'add', 'id': 'x', 'node': {'title': 'later'}}
+    ]
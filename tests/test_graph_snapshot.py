@@ -0,0 +1,75 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from graph_snapshot import GraphSnapshot, build_snapshot, open_snapshot, snapshot_path
+from graph_store import _encode, _signature, update_graphs
+
+
+def _document(title='Story'):
+    return {'graphs': {'root': {'title': title, 'nodes': {
+        'root': {'title': 'Root', 'description': 'Start', 'outgoing': [{'to': 'left', 'label': 'Left'},
+                                                                      {'to': 'other', 'label': 'Elsewhere'}]},
+        'left': {'title': 'Left', 'description': 'The end', 'outgoing': []}
+    }}}}
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    filename = tmp_path / 'graphs.snap'
+    filename.write_bytes(build_snapshot(_document()))
+    snap = GraphSnapshot(str(filename))
+    yield snap
+    try:
+        snap.close()
+    except BufferError:
+        pass
+
+
+def test_bodies_are_views_of_the_map(snapshot):
+    body, etag = snapshot.graph('root')
+    assert isinstance(body, memoryview)
+    assert bytes(body) == _encode(_document()['graphs']['root'])
+    assert isinstance(etag, str) and len(etag) == 32
+    assert gzip.decompress(snapshot.graph_body('root', 'plain', 'gzip')) == bytes(body)
+    assert snapshot.graph('missing') is None
+
+
+def test_close_refuses_while_views_are_held(snapshot):
+    body = snapshot.graph_body('root')
+    with pytest.raises(BufferError):
+        snapshot.close()
+    del body
+    snapshot.close()
+
+
+def test_nodes_and_edges(snapshot):
+    assert snapshot.graph_ids() == ['root']
+    detail = json.loads(bytes(snapshot.node_detail('root', 'left')))
+    assert detail['description'] == 'The end'
+    assert snapshot.node_detail('root', 'other') is None
+    assert json.loads(snapshot.node_details('root', ['root', 'nope']))['nodes'].keys() == {'root'}
+    assert snapshot.reachable('root', 'root') == {'root': 0, 'left': 1, 'other': 1}
+    stats = snapshot.stats('root')
+    assert (stats['nodes'], stats['edges'], stats['uncrawled_targets'], stats['max_depth']) == (2, 2, 1, 1)
+
+
+def test_snapshot_name_includes_the_inode(graphs_path, tmp_path):
+    update_graphs(lambda data: data.update(_document('First')), graphs_path)
+    first = _signature(graphs_path)
+    assert open_snapshot(graphs_path).graph_ids() == ['root']
+
+    # Replaced by another writer with the same size and mtime: only the inode tells them apart
+    other = str(tmp_path / 'other.json')
+    with open(other, 'w', encoding='utf-8') as f, open(graphs_path, encoding='utf-8') as current:
+        f.write(current.read().replace('First', 'Other'))
+    os.utime(other, ns=(first[0], first[0]))
+    os.replace(other, graphs_path)
+    second = _signature(graphs_path)
+    assert second[:2] == first[:2] and second[2] != first[2]
+    assert snapshot_path(graphs_path, second) != snapshot_path(graphs_path, first)
+
+    body, _ = open_snapshot(graphs_path).graph('root')
+    assert json.loads(bytes(body))['title'] == 'Other'
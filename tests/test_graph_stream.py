@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import time
+
+from graph_changes import changes_since
+from graph_snapshot import snapshot_path
+from graph_store import _signature, graphs_lock, load_graphs, read_graphs, update_graphs
+from graph_stream import GraphsWriter, iter_events, iter_graphs, iter_nodes, transform_graphs, transform_nodes
+
+
+def _document():
+    return {
+        'schema_version': 3,
+        'graphs': {
+            'aaa': {'title': 'First é', 'nodes': {'aaa': {'title': 'A', 'edges': ['bbb']}, 'bbb': {'title': 'B', 'edges': []}},
+                    'trailer_id': 'ttt'},
+            'ccc': {'title': 'Second', 'nodes': {}, 'bonus_ids': []}
+        },
+        'settings': {'n': 12345678901234567890}
+    }
+
+
+def _write(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def test_writer_round_trip_matches_json_dump(graphs_path, tmp_path):
+    _write(graphs_path, _document())
+    out = str(tmp_path / 'out.json')
+    with GraphsWriter(out) as w:
+        for event in iter_events(graphs_path):
+            w.write_event(event)
+
+    with open(graphs_path, encoding='utf-8') as a, open(out, encoding='utf-8') as b:
+        assert a.read() == b.read()
+    assert list(iter_nodes(out)) == [('aaa', 'aaa', {'title': 'A', 'edges': ['bbb']}),
+                                     ('aaa', 'bbb', {'title': 'B', 'edges': []})]
+    assert dict(iter_graphs(out)) == _document()['graphs']
+    # No temp file is left behind; the rest are out.json's published variants and snapshot
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+    assert os.path.exists(snapshot_path(out, _signature(out)))
+
+
+def test_failed_write_keeps_the_file_and_releases_the_lock(graphs_path, tmp_path):
+    _write(graphs_path, _document())
+    try:
+        with GraphsWriter(graphs_path) as w:
+            w.write_graph('x', {'nodes': {}})
+            raise RuntimeError('boom')
+    except RuntimeError:
+        pass
+    assert load_graphs(graphs_path) == _document()
+    assert sorted(os.listdir(tmp_path)) == ['graphs.json']
+
+
+def test_transform_nodes_only_rewrites_on_change(graphs_path):
+    _write(graphs_path, _document())
+    before = os.stat(graphs_path).st_mtime_ns
+
+    assert transform_nodes(graphs_path, lambda graph_id, node_id, node, fields: False) == 0
+    assert os.stat(graphs_path).st_mtime_ns == before
+
+    def mark(graph_id, node_id, node, fields):
+        node['trailer'] = fields.get('trailer_id')
+        return True
+
+    assert transform_nodes(graphs_path, mark) == 2
+    assert load_graphs(graphs_path)['graphs']['aaa']['nodes']['bbb']['trailer'] == 'ttt'
+
+
+def test_transforms_bump_versions_and_log_ops(graphs_path):
+    update_graphs(lambda data: data.update(_document()), graphs_path)
+    assert read_graphs(graphs_path)['graphs']['aaa']['version'] == 1
+
+    def mark(graph_id, node_id, node, fields):
+        if node_id != 'bbb':
+            return False
+        node['seen'] = True
+        return True
+
+    assert transform_nodes(graphs_path, mark) == 1
+
+    def retitle(graph_id, graph):
+        graph['title'] = 'Renamed'
+        return True
+
+    transform_graphs(graphs_path, retitle, workers=1)
+
+    graphs = read_graphs(graphs_path)['graphs']
+    assert (graphs['aaa']['version'], graphs['ccc']['version']) == (3, 2)
+    assert changes_since(graphs_path, 'aaa', graphs['aaa'], 1)['changes'] == [
+        {'version': 2, 'ops': [{'op': 'update', 'id': 'bbb', 'set': {'seen': True}}]},
+        {'version': 3, 'ops': [{'op': 'set', 'field': 'title', 'value': 'Renamed'}]}
+    ]
+    assert os.path.exists(snapshot_path(graphs_path, _signature(graphs_path)))
+
+
+def test_transform_waits_for_update_graphs(graphs_path):
+    # An update holding the lock must land before the transform reads the file, not be overwritten by it
+    _write(graphs_path, _document())
+    locked = threading.Event()
+
+    def slow_update():
+        with graphs_lock(graphs_path):
+            locked.set()
+            time.sleep(0.3)
+            data = load_graphs(graphs_path)
+            data['graphs']['ccc']['nodes']['ddd'] = {'title': 'D'}
+            _write(graphs_path, data)
+
+    thread = threading.Thread(target=slow_update)
+    thread.start()
+    locked.wait()
+
+    def rename(graph_id, graph):
+        graph['title'] = graph['title'].upper()
+        return True
+
+    assert transform_graphs(graphs_path, rename, workers=1) == 2
+    thread.join()
+
+    graphs = load_graphs(graphs_path)['graphs']
+    assert graphs['ccc']['title'] == 'SECOND'
+    assert graphs['ccc']['nodes'] == {'ddd': {'title': 'D'}}
+
+
+def test_update_graphs_waits_for_writer(graphs_path):
+    _write(graphs_path, _document())
+    done = []
+
+    def add(data):
+        data['graphs']['eee'] = {'nodes': {}}
+
+    with GraphsWriter(graphs_path) as w:
+        thread = threading.Thread(target=lambda: done.append(update_graphs(add, graphs_path)))
+        thread.start()
+        time.sleep(0.2)
+        assert not done
+        for event in iter_events(graphs_path):
+            w.write_event(event)
+    thread.join()
+    assert set(load_graphs(graphs_path)['graphs']) == {'aaa', 'ccc', 'eee'}
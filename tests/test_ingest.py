@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+import ingest
+from bench_pipeline import synthetic_page, video_id
+from graph_store import read_graphs
+from youtube_api import VideoFetchError
+
+
+@pytest.fixture
+def no_delay(monkeypatch):
+    monkeypatch.setattr(ingest, 'FETCH_DELAY', 0)
+
+
+def _story(first, videos):
+    pages = {video_id(n): synthetic_page(n, 1) for n in range(first, first + videos)}
+    return pages, ingest.parse_story({'url': f'https://youtu.be/{video_id(first)}', 'max_nodes': videos})
+
+
+class Downloads:
+    """Fake download stage that records how many pages were being fetched at once"""
+
+    def __init__(self, pages, latency=0.02):
+        self.pages = pages
+        self.latency = latency
+        self.calls = []
+        self.in_flight = self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, vid):
+        with self.lock:
+            self.calls.append(vid)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            if vid not in self.pages:
+                raise VideoFetchError(vid, 'removed', 'Video unavailable')
+            return {'title': None, 'page': self.pages[vid], 'encoding': 'utf-8'}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def test_one_story_keeps_several_fetches_in_flight(graphs_path, no_delay):
+    pages, story = _story(0, 30)
+    download = Downloads(pages)
+    summary = ingest.ingest([story], graphs_path, max_fetches=4, parse_workers=1, download=download)
+
+    assert summary['stories'] == {video_id(0): {'nodes': 30, 'error': None}}
+    assert len(read_graphs(graphs_path)['graphs'][video_id(0)]['nodes']) == 30
+    # Prefetching the frontier, not one page at a time
+    assert download.peak > 1
+    # Nothing fetched twice: the 30 pages and the two dead links past the end
+    assert len(download.calls) == len(set(download.calls)) == 32
+
+    again = Downloads(pages)
+    summary = ingest.ingest([story], graphs_path, max_fetches=4, parse_workers=1, download=again)
+    assert summary['videos_fetched'] == 0
+    assert again.calls == []
+
+
+@pytest.mark.parametrize('fetches', [1, 3, 6])
+def test_fetches_caps_requests_across_stories(graphs_path, no_delay, fetches):
+    pages, stories = {}, []
+    for s in range(3):
+        story_pages, story = _story(s * 22, 20)
+        pages.update(story_pages)
+        stories.append(story)
+    download = Downloads(pages)
+    summary = ingest.ingest(stories, graphs_path, max_stories=3, max_fetches=fetches, parse_workers=1, download=download)
+
+    assert all(r == {'nodes': 20, 'error': None} for r in summary['stories'].values())
+    # Never exceeded...
+    assert download.peak <= fetches
+    # ...and used: each story has several pages in flight, so more than one per story once allowed
+    assert download.peak >= min(fetches, len(stories) + 1)
@@ -0,0 +1,64 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import jobs
+import state_store
+
+
+@pytest.fixture(autouse=True)
+def executor(monkeypatch):
+    # Fresh threads: pool threads keep their state.db connection, which would point at an earlier test's file
+    pool = ThreadPoolExecutor(max_workers=jobs.JOB_WORKERS)
+    monkeypatch.setattr(jobs, '_executor', pool)
+    yield pool
+    pool.shutdown()
+
+
+def _wait(job_id, states=('done', 'error'), timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get_job(job_id)
+        if job['state'] in states:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'job still {job["state"]}')
+
+
+def test_job_of_a_dead_worker_is_reported_lost(monkeypatch):
+    # Left 'running' by a worker that exited: nothing heartbeats it any more
+    state_store.create_job('gone', 'add_bonus', {})
+    state_store.update_job('gone', 'running')
+    assert jobs.get_job('gone')['state'] == 'running'
+
+    monkeypatch.setattr(time, 'time', lambda now=time.time(): now + state_store.STALE_SECONDS + 1)
+    job = jobs.get_job('gone')
+    assert job['state'] == 'error'
+    assert job['error'] == state_store.LOST_JOB_ERROR
+
+
+def test_heartbeat_keeps_long_jobs_alive(monkeypatch):
+    monkeypatch.setattr(state_store, 'STALE_SECONDS', 0.3)
+    monkeypatch.setattr(jobs, 'HEARTBEAT_SECONDS', 0.05)
+    monkeypatch.setattr(jobs, '_heartbeat', None)
+    release = threading.Event()
+
+    job_id = jobs.submit('test', {}, lambda: release.wait() and {'ok': True})
+    _wait(job_id, ('running',))
+    time.sleep(1)
+    assert jobs.get_job(job_id)['state'] == 'running'
+
+    release.set()
+    job = _wait(job_id)
+    assert (job['state'], job['result']) == ('done', {'ok': True})
+    assert job_id not in jobs._active
+
+
+def test_failed_job_reports_its_error():
+    def fail():
+        raise RuntimeError('no such video')
+
+    job = _wait(jobs.submit('test', {}, fail))
+    assert (job['state'], job['error']) == ('error', 'no such video')
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+import failures
+import video_store
+from bench_pipeline import synthetic_page, video_id
+from pipeline import VideoPipeline
+from youtube_api import VideoFetchError
+
+PAGES = {video_id(n): synthetic_page(n, 1) for n in range(6)}
+EMPTY = video_id(100)
+
+
+def _download(calls):
+    lock = threading.Lock()
+
+    def download(vid):
+        with lock:
+            calls.append(vid)
+        if vid == EMPTY:
+            return {'title': 'No data', 'page': b'<html><title>Consent</title></html>', 'encoding': 'utf-8'}
+        if vid not in PAGES:
+            raise VideoFetchError(vid, 'removed', 'Video unavailable')
+        return {'title': None, 'page': PAGES[vid], 'encoding': 'utf-8'}
+    return download
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_fetch_parse_and_store(workers):
+    calls = []
+    with VideoPipeline(fetchers=2, parse_workers=workers, download=_download(calls)) as pipeline:
+        video = pipeline.get_video(video_id(0))
+        assert video['title'] == 'Video 0'
+        assert [link['video_id'] for link in video['links']] == [video_id(1), video_id(2)]
+        # Stored with its links, so the next request doesn't fetch
+        assert pipeline.get_video(video_id(0))['links'] == video['links']
+        assert video_store.get_videos([video_id(0)])[video_id(0)]['title'] == 'Video 0'
+
+        # Errors raised in a parse worker keep their kind, and land in the ledger
+        with pytest.raises(VideoFetchError) as e:
+            pipeline.get_video(EMPTY)
+        assert e.value.kind == 'transient'
+        with pytest.raises(VideoFetchError) as e:
+            pipeline.get_video(video_id(99))
+        assert e.value.kind == 'removed'
+        assert set(failures.known_failures([EMPTY, video_id(99)])) == {EMPTY, video_id(99)}
+        # ...which is checked before fetching again
+        with pytest.raises(VideoFetchError):
+            pipeline.get_video(video_id(99))
+    assert calls == [video_id(0), EMPTY, video_id(99)]
+    assert (pipeline.fetched, pipeline.hits) == (1, 0)
+
+
+def test_prefetch_skips_what_get_video_would_not_fetch():
+    calls = []
+    with VideoPipeline(fetchers=2, parse_workers=1, download=_download(calls)) as pipeline:
+        pipeline.get_video(video_id(0))
+        with pytest.raises(VideoFetchError):
+            pipeline.get_video(video_id(99))
+        assert pipeline.prefetch([video_id(0), video_id(99), video_id(1), video_id(2), video_id(1)]) == 2
+        assert pipeline.prefetch([video_id(1)]) == 0
+        assert pipeline.get_video(video_id(1))['title'] == 'Video 1'
+        assert pipeline.get_video(video_id(2))['title'] == 'Video 2'
+    assert sorted(calls) == sorted([video_id(0), video_id(99), video_id(1), video_id(2)])
+    # Asking for a prefetched video is not a cache hit
+    assert pipeline.hits == 0
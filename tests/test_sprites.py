@@ -0,0 +1,106 @@
+import json
+import os
+import random
+import threading
+
+import pytest
+from PIL import Image
+
+import sprites
+
+
+@pytest.fixture
+def sprite_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(sprites, 'SPRITES_DIR', str(tmp_path / 'sprites'))
+    # A distinct colour per video, so tiles can be checked after repacking
+    monkeypatch.setattr(sprites, '_fetch_thumbnail', lambda session, vid: _thumbnail(vid))
+    return tmp_path / 'sprites'
+
+
+def _thumbnail(vid):
+    # Solid colour with noise: fine detail is what repeated JPEG saves wear away
+    rng = random.Random(vid)
+    img = Image.new('RGB', (sprites.TILE_WIDTH, sprites.TILE_HEIGHT), _colour(vid))
+    for _ in range(400):
+        img.putpixel((rng.randrange(sprites.TILE_WIDTH), rng.randrange(sprites.TILE_HEIGHT)), (255, 255, 255))
+    return img
+
+
+def _colour(vid):
+    n = int(vid[1:])
+    return (n * 37 % 256, n * 91 % 256, n * 53 % 256)
+
+
+def _graph(ids):
+    return {'nodes': {vid: {'title': vid} for vid in ids}}
+
+
+def _tile(sprite_dir, sprite_map, vid):
+    sheet, x, y = sprite_map['tiles'][vid]
+    with Image.open(sprite_dir / sprite_map['sheets'][sheet]) as img:
+        return img.convert('RGB').crop((x, y, x + sprites.TILE_WIDTH, y + sprites.TILE_HEIGHT)).tobytes()
+
+
+def _mean(tile):
+    pixels = len(tile) // 3
+    return tuple(sum(tile[c::3]) / pixels for c in range(3))
+
+
+def _error(tile, vid):
+    source = _thumbnail(vid).tobytes()
+    return sum(abs(a - b) for a, b in zip(tile, source)) / len(source)
+
+
+def _close(tile, vid, tolerance=12):
+    # Tiles are told apart by their mean colour (noise lifts it a little)
+    return all(abs(x - y) <= tolerance for x, y in zip(_mean(tile), _mean(_thumbnail(vid).tobytes())))
+
+
+def test_repeated_updates_do_not_degrade_existing_tiles(sprite_dir):
+    ids = [f'v{n}' for n in range(1, 4)]
+    assert sprites.update_graph_sprites('g', _graph(ids)) == 3
+    first = _error(_tile(sprite_dir, sprites.load_sprite_map('g'), 'v1'), 'v1')
+
+    for n in range(4, 30):
+        ids.append(f'v{n}')
+        assert sprites.update_graph_sprites('g', _graph(ids)) == 1
+
+    sprite_map = sprites.load_sprite_map('g')
+    assert sprite_map['version'] == 27
+    # Re-encoded from the lossless copy every time: no further from the source than after the first save
+    # (tiles added below it share JPEG blocks with its bottom edge, so pixels may still move a little)
+    assert _error(_tile(sprite_dir, sprite_map, 'v1'), 'v1') <= first * 1.1
+    assert (sprite_dir / 'g-0.src.png').exists()
+
+
+def test_full_sheets_drop_their_lossless_copy(sprite_dir, monkeypatch):
+    monkeypatch.setattr(sprites, 'COLUMNS', 2)
+    monkeypatch.setattr(sprites, 'ROWS', 2)
+    monkeypatch.setattr(sprites, 'TILES_PER_SHEET', 4)
+    sprites.update_graph_sprites('g', _graph([f'v{n}' for n in range(1, 7)]))
+
+    sprite_map = sprites.load_sprite_map('g')
+    assert sprite_map['sheets'] == ['g-0.jpg', 'g-1.jpg']
+    assert not (sprite_dir / 'g-0.src.png').exists()
+    assert (sprite_dir / 'g-1.src.png').exists()
+    for n in range(1, 7):
+        assert _close(_tile(sprite_dir, sprite_map, f'v{n}'), f'v{n}')
+
+
+def test_concurrent_updates_keep_every_tile(sprite_dir):
+    # Two writers (threads here, worker processes in production) racing on the same map
+    sprites.update_graph_sprites('g', _graph(['v1']))
+    threads = [threading.Thread(target=sprites.update_graph_sprites, args=('g', _graph(['v1', f'v{n}'])))
+               for n in range(2, 10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    sprite_map = sprites.load_sprite_map('g')
+    assert set(sprite_map['tiles']) == {f'v{n}' for n in range(1, 10)}
+    slots = {tuple(tile) for tile in sprite_map['tiles'].values()}
+    assert len(slots) == 9
+    assert not os.path.exists(sprites._map_path('g') + '.lock')
+    with open(sprites._map_path('g'), encoding='utf-8') as f:
+        assert json.load(f) == sprite_map
@@ -0,0 +1,27 @@
+import json
+
+from graph_changes import changes_since
+from graph_store import read_graphs, update_graphs
+from validate_graphs import fix_file, is_clean, validate_file
+
+
+def test_fix_file_is_seen_by_viewers_syncing_changes(graphs_path):
+    graph = {'title': 'Story', 'nodes': {
+        'r': {'title': 'Root', 'clean_description': 'Start', 'outgoing': [{'to': 'a', 'label': ''}], 'incoming_from': []},
+        'a': {'title': 'Left', 'clean_description': 'The end', 'outgoing': [],
+              'incoming_from': [{'from': 'r', 'label': 'Root'}]}
+    }}
+    update_graphs(lambda data: data['graphs'].__setitem__('r', graph), graphs_path)
+    before = json.loads(json.dumps(read_graphs(graphs_path)['graphs']['r']))
+    assert before['version'] == 1
+
+    assert fix_file(graphs_path, workers=2) == 1
+    assert is_clean(validate_file(graphs_path, workers=1))
+
+    after = read_graphs(graphs_path)['graphs']['r']
+    assert after['version'] == 2
+    assert after['nodes']['r']['outgoing'] == [{'to': 'a', 'label': 'Left'}]
+    patch = changes_since(graphs_path, 'r', after, 1)
+    assert patch['changes'] == [
+        {'version': 2, 'ops': [{'op': 'update', 'id': 'r', 'set': {'outgoing': [{'to': 'a', 'label': 'Left'}]}}]}
+    ]
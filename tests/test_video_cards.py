@@ -0,0 +1,71 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+from graph_store import load_graphs, update_graphs
+
+SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'local_app', 'testing-video-cards', 'video-cards-test.py')
+
+
+@pytest.fixture(scope='module')
+def cards():
+    spec = importlib.util.spec_from_file_location('video_cards_test', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def graphs_file(graphs_path):
+    data = {'graphs': {
+        'g1': {'title': 'One', 'nodes': {
+            'a': {'title': 'A', 'outgoing': [{'to': 'b', 'label': 'B'}], 'incoming_from': []},
+            'b': {'title': '', 'description': '', 'card_data': {'x': 1}, 'incoming_from': [{'from': 'a', 'label': 'A'}]}
+        }},
+        'g2': {'title': 'Two', 'nodes': {'b': {'title': '', 'outgoing': [{'to': 'c', 'label': ''}]}}}
+    }}
+    with open(graphs_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    return graphs_path
+
+
+def test_load_graph_info_streams_titles_and_gaps(cards, graphs_file):
+    titles, referenced, missing_cards, first = cards.load_graph_info(graphs_file)
+    assert titles == {'a': 'A', 'b': ''}
+    assert referenced == {'a', 'b', 'c'}
+    assert missing_cards == ['a', 'b']
+    assert first == 'g1'
+
+
+def test_checkpoint_merges_patches_into_current_file(cards, graphs_file, tmp_path):
+    pending = {}
+    edges = cards.EdgeIndex()
+    a = pending[('g1', 'a')] = {'title': 'A'}
+    d = pending[('g1', 'd')] = {'title': ''}
+    edges.add_outgoing('a', a, 'd', 'D')
+    edges.add_outgoing('a', a, 'b', 'B again')
+    edges.add_incoming('d', d, 'a', 'A')
+    d['card_data'] = {'y': 2}
+
+    # Written by someone else after this run started
+    update_graphs(lambda data: data['graphs']['g1']['nodes']['a'].update(note='kept'), graphs_file)
+
+    progress = str(tmp_path / 'progress.json')
+    backfill = {'b': {'title': 'Bee', 'description': 'About b', 'card_data': {'z': 3}}}
+    cards.save_checkpoint(graphs_file, pending, progress, {'a', 'd'}, backfill)
+
+    graphs = load_graphs(graphs_file)['graphs']
+    node_a = graphs['g1']['nodes']['a']
+    assert node_a['note'] == 'kept'
+    assert node_a['outgoing'] == [{'to': 'b', 'label': 'B'}, {'to': 'd', 'label': 'D'}]
+    assert graphs['g1']['nodes']['d'] == {'title': '', 'incoming_from': [{'from': 'a', 'label': 'A'}],
+                                          'card_data': {'y': 2}}
+    # Backfill only fills empty fields, in every graph holding the video
+    assert graphs['g1']['nodes']['b']['title'] == 'Bee'
+    assert graphs['g1']['nodes']['b']['card_data'] == {'x': 1}
+    assert graphs['g2']['nodes']['b']['description'] == 'About b'
+    assert pending == {}
+    with open(progress, encoding='utf-8') as f:
+        assert json.load(f) == {'done': ['a', 'd']}
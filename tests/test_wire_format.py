@@ -0,0 +1,58 @@
+from wire_format import PREVIEW_CHARS, decode_graph, encode_graph, node_detail
+
+GRAPH = {
+    'title': 'Story',
+    'part2_video_id': 'bbbbbbbbbbb',
+    'version': 7,
+    'nodes': {
+        'aaaaaaaaaaa': {
+            'title': 'Start',
+            'thumbnail': 'https://i.ytimg.com/vi/aaaaaaaaaaa/maxresdefault.jpg',
+            'url': 'https://www.youtube.com/watch?v=aaaaaaaaaaa',
+            'description': '<b>raw</b>',
+            'clean_description': 'x' * 100,
+            'card_data': {'lengthSeconds': 512, 'endscreen': []},
+            'choice_1': 'bbbbbbbbbbb',
+            'choice_1_label': 'Go',
+            'outgoing': [{'to': 'bbbbbbbbbbb', 'label': 'Go'}, {'to': 'zzzzzzzzzzz', 'label': 'Elsewhere'}],
+            'incoming_from': []
+        },
+        'bbbbbbbbbbb': {
+            'title': 'Go',
+            'thumbnail': 'https://example.com/other.jpg',
+            'url': 'https://youtu.be/bbbbbbbbbbb',
+            'clean_description': 'The end',
+            'outgoing': [],
+            'incoming_from': [{'from': 'aaaaaaaaaaa', 'label': 'Start'}]
+        }
+    }
+}
+
+
+def test_round_trip_keeps_what_the_viewer_reads():
+    wire = encode_graph(GRAPH)
+    # Edge targets that were never crawled still get an id, after the nodes
+    assert wire['ids'] == ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'zzzzzzzzzzz']
+    assert wire['url'][0] == 0
+    assert wire['strings'][wire['thumb'][0]] == 'maxresdefault.jpg'
+
+    graph = decode_graph(wire)
+    assert {k: graph[k] for k in ('title', 'part2_video_id', 'version')} == {'title': 'Story', 'part2_video_id': 'bbbbbbbbbbb', 'version': 7}
+    for vid, node in GRAPH['nodes'].items():
+        decoded = graph['nodes'][vid]
+        for key in ('title', 'thumbnail', 'url', 'clean_description', 'outgoing', 'incoming_from'):
+            assert decoded[key] == node[key], (vid, key)
+    assert graph['nodes']['aaaaaaaaaaa']['card_data'] == {'lengthSeconds': 512}
+    assert 'card_data' not in graph['nodes']['bbbbbbbbbbb']
+
+
+def test_skeleton_sends_previews_and_details_carry_the_rest():
+    wire = encode_graph(GRAPH, skeleton=True)
+    assert 'desc' not in wire
+    assert wire['preview'][0] == 'x' * PREVIEW_CHARS
+    assert decode_graph(wire)['nodes']['aaaaaaaaaaa']['clean_description'] == 'x' * PREVIEW_CHARS
+
+    detail = node_detail(GRAPH['nodes']['aaaaaaaaaaa'])
+    assert detail['clean_description'] == 'x' * 100
+    assert detail['card_data'] == {'lengthSeconds': 512, 'endscreen': []}
+    assert not {'outgoing', 'incoming_from', 'choice_1', 'choice_1_label'} & detail.keys()
@@ -0,0 +1,136 @@
+import asyncio
+import pickle
+import threading
+import time
+
+import pytest
+
+import youtube_api
+from bench_pipeline import synthetic_page, video_id
+from youtube_api import VideoFetchError, parse_watch_page
+
+
+def test_parses_description_title_and_cards():
+    vid = video_id(5)
+    video = parse_watch_page(vid, synthetic_page(5, 1))
+    assert video['title'] == 'Video 5'
+    assert video['description'].startswith('Episode 5.')
+    assert video['url'] == f'https://www.youtube.com/watch?v={vid}'
+    assert [card['targetId'] for card in video['card_data']['endscreen']] == [video_id(6), video_id(7)]
+
+
+@pytest.mark.parametrize('title', [None, 'A title from oEmbed'])
+def test_page_without_video_data_is_transient(title):
+    # Consent interstitials have a <title> and og tags, but neither ytInitialData nor a player response
+    page = (b'<html><head><title>Before you continue to YouTube</title>'
+            b'<meta property="og:description" content="Sign in"></head><body></body></html>')
+    with pytest.raises(VideoFetchError) as e:
+        parse_watch_page('abcdefghijk', page, title)
+    assert e.value.kind == 'transient'
+
+
+def test_unplayable_video_reports_its_kind():
+    page = (b'<script>var ytInitialPlayerResponse = {"playabilityStatus": '
+            b'{"status": "LOGIN_REQUIRED", "reason": "This video is private"}};</script>')
+    with pytest.raises(VideoFetchError) as e:
+        parse_watch_page('abcdefghijk', page)
+    assert (e.value.kind, e.value.reason) == ('private', 'This video is private')
+
+
+def test_fetch_error_survives_pickling():
+    error = pickle.loads(pickle.dumps(VideoFetchError('abcdefghijk', 'throttled', '429')))
+    assert (error.video_id, error.kind, error.reason) == ('abcdefghijk', 'throttled', '429')
+
+
+class _BlockingDownload:
+    """download_video stand-in that holds every fetch until release() and counts them."""
+
+    def __init__(self, n=3, error=None):
+        self.n = n
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, vid, session=None):
+        self.calls += 1
+        self.started.set()
+        assert self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return {'title': None, 'page': synthetic_page(self.n, 1), 'encoding': 'utf-8'}
+
+    def release(self):
+        # Give the other callers time to join the fetch that is already running
+        assert self.started.wait(5)
+        time.sleep(0.2)
+        self.gate.set()
+
+
+def _call_concurrently(fn, count):
+    results = [None] * count
+
+    def call(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_callers_share_one_fetch(monkeypatch):
+    download = _BlockingDownload()
+    monkeypatch.setattr(youtube_api, 'download_video', download)
+
+    threads, results = _call_concurrently(lambda: youtube_api.get_video(video_id(3)), 8)
+    download.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert download.calls == 1
+    assert all(result['title'] == 'Video 3' for result in results)
+    assert not youtube_api._inflight
+
+
+def test_failure_reaches_every_caller_and_is_not_cached(monkeypatch):
+    download = _BlockingDownload(error=VideoFetchError(video_id(3), 'throttled', 'HTTP 429'))
+    monkeypatch.setattr(youtube_api, 'download_video', download)
+
+    threads, results = _call_concurrently(lambda: youtube_api.get_video(video_id(3)), 8)
+    download.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert download.calls == 1
+    assert all(isinstance(result, VideoFetchError) and result.kind == 'throttled' for result in results)
+    assert not youtube_api._inflight
+
+    # The failed key is gone, so the next call fetches again
+    download.error = None
+    assert youtube_api.get_video(video_id(3))['title'] == 'Video 3'
+    assert download.calls == 2
+
+
+def test_cancelled_async_caller_leaves_the_fetch_running(monkeypatch):
+    download = _BlockingDownload()
+    monkeypatch.setattr(youtube_api, 'download_video', download)
+
+    async def main():
+        tasks = [asyncio.ensure_future(youtube_api.get_video_async(video_id(3))) for _ in range(4)]
+        await asyncio.get_running_loop().run_in_executor(None, download.started.wait, 5)
+        await asyncio.sleep(0.1)
+        # The first caller gave up; the fetch it started must still finish for the others
+        tasks[0].cancel()
+        await asyncio.sleep(0.1)
+        download.gate.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert all(result['title'] == 'Video 3' for result in results[1:])
+    assert download.calls == 1
+    assert not youtube_api._inflight
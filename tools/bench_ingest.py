@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark ingest.ingest() end to end on synthetic stories.
+
+    python tools/bench_ingest.py [--stories N] [--videos N] [--fetches 1,4,16] [--workers N] [--latency SECONDS] [--kb N]
+
+Each story is --videos generated watch pages (see bench_pipeline.py) in
+which video n links to n+1 and n+2, so a crawl from the first one reaches
+them all and about two pages per story can be fetched at once; the links
+past a story's last video are dead. The download stage sleeps --latency
+seconds per page instead of going to the network, and counts how many
+downloads are in flight; ingest's politeness delay (FETCH_DELAY) is left
+out. Every run starts from an empty state.db and graphs.json in a temporary
+directory, and ingest() is run once per --fetches value with --workers
+parse processes. Throughput, the peak number of concurrent downloads and
+the speedup over the first run are printed as JSON.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'local_app', 'backend'))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import ingest
+import state_store
+from bench_pipeline import synthetic_page, video_id
+from youtube_api import VideoFetchError
+
+
+def build_stories(stories, videos, kb):
+    pages, specs = {}, []
+    for s in range(stories):
+        # A gap of two ids, so the last videos' links lead nowhere rather than into the next story
+        first = s * (videos + 2)
+        for n in range(first, first + videos):
+            pages[video_id(n)] = synthetic_page(n, kb)
+        specs.append(ingest.parse_story({'url': f'https://youtu.be/{video_id(first)}', 'max_nodes': videos}))
+    return pages, specs
+
+
+def run(pages, specs, fetches, workers, latency, tmp):
+    in_flight = peak = 0
+    lock = threading.Lock()
+
+    def download(vid):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        try:
+            time.sleep(latency)
+            if vid not in pages:
+                # Links past the end of a story
+                raise VideoFetchError(vid, 'removed', 'not part of the benchmark')
+            return {'title': None, 'page': pages[vid], 'encoding': 'utf-8'}
+        finally:
+            with lock:
+                in_flight -= 1
+
+    # A cold store and an empty file for every run
+    state_store.STATE_PATH = os.path.join(tmp, f'state-{fetches}.db')
+    path = os.path.join(tmp, f'graphs-{fetches}.json')
+    start = time.perf_counter()
+    summary = ingest.ingest(specs, path, max_stories=len(specs), max_fetches=fetches, parse_workers=workers,
+                            download=download)
+    elapsed = time.perf_counter() - start
+    nodes = sum(r['nodes'] for r in summary['stories'].values())
+    return {
+        'fetches': fetches,
+        'nodes': nodes,
+        'seconds': round(elapsed, 3),
+        'nodes_per_second': round(nodes / elapsed, 1),
+        'peak_in_flight': peak
+    }
+
+
+def main(argv):
+    stories, videos, fetches, workers, latency, kb = 2, 60, [1, 4, 16], 1, 0.05, 50
+    i = 0
+    while i < len(argv):
+        if argv[i] in ('--stories', '--videos', '--fetches', '--workers', '--latency', '--kb') and i + 1 < len(argv):
+            value = argv[i + 1]
+            if argv[i] == '--stories':
+                stories = int(value)
+            elif argv[i] == '--videos':
+                videos = int(value)
+            elif argv[i] == '--fetches':
+                fetches = [int(n) for n in value.split(',')]
+            elif argv[i] == '--workers':
+                workers = int(value)
+            elif argv[i] == '--latency':
+                latency = float(value)
+            else:
+                kb = int(value)
+            i += 2
+            continue
+        print(__doc__.strip())
+        return 2
+
+    pages, specs = build_stories(stories, videos, kb)
+    ingest.FETCH_DELAY = 0
+    print(json.dumps({'stories': stories, 'videos': len(pages), 'workers': workers, 'latency': latency}))
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        state_store.DATA_DIR = tmp
+        for n in fetches:
+            result = run(pages, specs, n, workers, latency, tmp)
+            baseline = baseline or result['nodes_per_second']
+            result['speedup'] = round(result['nodes_per_second'] / baseline, 2)
+            print(json.dumps(result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark the fetch -> parse -> enrich pipeline on synthetic watch pages.
+
+    python tools/bench_pipeline.py [--videos N] [--workers 1,2,4] [--fetchers N] [--latency SECONDS] [--kb N]
+
+Each video is a generated watch page of about --kb KB (a ytInitialData blob
+with a linked description, and a player response with endscreen cards) that
+the fetch stage "downloads" by sleeping --latency seconds. Nothing touches
+the network or state.db. The videos are pushed through a
+pipeline.VideoPipeline once per --workers value (default 1, 2, 4, ... up to
+the core count; 1 parses in this process) and the throughput of each run is
+printed as JSON, with its speedup over the first.
+"""
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'local_app', 'backend'))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from pipeline import VideoPipeline
+
+ID_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_'
+
+
+def video_id(n):
+    # 11 characters, like a real id
+    chars = []
+    for _ in range(11):
+        n, r = divmod(n, len(ID_CHARS))
+        chars.append(ID_CHARS[r])
+    return ''.join(chars)
+
+
+def synthetic_page(n, kb):
+    """A watch page for video n linking to videos n+1 and n+2, padded to about `kb` KB"""
+    vid = video_id(n)
+    choices = [(video_id(n + 1), 'Go left'), (video_id(n + 2), 'Go right')]
+    text = f'Episode {n}. What do you do?\n'
+    runs = []
+    for target, label in choices:
+        runs.append({
+            'startIndex': len(text),
+            'length': len(label),
+            'onTap': {'innertubeCommand': {'commandMetadata': {'webCommandMetadata': {'url': f'/watch?v={target}'}}}}
+        })
+        text += label + '\n'
+    # Real ytInitialData is mostly recommendations; they make up the bulk of the parse work
+    filler = [{'compactVideoRenderer': {'videoId': video_id(n * 1000 + i), 'title': {'simpleText': f'Related video {i} &amp; more'},
+                                        'viewCountText': {'simpleText': f'{i * 7919} views'}, 'badges': []}}
+              for i in range(kb * 1024 // 180)]
+    initial_data = {
+        'contents': {'twoColumnWatchNextResults': {
+            'results': {'results': {'contents': [
+                {'videoPrimaryInfoRenderer': {'title': {'runs': [{'text': f'Video {n}'}]}}},
+                {'videoSecondaryInfoRenderer': {'attributedDescription': {'content': text, 'commandRuns': runs}}}
+            ]}},
+            'secondaryResults': {'secondaryResults': {'results': filler}}
+        }}
+    }
+    player_response = {
+        'playabilityStatus': {'status': 'OK'},
+        'videoDetails': {'videoId': vid, 'title': f'Video {n}', 'lengthSeconds': str(60 + n % 300), 'shortDescription': text},
+        'endscreen': {'endscreenRenderer': {'elements': [
+            {'endscreenElementRenderer': {'style': 'VIDEO', 'startMs': '50000', 'endMs': '60000', 'left': 0.1 * i,
+                                          'top': 0.2, 'width': 0.3, 'aspectRatio': 1.77,
+                                          'endpoint': {'watchEndpoint': {'videoId': target}}}}
+            for i, (target, _) in enumerate(choices)
+        ]}}
+    }
+    page = (f'<html><head><title>Video {n} - YouTube</title>'
+            f'<meta property="og:description" content="Episode {n}"></head><body>'
+            f'<script>var ytInitialPlayerResponse = {json.dumps(player_response)};</script>'
+            f'<script>var ytInitialData = {json.dumps(initial_data)};</script></body></html>')
+    return page.encode('utf-8')
+
+
+def run(pages, workers, fetchers, latency):
+    def download(vid):
+        time.sleep(latency)
+        return {'title': None, 'page': pages[vid], 'encoding': 'utf-8'}
+
+    def enrich(vid, video, error):
+        if error is not None:
+            raise error
+        return video
+
+    with VideoPipeline(fetchers=fetchers, parse_workers=workers, queue_size=2 * fetchers,
+                       download=download, enrich=enrich) as pipeline:
+        # Worker start-up is not part of the measurement
+        pipeline.submit(next(iter(pages))).result()
+        start = time.perf_counter()
+        futures = [pipeline.submit(vid) for vid in pages]
+        linked = sum(len(future.result()['links']) for future in futures)
+        elapsed = time.perf_counter() - start
+    return {
+        'workers': workers,
+        'videos': len(pages) - 1,
+        'seconds': round(elapsed, 3),
+        'videos_per_second': round((len(pages) - 1) / elapsed, 1),
+        'links': linked
+    }
+
+
+def main(argv):
+    videos, fetchers, latency, kb = 200, 16, 0.02, 300
+    cores = os.cpu_count() or 1
+    workers = [1] + [n for n in (2, 4, 8, 16, 32) if n < cores] + ([cores] if cores > 1 else [])
+    i = 0
+    while i < len(argv):
+        if argv[i] in ('--videos', '--workers', '--fetchers', '--latency', '--kb') and i + 1 < len(argv):
+            value = argv[i + 1]
+            if argv[i] == '--videos':
+                videos = int(value)
+            elif argv[i] == '--workers':
+                workers = [int(n) for n in value.split(',')]
+            elif argv[i] == '--fetchers':
+                fetchers = int(value)
+            elif argv[i] == '--latency':
+                latency = float(value)
+            else:
+                kb = int(value)
+            i += 2
+            continue
+        print(__doc__.strip())
+        return 2
+
+    # One extra page warms up each run
+    pages = {video_id(n): synthetic_page(n, kb) for n in range(videos + 1)}
+    print(json.dumps({'cores': cores, 'page_bytes': len(next(iter(pages.values()))),
+                      'fetchers': fetchers, 'latency': latency}))
+    baseline = None
+    for n in workers:
+        result = run(pages, n, fetchers, latency)
+        baseline = baseline or result['videos_per_second']
+        result['speedup'] = round(result['videos_per_second'] / baseline, 2)
+        print(json.dumps(result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Export graphs for the static viewer in docs/.
+
+    python tools/export_docs.py [source] [--out DIR] [--force]
+
+`source` defaults to local_app/backend/data/graphs.json and --out to docs/.
+Each graph is written minified to data/<graph_id>.<hash>.json with only the
+fields docs/graph.js reads, and data/manifest.json lists them. A graph is
+only rebuilt when its source changed since the last export (the manifest
+keeps a hash of every source graph), and files no longer listed are deleted.
+Content-hashed names mean GitHub Pages can cache graph files indefinitely;
+only the small manifest has to be revalidated.
+"""
+import hashlib
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'local_app', 'backend'))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from graph_stream import iter_graphs
+
+DEFAULT_SOURCE = os.path.join(BACKEND_DIR, 'data', 'graphs.json')
+DEFAULT_OUT = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'docs'))
+DATA_SUBDIR = 'data'
+MANIFEST_NAME = 'manifest.json'
+
+# What docs/graph.js actually reads; everything else (description, choice_N,
+# card metadata, incoming labels, ...) is dropped from the export
+GRAPH_FIELDS = ['title', 'part2_video_id', 'stop_video_ids', 'trailer_video_id', 'bonus_video_ids']
+NODE_FIELDS = ['title', 'thumbnail', 'url']
+
+
+def slim_node(node):
+    out = {k: node[k] for k in NODE_FIELDS if k in node}
+    if node.get('clean_description'):
+        out['clean_description'] = node['clean_description']
+    if node.get('outgoing'):
+        out['outgoing'] = [{'to': o.get('to'), 'label': o.get('label', '')} for o in node['outgoing']]
+    if node.get('incoming_from'):
+        # The viewer only follows incoming edges; their labels are never shown
+        out['incoming_from'] = [{'from': inc.get('from')} for inc in node['incoming_from']]
+    length = (node.get('card_data') or {}).get('lengthSeconds')
+    if length is not None:
+        out['card_data'] = {'lengthSeconds': length}
+    return out
+
+
+def slim_graph(graph):
+    out = {k: graph[k] for k in GRAPH_FIELDS if graph.get(k) not in (None, [], '')}
+    out['nodes'] = {node_id: slim_node(node) for node_id, node in (graph.get('nodes') or {}).items()}
+    return out
+
+
+def _minify(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def source_hash(graph):
+    return hashlib.sha256(json.dumps(graph, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _write(path, content):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, DATA_SUBDIR, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'graphs': []}
+
+
+def export(source, out_dir=DEFAULT_OUT, force=False):
+    """Export `source` into out_dir/data. Returns counts of rebuilt, unchanged and removed graphs."""
+    data_dir = os.path.join(out_dir, DATA_SUBDIR)
+    os.makedirs(data_dir, exist_ok=True)
+    previous = {entry['id']: entry for entry in load_manifest(out_dir).get('graphs', [])}
+
+    entries = []
+    rebuilt = unchanged = 0
+    for graph_id, graph in iter_graphs(source):
+        src_hash = source_hash(graph)
+        old = previous.get(graph_id)
+        if (not force and old and old.get('source_hash') == src_hash
+                and os.path.exists(os.path.join(out_dir, old['file']))):
+            entries.append(old)
+            unchanged += 1
+            continue
+
+        body = _minify(slim_graph(graph))
+        name = f'{graph_id}.{hashlib.sha256(body).hexdigest()[:12]}.json'
+        _write(os.path.join(data_dir, name), body)
+        entries.append({
+            'id': graph_id,
+            'title': graph.get('title') or graph_id,
+            'file': f'{DATA_SUBDIR}/{name}',
+            'nodes': len(graph.get('nodes') or {}),
+            'bytes': len(body),
+            'source_hash': src_hash
+        })
+        rebuilt += 1
+
+    manifest = {'graphs': entries}
+    _write(os.path.join(data_dir, MANIFEST_NAME), json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    # Drop files of graphs that were rebuilt or no longer exist
+    keep = {os.path.basename(entry['file']) for entry in entries} | {MANIFEST_NAME}
+    removed = 0
+    for name in os.listdir(data_dir):
+        if name.endswith('.json') and name not in keep:
+            os.remove(os.path.join(data_dir, name))
+            removed += 1
+
+    return {'rebuilt': rebuilt, 'unchanged': unchanged, 'removed_files': removed}
+
+
+def main(argv):
+    force = '--force' in argv
+    out_dir = DEFAULT_OUT
+    args = []
+    i = 0
+    while i < len(argv):
+        if argv[i] == '--out' and i + 1 < len(argv):
+            out_dir = argv[i + 1]
+            i += 2
+            continue
+        if not argv[i].startswith('--'):
+            args.append(argv[i])
+        i += 1
+
+    source = args[0] if args else DEFAULT_SOURCE
+    if not os.path.exists(source):
+        print(json.dumps({'error': f'file not found: {source}'}))
+        return 2
+
+    print(json.dumps(export(source, out_dir, force=force)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
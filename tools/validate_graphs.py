@@ -1,30 +1,57 @@
 #!/usr/bin/env python3
+"""
+Validate the edge structure of a graphs.json file and optionally repair it.
+
+    python tools/validate_graphs.py [path] [--fix] [--workers N]
+
+`path` defaults to docs/graphs.json. With --fix, `incoming_from` is rebuilt
+from `outgoing`, empty labels and missing `clean_description` are filled in,
+and the file is rewritten before validating. The file is streamed one graph
+at a time, so memory does not grow with the number of stories.
+
+The checks can also be used as a library, e.g. after writing a file:
+
+    from validate_graphs import validate_graphs, validate_file, is_clean
+    report = validate_graphs(data)        # already-loaded dict
+    report = validate_file(path)          # streamed from disk
+"""
 import json
 import os
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'local_app', 'backend'))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from yt_parser import clean_description
+from graph_stream import iter_graphs, transform_graphs
+
+ISSUE_KEYS = [
+    'missing_outgoing_targets',
+    'outgoing_not_in_incoming',
+    'incoming_from_missing',
+    'empty_outgoing_labels',
+    'empty_incoming_labels',
+    'description_no_clean',
+]
+
 
-p = os.path.join(os.getcwd(), 'docs', 'graphs.json')
-if not os.path.exists(p):
-    print(json.dumps({'error': f'file not found: {p}'}))
-    sys.exit(2)
-
-with open(p, 'r', encoding='utf-8') as f:
-    data = json.load(f)
-
-report = {
-    'graphs_examined': 0,
-    'missing_outgoing_targets': [],
-    'outgoing_not_in_incoming': [],
-    'incoming_from_missing': [],
-    'empty_outgoing_labels': [],
-    'empty_incoming_labels': [],
-    'description_no_clean': [],
-}
-
-for graph_id, graph in data.items():
-    report['graphs_examined'] += 1
+def _empty_label(label):
+    return not isinstance(label, str) or label.strip() == ''
+
+
+def validate_graph(graph_id, graph):
+    """Check one graph. Returns a report with one list per entry in ISSUE_KEYS."""
+    report = {k: [] for k in ISSUE_KEYS}
     nodes = graph.get('nodes') or {}
-    node_ids = set(nodes.keys())
+
+    # Reverse index built once: node id -> ids it lists in incoming_from
+    incoming_index = {}
+    for node_id, node in nodes.items():
+        incoming_index[node_id] = {inc.get('from') for inc in node.get('incoming_from', []) if isinstance(inc, dict)}
+
     for node_id, node in nodes.items():
         # outgoing checks
         for out in node.get('outgoing', []):
@@ -33,19 +60,11 @@ for graph_id, graph in data.items():
             if to is None:
                 report['missing_outgoing_targets'].append({'graph': graph_id, 'from': node_id, 'edge': out})
                 continue
-            if to not in node_ids:
+            if to not in nodes:
                 report['missing_outgoing_targets'].append({'graph': graph_id, 'from': node_id, 'to': to})
-            else:
-                target_node = nodes[to]
-                incoming = target_node.get('incoming_from', [])
-                found = any(inc.get('from') == node_id for inc in incoming if isinstance(inc, dict))
-                if not found:
-                    report['outgoing_not_in_incoming'].append({'graph': graph_id, 'from': node_id, 'to': to})
-            # label checks
-            if isinstance(label, str):
-                if label.strip() == '':
-                    report['empty_outgoing_labels'].append({'graph': graph_id, 'from': node_id, 'to': to, 'label': label})
-            else:
+            elif node_id not in incoming_index[to]:
+                report['outgoing_not_in_incoming'].append({'graph': graph_id, 'from': node_id, 'to': to})
+            if _empty_label(label):
                 report['empty_outgoing_labels'].append({'graph': graph_id, 'from': node_id, 'to': to, 'label': label})
         # incoming checks that reference missing sources
         for inc in node.get('incoming_from', []):
@@ -54,18 +73,166 @@ for graph_id, graph in data.items():
                 continue
             frm = inc.get('from')
             label = inc.get('label')
-            if frm not in node_ids:
+            if frm not in nodes:
                 report['incoming_from_missing'].append({'graph': graph_id, 'to': node_id, 'from': frm})
-            if isinstance(label, str) and label.strip() == '':
-                report['empty_incoming_labels'].append({'graph': graph_id, 'to': node_id, 'from': frm, 'label': label})
-            elif not isinstance(label, str):
+            if _empty_label(label):
                 report['empty_incoming_labels'].append({'graph': graph_id, 'to': node_id, 'from': frm, 'label': label})
         # description / clean_description
         if node.get('description') and not node.get('clean_description'):
             report['description_no_clean'].append({'graph': graph_id, 'node': node_id})
 
-# counts
-for k in ['missing_outgoing_targets','outgoing_not_in_incoming','incoming_from_missing','empty_outgoing_labels','empty_incoming_labels','description_no_clean']:
-    report[k + '_count'] = len(report[k])
+    return report
+
+
+def fix_graph(graph):
+    """Repair a graph in place from its `outgoing` edges, in one pass.
+
+    `incoming_from` is rebuilt from `outgoing`, empty edge labels are filled
+    with the other end's title and missing `clean_description` is generated.
+    Labels and descriptions that are already set are kept, since many were
+    edited by hand. Returns the number of nodes that changed.
+    """
+    nodes = graph.get('nodes') or {}
+    titles = {node_id: node.get('title') or '' for node_id, node in nodes.items()}
+    before = {node_id: dict(node) for node_id, node in nodes.items()}
+
+    # Existing incoming labels, so rebuilt entries keep hand-written text
+    old_incoming = {}
+    incoming = {}
+    for node_id, node in nodes.items():
+        incoming[node_id] = []
+        for inc in node.get('incoming_from', []):
+            if isinstance(inc, dict) and not _empty_label(inc.get('label')):
+                old_incoming[(inc.get('from'), node_id)] = inc['label']
+
+    for node_id, node in nodes.items():
+        outgoing = []
+        for out in node.get('outgoing', []):
+            to = out.get('to') if isinstance(out, dict) else None
+            if not to:
+                continue
+            label = out.get('label')
+            if _empty_label(label):
+                label = titles.get(to) or f'Video {to}'
+            outgoing.append({'to': to, 'label': label})
+            if to in incoming:
+                label = old_incoming.get((node_id, to)) or titles[node_id] or f'Video {node_id}'
+                incoming[to].append({'from': node_id, 'label': label})
+        node['outgoing'] = outgoing
+
+    for node_id, node in nodes.items():
+        node['incoming_from'] = incoming[node_id]
+        if node.get('description') and not node.get('clean_description'):
+            labels = [out['label'] for out in node['outgoing']]
+            node['clean_description'] = clean_description(node['description'], labels)
+
+    return sum(1 for node_id, node in nodes.items() if node != before[node_id])
+
+
+def _validate_item(item):
+    return validate_graph(*item)
+
+
+def _fix_item(item):
+    graph_id, graph = item
+    fixed = fix_graph(graph)
+    return graph_id, graph, fixed
+
+
+def _fix_in_place(graph_id, graph):
+    return fix_graph(graph)
+
+
+def _imap(fn, items, workers):
+    """Ordered map over `items` in a process pool, with a bounded number in flight."""
+    if workers == 1:
+        for item in items:
+            yield fn(item)
+        return
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            while len(pending) > max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _collect(graph_reports):
+    report = {'graphs_examined': 0}
+    report.update({k: [] for k in ISSUE_KEYS})
+    for graph_report in graph_reports:
+        report['graphs_examined'] += 1
+        for k in ISSUE_KEYS:
+            report[k].extend(graph_report[k])
+
+    # counts
+    for k in ISSUE_KEYS:
+        report[k + '_count'] = len(report[k])
+    return report
+
+
+def validate_graphs(data, workers=None):
+    """Validate every graph in `data['graphs']`, in parallel across cores."""
+    graphs = data.get('graphs') or {}
+    return _collect(_imap(_validate_item, graphs.items(), workers))
+
+
+def validate_file(path, workers=None):
+    """Validate a graphs.json file, reading it one graph at a time."""
+    return _collect(_imap(_validate_item, iter_graphs(path), workers))
+
+
+def fix_graphs(data, workers=None):
+    """Repair every graph in `data['graphs']`. Returns the number of nodes that changed."""
+    graphs = data.get('graphs') or {}
+    total = 0
+    for graph_id, graph, fixed in _imap(_fix_item, list(graphs.items()), workers):
+        graphs[graph_id] = graph
+        total += fixed
+    return total
+
+
+def fix_file(path, workers=None):
+    """Repair a graphs.json file in place, one graph at a time. Returns the number of nodes that changed."""
+    fixed = []
+    transform_graphs(path, _fix_in_place, workers=workers, on_graph=lambda graph_id, n: fixed.append(n))
+    return sum(fixed)
+
+
+def is_clean(report):
+    return all(report[k + '_count'] == 0 for k in ISSUE_KEYS)
+
+
+def main(argv):
+    fix = '--fix' in argv
+    workers = None
+    args = []
+    i = 0
+    while i < len(argv):
+        if argv[i] == '--workers' and i + 1 < len(argv):
+            workers = int(argv[i + 1])
+            i += 2
+            continue
+        if not argv[i].startswith('--'):
+            args.append(argv[i])
+        i += 1
+
+    p = args[0] if args else os.path.join(os.getcwd(), 'docs', 'graphs.json')
+    if not os.path.exists(p):
+        print(json.dumps({'error': f'file not found: {p}'}))
+        return 2
+
+    fixed = fix_file(p, workers) if fix else None
+
+    report = validate_file(p, workers)
+    if fixed is not None:
+        report['fixed_nodes'] = fixed
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
 
-print(json.dumps(report, ensure_ascii=False, indent=2))
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))